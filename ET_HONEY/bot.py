@@ -4,7 +4,7 @@ from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, Response
 import uvicorn
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove, BotCommand
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove, BotCommand, InputMediaPhoto, InputMediaDocument
 from telegram.ext import (
     ApplicationBuilder,
     ContextTypes,
@@ -15,19 +15,41 @@ from telegram.ext import (
     ConversationHandler,
     Application
 )
+from telegram.error import RetryAfter
 
 # Global application instance for FastAPI
 application = None
+# Queue + workers that process webhook updates after the request has been acknowledged
+update_pool = None
+# Separate Bot (own connection pool) for broadcasts, so they never hold up interactive replies
+bulk_bot = None
 from . import database
-from .languages import get_text
+from .update_queue import UpdateWorkerPool, PerChatUpdateProcessor, RecentUpdateIds
+from .persistence import SQLitePersistence
+from .profiling import UpdateProfiler
+from .tracing import UpdateTracer, traced
+from .log_config import setup_logging
+from .request import build_request, FAST_JSON, loads, BOT_API_BASE_URL, BOT_API_BASE_FILE_URL
+from .bot_setup import apply_bot_setting
+from . import metrics
+from . import perf
+from . import query_log
+from .languages import get_text, TRANS
 import re
 import uuid
 import io
+import csv
+import json
+import asyncio
+import time
 from datetime import datetime
 
 # Allowed file extensions for uploads
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.pdf', '.doc', '.docx', '.txt'}
 
+# Telegram limit for photo/document captions
+CAPTION_LIMIT = 1024
+
 # Regex Patterns for Menu Buttons
 REGISTER_PATTERN = r'^(🧍 Register|🧍 ይመዝገቡ)$'
 PROFILE_PATTERN = r'^(👤 Profile|👤 መገለጫ)$'
@@ -69,11 +91,8 @@ from pathlib import Path
 env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
-# Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Enable logging (formatting and output run on a background thread)
+setup_logging()
 
 # Initialize Database
 database.init_db()
@@ -84,6 +103,15 @@ FULL_NAME, PHONE, EMAIL, REGION, CUSTOMER_TYPE, CONFIRMATION = range(6)
 # States for Support Conversation
 WAITING_FOR_SUPPORT_MESSAGE = 10
 
+# Support messages to an open ticket are batched into one admin digest per burst
+SUPPORT_DIGEST_SECONDS = int(os.getenv("SUPPORT_DIGEST_SECONDS", 10))  # 0 disables batching
+SUPPORT_DIGEST_MAX_SECONDS = int(os.getenv("SUPPORT_DIGEST_MAX_SECONDS", 60))
+SUPPORT_DIGEST_MAX_CHARS = 3500  # Leaves room for the header within Telegram's 4096 limit
+
+# Optional forum supergroup used as the support inbox (one topic per ticket).
+# When unset, support traffic is sent to every admin's private chat.
+SUPPORT_GROUP_ID = os.getenv("SUPPORT_GROUP_ID")
+
 # States for Order Conversation
 PRODUCT_NAME, QUANTITY, DELIVERY_ADDRESS, PAYMENT_TYPE, CONFIRM_ORDER = range(20, 25)
 
@@ -109,11 +137,43 @@ ADD_PRODUCT_NAME, ADD_PRODUCT_DESC, ADD_PRODUCT_PRICE, ADD_PRODUCT_STOCK, ADD_PR
 EDIT_PRODUCT_SELECT, EDIT_PRODUCT_FIELD, EDIT_PRODUCT_NAME, EDIT_PRODUCT_DESC, EDIT_PRODUCT_PRICE, EDIT_PRODUCT_STOCK, EDIT_PRODUCT_IMAGE = range(87, 94)
 
 # Broadcast States
-BROADCAST_MESSAGE, BROADCAST_CONFIRM = range(100, 102)
+BROADCAST_MESSAGE, BROADCAST_CONFIRM, BROADCAST_VARIANT, BROADCAST_SCHEDULE = range(100, 104)
+
+# Broadcast delivery runs on the JobQueue: every tick sends one batch, sized so
+# a broadcast is spread over the window, and no batches are sent in quiet hours.
+BROADCAST_TICK_SECONDS = int(os.getenv("BROADCAST_TICK_SECONDS", 30))
+BROADCAST_WINDOW_MINUTES = int(os.getenv("BROADCAST_WINDOW_MINUTES", 10))
+BROADCAST_QUIET_HOURS = os.getenv("BROADCAST_QUIET_HOURS", "")  # e.g. "22-7" (server time)
+# Sends within a batch are paced under Telegram's ~30 messages/second, and a
+# 429 is waited out and retried for the same user instead of skipping them.
+BROADCAST_MAX_PER_SECOND = float(os.getenv("BROADCAST_MAX_PER_SECOND", 25))
+BROADCAST_MAX_RETRIES = 3
+_broadcast_lock = asyncio.Lock()
+
+# Multi-process mode (see multiworker.py): each worker process handles a fixed share
+# of the chats. Bot setup and the broadcast job only run on worker 0.
+WORKER_INDEX = int(os.getenv("BOT_WORKER_INDEX", 0))
+WORKER_COUNT = int(os.getenv("BOT_WORKER_COUNT", 1))
+
+# Every process records how far its cache has read change_log and prunes the rows all of them have read
+CHANGE_LOG_PRUNE_SECONDS = int(os.getenv("CHANGE_LOG_PRUNE_SECONDS", 300))
+
+async def prune_change_log(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        deleted = await database.prune_change_log_async(reader_timeout=CHANGE_LOG_PRUNE_SECONDS * 10)
+        logging.debug("Pruned %d change_log rows", deleted)
+    except Exception as e:
+        logging.error("Could not prune change_log: %s", e)
 
 async def post_init(application: Application):
     """Called after the application is initialized."""
     database.init_db()
+    if application.job_queue and CHANGE_LOG_PRUNE_SECONDS > 0:
+        application.job_queue.run_repeating(prune_change_log, interval=CHANGE_LOG_PRUNE_SECONDS,
+                                            first=CHANGE_LOG_PRUNE_SECONDS, name='prune_change_log')
+    if WORKER_INDEX != 0:
+        return
+    await bulk_bot.initialize()
     
     # Set bot description (shows before user starts the bot)
     bot_description = (
@@ -135,16 +195,32 @@ async def post_init(application: Application):
         "🍯 Premium Ethiopian Honey Trading Bot - Order pure honey with fast delivery!"
     )
     
+    # Each call is skipped when the same value was already sent on a previous start
+    bot = application.bot
     try:
-        await application.bot.set_my_description(description=bot_description)
-        await application.bot.set_my_short_description(short_description=bot_short_description)
-        logging.info("Bot description set successfully")
+        if await apply_bot_setting(bot, 'description', bot_description,
+                                   lambda: bot.set_my_description(description=bot_description)):
+            logging.info("Bot description set successfully")
+        await apply_bot_setting(bot, 'short_description', bot_short_description,
+                                lambda: bot.set_my_short_description(short_description=bot_short_description))
     except Exception as e:
         logging.error(f"Failed to set bot description: {e}")
     commands = [
         BotCommand("start", "Open Main Menu"),
     ]
-    await application.bot.set_my_commands(commands)
+    await apply_bot_setting(bot, 'commands', [command.to_dict() for command in commands],
+                            lambda: bot.set_my_commands(commands))
+
+    # Deliver scheduled broadcasts; pending ones are picked up again after a restart
+    if application.job_queue:
+        application.job_queue.run_repeating(broadcast_tick, interval=BROADCAST_TICK_SECONDS, first=BROADCAST_TICK_SECONDS, name='broadcast_tick')
+        rearm_support_digests(application.job_queue)
+    else:
+        logging.warning("JobQueue not available (install python-telegram-bot[job-queue]); broadcasts will not be delivered.")
+
+async def post_shutdown(application: Application):
+    """Called after the application is shut down."""
+    await bulk_bot.shutdown()
 
 async def admin_dashboard_overview(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Displays an overview of the bot's statistics for admins."""
@@ -340,7 +416,7 @@ async def admin_view_ticket(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if "Message is not modified" in str(e):
             pass
         else:
-            logging.error(f"Error updating ticket view: {e}")
+            logging.error("Error updating ticket view: %s", e)
 
 async def admin_reply_to_ticket_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Starts the admin reply conversation."""
@@ -378,10 +454,10 @@ async def admin_receive_reply(update: Update, context: ContextTypes.DEFAULT_TYPE
         return ConversationHandler.END
 
     # Save message to DB
-    database.add_message(ticket_id, 'admin', text)
+    await database.add_message_async(ticket_id, 'admin', text)
     
     # Update ticket status if needed
-    database.update_ticket_status(ticket_id, 'Open') 
+    await database.update_ticket_status_async(ticket_id, 'Open') 
     
     # Notify User
     ticket = database.get_ticket(ticket_id)
@@ -408,6 +484,13 @@ async def admin_resolve_ticket_callback(update: Update, context: ContextTypes.DE
     
     ticket_id = int(query.data.split(':')[1])
     database.close_ticket(ticket_id)
+
+    ticket = database.get_ticket(ticket_id)
+    if SUPPORT_GROUP_ID and ticket and ticket['topic_id']:
+        try:
+            await context.bot.close_forum_topic(chat_id=SUPPORT_GROUP_ID, message_thread_id=ticket['topic_id'])
+        except Exception as e:
+            logging.error("Failed to close support topic for ticket %s: %s", ticket_id, e)
     
     await query.message.reply_text(f"✅ Ticket #{ticket_id} has been resolved/closed.")
     # Refresh view
@@ -471,10 +554,10 @@ async def admin_process_order_callback(update: Update, context: ContextTypes.DEF
             try:
                 await context.bot.send_message(chat_id=user_id, text=message_text, parse_mode='Markdown')
             except Exception as e:
-                logging.error(f"Failed to notify user {user_id} about order {order_id}: {e}")
+                logging.error("Failed to notify user %s about order %s: %s", user_id, order_id, e)
                     
     except Exception as e:
-        logging.error(f"Error in admin_process_order_callback: {e}")
+        logging.error("Error in admin_process_order_callback: %s", e)
         await query.message.reply_text(f"❌ Error processing order action: {e}")
 
 async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -499,26 +582,144 @@ async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         await update.callback_query.message.reply_text("Welcome to the Admin Dashboard! Please choose an option:", reply_markup=reply_markup)
 
 async def admin_broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data['broadcast_variants'] = {}
+    context.user_data['broadcast_media'] = []
+    context.user_data.pop('broadcast_media_group', None)
+    context.user_data.pop('broadcast_default_lang', None)
+    context.user_data.pop('broadcast_variant_lang', None)
     if update.callback_query:
         await update.callback_query.answer()
-        await update.callback_query.message.reply_text("📢 *Broadcast Message*\n\nPlease enter the message you want to send to all users who have alerts enabled:", parse_mode='Markdown')
+        await update.callback_query.message.reply_text("📢 *Broadcast Message*\n\nPlease enter the message you want to send to all users who have alerts enabled.\nYou can also send a photo, document or album with a caption:", parse_mode='Markdown')
     else:
-        await update.message.reply_text("📢 *Broadcast Message*\n\nPlease enter the message you want to send to all users who have alerts enabled:", parse_mode='Markdown')
+        await update.message.reply_text("📢 *Broadcast Message*\n\nPlease enter the message you want to send to all users who have alerts enabled.\nYou can also send a photo, document or album with a caption:", parse_mode='Markdown')
     return BROADCAST_MESSAGE
 
-async def admin_broadcast_receive_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text
-    context.user_data['broadcast_message'] = text
-    
-    preview = f"📢 *Broadcast Preview*\n\n{text}\n\nDo you want to send this message?"
+async def show_broadcast_preview(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Shows every language variant of the broadcast with send/translate/cancel buttons."""
+    variants = context.user_data.get('broadcast_variants', {})
+    media = context.user_data.get('broadcast_media', [])
+    default_lang = context.user_data.get('broadcast_default_lang', 'en')
+
+    preview = "📢 *Broadcast Preview*\n\n"
+    if context.user_data.get('broadcast_media_group'):
+        preview += "📎 Attachment: album\n\n"
+    elif media:
+        preview += f"📎 Attachment: {media[0]['type']}\n\n"
+    for lang, text in variants.items():
+        label = get_text(lang, 'language_name')
+        if lang == default_lang:
+            label += " (default)"
+        preview += f"*{label}:*\n{text}\n\n"
+    preview += "Users without their own language version receive the default one.\nDo you want to send this message?"
+
     keyboard = [
-        [InlineKeyboardButton("✅ Send Now", callback_data='broadcast_send')],
-        [InlineKeyboardButton("❌ Cancel", callback_data='broadcast_cancel')]
+        [InlineKeyboardButton("✅ Send Now", callback_data='broadcast_send'),
+         InlineKeyboardButton("🕒 Schedule", callback_data='broadcast_schedule')]
     ]
+    for lang in TRANS:
+        if lang not in variants:
+            keyboard.append([InlineKeyboardButton(f"🌐 Add {get_text(lang, 'language_name')} Version", callback_data=f'broadcast_variant:{lang}')])
+    keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data='broadcast_cancel')])
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(preview, reply_markup=reply_markup, parse_mode='Markdown')
+    await update.effective_message.reply_text(preview, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def admin_broadcast_receive_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = update.message.text
+    default_lang = get_user_lang(update, context) or 'en'
+    context.user_data['broadcast_default_lang'] = default_lang
+    context.user_data['broadcast_variants'] = {default_lang: text}
+    context.user_data['broadcast_media'] = []
+    context.user_data.pop('broadcast_media_group', None)
+
+    await show_broadcast_preview(update, context)
     return BROADCAST_CONFIRM
 
+async def admin_broadcast_receive_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Captures a photo, document or album part for the broadcast by its Telegram file_id."""
+    message = update.message
+    if message.photo:
+        item = {'type': 'photo', 'file_id': message.photo[-1].file_id}
+    else:
+        item = {'type': 'document', 'file_id': message.document.file_id}
+    caption = message.caption or ''
+
+    # Album parts arrive as separate messages sharing a media_group_id
+    media_group_id = message.media_group_id
+    if media_group_id and media_group_id == context.user_data.get('broadcast_media_group'):
+        context.user_data['broadcast_media'].append(item)
+        default_lang = context.user_data.get('broadcast_default_lang', 'en')
+        variants = context.user_data.setdefault('broadcast_variants', {})
+        if caption and not variants.get(default_lang):
+            variants[default_lang] = caption
+        return BROADCAST_CONFIRM
+
+    default_lang = get_user_lang(update, context) or 'en'
+    context.user_data['broadcast_default_lang'] = default_lang
+    context.user_data['broadcast_variants'] = {default_lang: caption}
+    context.user_data['broadcast_media'] = [item]
+    context.user_data['broadcast_media_group'] = media_group_id
+
+    await show_broadcast_preview(update, context)
+    return BROADCAST_CONFIRM
+
+async def admin_broadcast_variant_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Asks the admin for the broadcast text in an additional language."""
+    query = update.callback_query
+    await query.answer()
+
+    lang = query.data.split(':')[1]
+    if lang not in TRANS:
+        await query.message.reply_text("Unsupported language.")
+        return BROADCAST_CONFIRM
+
+    context.user_data['broadcast_variant_lang'] = lang
+    await query.message.reply_text(f"🌐 Please enter the *{get_text(lang, 'language_name')}* version of the broadcast:", parse_mode='Markdown')
+    return BROADCAST_VARIANT
+
+async def admin_broadcast_receive_variant(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    lang = context.user_data.pop('broadcast_variant_lang', None)
+    if not lang:
+        await update.message.reply_text("Session expired. Please start the broadcast again.")
+        return ConversationHandler.END
+
+    context.user_data.setdefault('broadcast_variants', {})[lang] = update.message.text
+    await show_broadcast_preview(update, context)
+    return BROADCAST_CONFIRM
+
+def render_broadcast(lang, variants, default_lang='en'):
+    """Builds the announcement text for one recipient language."""
+    text = variants.get(lang) or variants.get(default_lang) or next(iter(variants.values()))
+    header = get_text(lang, 'broadcast_header')
+    return f"{header}\n\n{text}" if text else header
+
+async def send_broadcast_item(bot, chat_id, text, media=None):
+    """Sends one rendered broadcast to a chat.
+
+    Media is always sent by file_id, so Telegram reuses the file the admin
+    already uploaded instead of receiving the bytes again for every recipient.
+    """
+    if not media:
+        await bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
+        return
+
+    # Captions are limited to 1024 characters; longer texts follow as a message
+    caption = text if len(text) <= CAPTION_LIMIT else None
+    if len(media) == 1:
+        item = media[0]
+        if item['type'] == 'photo':
+            await bot.send_photo(chat_id=chat_id, photo=item['file_id'], caption=caption, parse_mode='Markdown')
+        else:
+            await bot.send_document(chat_id=chat_id, document=item['file_id'], caption=caption, parse_mode='Markdown')
+    else:
+        album = []
+        for i, item in enumerate(media):
+            media_cls = InputMediaPhoto if item['type'] == 'photo' else InputMediaDocument
+            album.append(media_cls(media=item['file_id'], caption=caption if i == 0 else None, parse_mode='Markdown'))
+        await bot.send_media_group(chat_id=chat_id, media=album)
+
+    if caption is None:
+        await bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
+
 async def admin_broadcast_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -527,26 +728,204 @@ async def admin_broadcast_confirm(update: Update, context: ContextTypes.DEFAULT_
         await query.message.edit_text("Broadcast cancelled.")
         return ConversationHandler.END
         
-    message = context.user_data.get('broadcast_message')
-    if not message:
+    variants = context.user_data.get('broadcast_variants')
+    if not variants:
          await query.message.edit_text("Error: No message content.")
          return ConversationHandler.END
-         
-    # Send to users
-    users = database.get_users_for_notification('notify_alerts')
-    count = 0
-    
-    status_msg = await query.message.reply_text(f"⏳ Sending broadcast to {len(users)} users...")
-    
-    for user_id in users:
+
+    if query.data == 'broadcast_schedule':
+        await query.message.reply_text(
+            "🕒 Please enter the date and time to send the broadcast (server time), e.g. `2025-12-31 09:00`:",
+            parse_mode='Markdown'
+        )
+        return BROADCAST_SCHEDULE
+
+    broadcast_id = queue_broadcast(context, update.effective_user.id, datetime.now())
+    # Start the first batch right away instead of waiting for the next tick
+    # (only where the broadcast job runs, so two processes never send the same batch)
+    if context.job_queue and WORKER_INDEX == 0:
+        context.job_queue.run_once(broadcast_tick, 1)
+    await query.message.reply_text(
+        f"✅ Broadcast #{broadcast_id} queued. It will be delivered over about {BROADCAST_WINDOW_MINUTES} minutes"
+        f"{' outside quiet hours' if BROADCAST_QUIET_HOURS else ''}. You will be notified when it finishes."
+    )
+    return ConversationHandler.END
+
+async def admin_broadcast_receive_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Parses the scheduled send time and stores the broadcast."""
+    try:
+        scheduled_at = datetime.strptime(update.message.text.strip(), "%Y-%m-%d %H:%M")
+    except ValueError:
+        await update.message.reply_text("Invalid format. Please use `YYYY-MM-DD HH:MM`:", parse_mode='Markdown')
+        return BROADCAST_SCHEDULE
+
+    if scheduled_at <= datetime.now():
+        await update.message.reply_text("That time is in the past. Please enter a future date and time:")
+        return BROADCAST_SCHEDULE
+
+    if not context.user_data.get('broadcast_variants'):
+        await update.message.reply_text("Session expired. Please start the broadcast again.")
+        return ConversationHandler.END
+
+    broadcast_id = queue_broadcast(context, update.effective_user.id, scheduled_at)
+    await update.message.reply_text(f"🕒 Broadcast #{broadcast_id} scheduled for {scheduled_at.strftime('%Y-%m-%d %H:%M')}.")
+    return ConversationHandler.END
+
+def queue_broadcast(context: ContextTypes.DEFAULT_TYPE, created_by, scheduled_at):
+    """Persists the broadcast draft from user_data so the JobQueue can deliver it."""
+    return database.create_broadcast(
+        created_by=created_by,
+        variants=context.user_data.get('broadcast_variants', {}),
+        default_lang=context.user_data.get('broadcast_default_lang', 'en'),
+        media=context.user_data.get('broadcast_media', []),
+        scheduled_at=scheduled_at,
+    )
+
+def parse_quiet_hours(value):
+    """Parses "22-7" into (22, 7); returns None when quiet hours are disabled."""
+    try:
+        start, end = (int(part) for part in value.split('-'))
+    except ValueError:
+        return None
+    if start == end:
+        return None
+    return start % 24, end % 24
+
+def in_quiet_hours(now):
+    quiet_hours = parse_quiet_hours(BROADCAST_QUIET_HOURS)
+    if not quiet_hours:
+        return False
+    start, end = quiet_hours
+    if start < end:
+        return start <= now.hour < end
+    # Window wraps around midnight, e.g. 22-7
+    return now.hour >= start or now.hour < end
+
+def broadcast_batch_size(total_recipients):
+    """Spreads a broadcast evenly over the configured window of ticks."""
+    ticks = max(1, (BROADCAST_WINDOW_MINUTES * 60) // BROADCAST_TICK_SECONDS)
+    return max(1, -(-total_recipients // ticks))
+
+async def deliver_broadcast_item(bot, user_id, text, media):
+    """Sends one broadcast item, waiting out RetryAfter; returns False if it could not be delivered."""
+    for attempt in range(BROADCAST_MAX_RETRIES + 1):
         try:
-            await context.bot.send_message(chat_id=user_id, text=f"📢 *Announcement*\n\n{message}", parse_mode='Markdown')
-            count += 1
+            await send_broadcast_item(bot, user_id, text, media)
+            return True
+        except RetryAfter as e:
+            if attempt == BROADCAST_MAX_RETRIES:
+                logging.error("Failed to broadcast to %s: still rate limited after %s retries", user_id, attempt)
+                return False
+            wait = e.retry_after
+            wait = wait.total_seconds() if hasattr(wait, 'total_seconds') else wait
+            logging.warning("Broadcast to %s rate limited, retrying in %ss", user_id, wait)
+            await asyncio.sleep(wait)
         except Exception as e:
-            logging.error(f"Failed to broadcast to {user_id}: {e}")
-            
-    await status_msg.edit_text(f"✅ Broadcast sent successfully to {count} users.")
-    return ConversationHandler.END
+            logging.error("Failed to broadcast to %s: %s", user_id, e)
+            return False
+
+async def broadcast_tick(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue callback: sends the next batch of every due broadcast."""
+    if _broadcast_lock.locked():
+        return  # Previous tick still sending
+    async with _broadcast_lock:
+        if in_quiet_hours(datetime.now()):
+            return
+        for broadcast in database.get_due_broadcasts():
+            try:
+                await send_broadcast_batch(bulk_bot or context.bot, broadcast)
+            except Exception as e:
+                logging.error("Error sending broadcast #%s: %s", broadcast['id'], e)
+
+async def send_broadcast_batch(bot, broadcast):
+    broadcast_id = broadcast['id']
+    variants = json.loads(broadcast['variants'])
+    media = json.loads(broadcast['media'] or '[]')
+    total = broadcast['total_recipients']
+    # An admin may have cancelled it since get_due_broadcasts() (e.g. while an earlier broadcast was sending)
+    if database.get_broadcast_status(broadcast_id) == 'Cancelled':
+        return
+    if broadcast['status'] == 'Scheduled':
+        total = database.count_users_for_notification(broadcast['notification_type'])
+        if not database.update_broadcast_progress(broadcast_id, 'Sending', total_recipients=total):
+            return
+
+    cursor = None
+    if broadcast['cursor_telegram_id'] is not None:
+        cursor = (broadcast['cursor_lang'], broadcast['cursor_telegram_id'])
+    batch_size = broadcast_batch_size(total)
+    groups = database.get_users_for_notification_by_language(broadcast['notification_type'], after=cursor, limit=batch_size)
+
+    sent = failed = fetched = 0
+    cancelled = False
+    interval = 1 / BROADCAST_MAX_PER_SECOND if BROADCAST_MAX_PER_SECOND > 0 else 0
+    next_send = time.monotonic()
+    for lang, users in groups.items():
+        text = render_broadcast(lang, variants, broadcast['default_lang'])
+        for user_id in users:
+            if database.get_broadcast_status(broadcast_id) == 'Cancelled':
+                cancelled = True
+                break
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_send = max(next_send, time.monotonic()) + interval
+            if await deliver_broadcast_item(bot, user_id, text, media):
+                sent += 1
+            else:
+                failed += 1
+            cursor = (lang, user_id)
+            fetched += 1
+        if cancelled:
+            break
+
+    finished = fetched < batch_size
+    # Never writes 'Sending' back over a cancellation that happened during the batch
+    if cancelled or not database.update_broadcast_progress(broadcast_id, 'Sent' if finished else 'Sending', sent, failed, cursor):
+        logging.info("Broadcast #%s was cancelled after %s sends in this batch", broadcast_id, sent)
+        metrics.broadcast_progress(sent, failed, False)
+        return
+    metrics.broadcast_progress(sent, failed, finished)
+
+    if finished and broadcast['created_by']:
+        done = database.get_broadcast(broadcast_id)
+        try:
+            await bot.send_message(
+                chat_id=broadcast['created_by'],
+                text=f"✅ Broadcast #{broadcast_id} finished: sent to {done['sent_count']} users ({done['failed_count']} failed)."
+            )
+        except Exception as e:
+            logging.error("Failed to report broadcast #%s to admin: %s", broadcast_id, e)
+
+async def admin_list_broadcasts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Lists scheduled and in-progress broadcasts with cancel buttons."""
+    if not await is_admin(update.effective_user.username):
+        await update.message.reply_text("You are not authorized to use this command.")
+        return
+
+    broadcasts = database.get_pending_broadcasts()
+    if not broadcasts:
+        await update.message.reply_text("No scheduled broadcasts.")
+        return
+
+    text = "🗓 *Scheduled Broadcasts*\n\n"
+    keyboard = []
+    for b in broadcasts:
+        text += f"#{b['id']} | {b['scheduled_at']} | {b['status']} ({b['sent_count']}/{b['total_recipients'] or '?'})\n"
+        keyboard.append([InlineKeyboardButton(f"🚫 Cancel #{b['id']}", callback_data=f"cancel_broadcast:{b['id']}")])
+    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+
+async def cancel_broadcast_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    if not await is_admin(query.from_user.username):
+        return
+
+    broadcast_id = int(query.data.split(':')[1])
+    if database.cancel_broadcast(broadcast_id):
+        await query.message.reply_text(f"🚫 Broadcast #{broadcast_id} cancelled.")
+    else:
+        await query.message.reply_text(f"Broadcast #{broadcast_id} already finished or cancelled.")
 
 async def setadmin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Temporarily sets a user as admin by username."""
@@ -731,6 +1110,7 @@ async def subscribe_channels(update: Update, context: ContextTypes.DEFAULT_TYPE)
     else:
         await update.message.reply_text(text, reply_markup=reply_markup)
 
+@traced
 async def check_registration_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     customer = database.get_customer_by_telegram_id(user_id)
@@ -774,7 +1154,7 @@ async def start_registration(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Starts the registration process."""
     user_id = update.effective_user.id
     username = update.effective_user.username
-    logging.info(f"start_registration: effective_user.username is: {username}")
+    logging.info("start_registration: effective_user.username is: %s", username)
     if not username:
         lang = get_user_lang(update, context) or 'en'
         message = "To register, you must have a Telegram username. Please set one in your Telegram settings and try again."
@@ -787,7 +1167,7 @@ async def start_registration(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text(message, reply_markup=reply_markup)
         return ConversationHandler.END
     customer = database.get_customer_by_telegram_id(user_id)
-    logging.info(f"start_registration: Customer for user_id {user_id}: {customer}")
+    logging.info("start_registration: Customer for user_id %s: %s", user_id, customer)
 
     if customer:
         if customer['status'] == 'Approved':
@@ -977,7 +1357,7 @@ async def confirm_registration(update: Update, context: ContextTypes.DEFAULT_TYP
             )
             await context.bot.send_message(chat_id=admin_id, text=message, parse_mode='Markdown')
         except Exception as e:
-            logging.error(f"Failed to send admin notification: {e}")
+            logging.error("Failed to send admin notification: %s", e)
             
     return ConversationHandler.END
 
@@ -1011,7 +1391,7 @@ async def handle_returning_user_choice(update: Update, context: ContextTypes.DEF
                     )
                     await context.bot.send_message(chat_id=admin_id, text=message, parse_mode='Markdown')
             except Exception as e:
-                logging.error(f"Failed to send admin notification for account reactivation: {e}")
+                logging.error("Failed to send admin notification for account reactivation: %s", e)
         return ConversationHandler.END
     elif query.data == 'register_new_account':
         database.permanently_delete_customer(user_id)
@@ -1072,6 +1452,7 @@ async def is_admin(username):
         return customer['is_admin'] == 1
     return False
 
+@traced
 async def notify_all_admins(context: ContextTypes.DEFAULT_TYPE, message: str, parse_mode='Markdown', reply_markup=None):
     """Send notification to all admins."""
     admin_ids = database.get_all_admin_telegram_ids()
@@ -1080,7 +1461,88 @@ async def notify_all_admins(context: ContextTypes.DEFAULT_TYPE, message: str, pa
         try:
             await context.bot.send_message(chat_id=admin_id, text=message, parse_mode=parse_mode, reply_markup=reply_markup)
         except Exception as e:
-            logging.error(f"Failed to send notification to admin {admin_id}: {e}")
+            logging.error("Failed to send notification to admin %s: %s", admin_id, e)
+
+async def get_ticket_topic(context: ContextTypes.DEFAULT_TYPE, ticket):
+    """Returns the ticket's forum topic in the support group, creating it on first use."""
+    if ticket['topic_id']:
+        return ticket['topic_id']
+    name = f"#{ticket['id']} {ticket['subject'] or 'Support'}"[:128]
+    topic = await context.bot.create_forum_topic(chat_id=SUPPORT_GROUP_ID, name=name)
+    database.set_ticket_topic(ticket['id'], topic.message_thread_id)
+    return topic.message_thread_id
+
+@traced
+async def notify_support(context: ContextTypes.DEFAULT_TYPE, ticket_id, message: str, parse_mode='Markdown', reply_markup=None):
+    """Posts ticket traffic to its support group topic, or to all admins when no group is configured."""
+    if SUPPORT_GROUP_ID:
+        try:
+            topic_id = await get_ticket_topic(context, database.get_ticket(ticket_id))
+            await context.bot.send_message(chat_id=SUPPORT_GROUP_ID, message_thread_id=topic_id, text=message,
+                                           parse_mode=parse_mode, reply_markup=reply_markup)
+            return
+        except Exception as e:
+            logging.error("Failed to post ticket %s to support group, falling back to admin DMs: %s", ticket_id, e)
+    await notify_all_admins(context, message, parse_mode=parse_mode, reply_markup=reply_markup)
+
+async def send_support_attachment(context: ContextTypes.DEFAULT_TYPE, ticket_id, attachment_path):
+    """Sends a ticket attachment to the support topic, or to every admin."""
+    caption = f"Attachment for Ticket #{ticket_id}"
+    is_photo = attachment_path.lower().endswith(('.jpg', '.jpeg', '.png'))
+
+    if SUPPORT_GROUP_ID:
+        try:
+            topic_id = await get_ticket_topic(context, database.get_ticket(ticket_id))
+            with open(attachment_path, 'rb') as f:
+                if is_photo:
+                    await context.bot.send_photo(chat_id=SUPPORT_GROUP_ID, message_thread_id=topic_id, photo=f, caption=caption)
+                else:
+                    await context.bot.send_document(chat_id=SUPPORT_GROUP_ID, message_thread_id=topic_id, document=f, caption=caption)
+            return
+        except Exception as e:
+            logging.error("Failed to post attachment for ticket %s to support group: %s", ticket_id, e)
+
+    for admin_id in database.get_all_admin_telegram_ids():
+        try:
+            if is_photo:
+                await context.bot.send_photo(chat_id=admin_id, photo=open(attachment_path, 'rb'), caption=caption)
+
+            else:
+                 await context.bot.send_document(chat_id=admin_id, document=open(attachment_path, 'rb'), caption=caption)
+
+        except Exception as e:
+            logging.error("Failed to notify admin: %s", e)
+
+async def support_topic_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Routes admin messages posted in a ticket's forum topic back to the customer."""
+    message = update.message
+    if not message or not message.is_topic_message:
+        return  # General topic chatter is not routed anywhere
+
+    ticket = database.get_ticket_by_topic_id(message.message_thread_id)
+    if not ticket:
+        return
+
+    if not await is_admin(update.effective_user.username):
+        return
+
+    ticket_id = ticket['id']
+    text = message.text or message.caption or "[attachment]"
+    await database.add_message_async(ticket_id, 'admin', text)
+    await database.update_ticket_status_async(ticket_id, 'Open')
+
+    user_id = ticket['user_id']
+    try:
+        if message.text:
+            await context.bot.send_message(
+                chat_id=user_id,
+                text=f"👨‍💼 *Support Reply (Ticket #{ticket_id})*:\n\n{message.text}\n\n_Type a message to reply back._",
+                parse_mode='Markdown'
+            )
+        else:
+            await context.bot.copy_message(chat_id=user_id, from_chat_id=message.chat_id, message_id=message.message_id)
+    except Exception as e:
+        await message.reply_text(f"❌ Reply saved, but failed to send to user: {e}")
 
 async def admin_action_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles admin approval/rejection actions."""
@@ -1128,7 +1590,7 @@ async def admin_action_handler(update: Update, context: ContextTypes.DEFAULT_TYP
                  try:
                     await context.bot.send_message(chat_id=order['user_id'], text=f"🎉 Your Order #{entity_id} has been confirmed! We are processing it.")
                  except Exception as e:
-                    logging.error(f"Could not notify user: {e}")
+                    logging.error("Could not notify user: %s", e)
 
     elif action == 'reject':
         if 'orders' in query.data:
@@ -1142,7 +1604,7 @@ async def admin_action_handler(update: Update, context: ContextTypes.DEFAULT_TYP
                  try:
                     await context.bot.send_message(chat_id=order['user_id'], text=f"❌ Your Order #{entity_id} could not be processed. Please contact support.")
                  except Exception as e:
-                    logging.error(f"Could not notify user: {e}")
+                    logging.error("Could not notify user: %s", e)
 
 # --- Support / Ticket Handlers ---
 
@@ -1164,6 +1626,9 @@ async def start_support(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         return ConversationHandler.END
 
 
+    # One ticket per conversation, however often a button is tapped
+    context.user_data['ticket_token'] = uuid.uuid4().hex
+
     lang = get_user_lang(update, context) or 'en'
     category = "Support"
     if update.callback_query:
@@ -1238,8 +1703,9 @@ async def receive_ticket_attachment(update: Update, context: ContextTypes.DEFAUL
     subject = context.user_data['ticket_subject']
     message_text = context.user_data['ticket_message']
 
-    # 1. Create a preliminary ticket entry to get an ID
-    ticket_id = database.create_ticket(user_id, category, subject, message_text)
+    # 1. Create a preliminary ticket entry to get an ID (reused if the user sends another file)
+    token = context.user_data.setdefault('ticket_token', uuid.uuid4().hex)
+    ticket_id, _ = await database.create_ticket_once_async(token, user_id, category, subject, message_text)
     context.user_data['ticket_id'] = ticket_id
 
     # Determine if photo or document
@@ -1289,7 +1755,8 @@ async def skip_ticket_attachment(update: Update, context: ContextTypes.DEFAULT_T
     subject = context.user_data['ticket_subject']
     message_text = context.user_data['ticket_message']
     
-    ticket_id = database.create_ticket(user_id, category, subject, message_text)
+    token = context.user_data.setdefault('ticket_token', uuid.uuid4().hex)
+    ticket_id, _ = await database.create_ticket_once_async(token, user_id, category, subject, message_text)
     context.user_data['ticket_id'] = ticket_id
     
     await show_ticket_confirmation(update, context)
@@ -1338,6 +1805,10 @@ async def confirm_ticket_submission(update: Update, context: ContextTypes.DEFAUL
     ticket_id = context.user_data['ticket_id'] # Retrieve the existing ticket_id
     
     # No need to call database.create_ticket here, as it was already created in receive_ticket_attachment
+    if context.user_data.get('ticket_submitted') == ticket_id:
+        await query.message.reply_text(f"ℹ️ Ticket #{ticket_id} was already submitted.")
+        return ConversationHandler.END
+    context.user_data['ticket_submitted'] = ticket_id
     
     await query.message.reply_text(f"✅ Ticket #{ticket_id} created! We will review it shortly.")
     
@@ -1350,19 +1821,10 @@ async def confirm_ticket_submission(update: Update, context: ContextTypes.DEFAUL
         f"User: {update.effective_user.full_name} (@{update.effective_user.username or 'NoUsername'}) (ID: {user_id})\n\n"
         f"{message_text}"
     )
-    await notify_all_admins(context, admin_msg)
+    await notify_support(context, ticket_id, admin_msg)
     
     if attachment_path:
-        for admin_id in database.get_all_admin_telegram_ids():
-            try:
-                if attachment_path.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    await context.bot.send_photo(chat_id=admin_id, photo=open(attachment_path, 'rb'), caption=f"Attachment for Ticket #{ticket_id}")
-
-                else:
-                     await context.bot.send_document(chat_id=admin_id, document=open(attachment_path, 'rb'), caption=f"Attachment for Ticket #{ticket_id}")
-
-            except Exception as e:
-                logging.error(f"Failed to notify admin: {e}")
+        await send_support_attachment(context, ticket_id, attachment_path)
             
     return ConversationHandler.END
 
@@ -1396,7 +1858,7 @@ async def admin_reply_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
         
     # Save Admin Message
-    database.add_message(ticket_id, 'admin', reply_text)
+    await database.add_message_async(ticket_id, 'admin', reply_text)
     
     # Send to User
     user_id = ticket['user_id']
@@ -1691,6 +2153,7 @@ async def admin_reports_logs(update: Update, context: ContextTypes.DEFAULT_TYPE)
         f"✉️ *Total Tickets:* {total_tickets}\n"
         f"👥 *Total Users:* {total_users}\n"
         f"{analytics_text}\n"
+        f"_Send /perf for response times, /querystats for database statements._\n"
         f"_Select an option below to export data:_"
     )
     
@@ -1702,6 +2165,50 @@ async def admin_reports_logs(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     await reply_method(text, reply_markup=reply_markup, parse_mode='Markdown')
 
+async def perf_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin-only latency and throughput report from the in-memory ring buffers."""
+    if not await is_admin(update.effective_user.username):
+        await update.message.reply_text("You are not authorized to use this command.")
+        return
+
+    extra = {}
+    if update_pool is not None:
+        extra["queued updates"] = f"{update_pool.depth}/{update_pool.queue.maxsize}"
+    processor = context.application.update_processor
+    if isinstance(processor, PerChatUpdateProcessor):
+        extra["chats being processed"] = f"{processor.active_chats} (limit {processor.max_concurrent_updates})"
+    if WORKER_COUNT > 1:
+        extra["worker"] = f"{WORKER_INDEX + 1} of {WORKER_COUNT}"
+    await update.message.reply_text(perf.report(extra))
+
+async def query_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin-only dump of per-statement database timings (this process, since start)."""
+    if not await is_admin(update.effective_user.username):
+        await update.message.reply_text("You are not authorized to use this command.")
+        return
+
+    rows = query_log.statement_stats()
+    if not rows:
+        await update.message.reply_text("No database statements recorded yet.")
+        return
+
+    lines = [f"🐢 Top statements by total time (slow = over {query_log.SLOW_QUERY_MS:g}ms)"]
+    for statement, calls, total, worst, slow in rows[:10]:
+        lines.append(f"\n{total * 1000:.0f}ms total, {calls} calls, avg {total / calls * 1000:.2f}ms, "
+                     f"max {worst * 1000:.1f}ms, {slow} slow\n{statement[:200]}")
+    await update.message.reply_text("\n".join(lines)[:4000])
+
+    csv_buffer = io.StringIO()
+    writer = csv.writer(csv_buffer)
+    writer.writerow(["statement", "calls", "total_ms", "avg_ms", "max_ms", "slow_calls"])
+    for statement, calls, total, worst, slow in rows:
+        writer.writerow([statement, calls, f"{total * 1000:.3f}", f"{total / calls * 1000:.3f}", f"{worst * 1000:.3f}", slow])
+    await update.message.reply_document(
+        document=io.BytesIO(csv_buffer.getvalue().encode()),
+        filename=f"query_stats_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+        caption=f"Slow statements are logged with their query plan to {query_log.SLOW_QUERY_LOG}"
+    )
+
 async def admin_export_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Exports users to CSV."""
     user = update.effective_user
@@ -1723,7 +2230,7 @@ async def admin_export_users(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         await msg.delete()
     except Exception as e:
-        logging.error(f"Error sending users csv: {e}")
+        logging.error("Error sending users csv: %s", e)
         await msg.edit_text("❌ Error sending file.")
 
 async def admin_export_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1747,7 +2254,7 @@ async def admin_export_orders(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         await msg.delete()
     except Exception as e:
-        logging.error(f"Error sending orders csv: {e}")
+        logging.error("Error sending orders csv: %s", e)
         await msg.edit_text("❌ Error sending file.")
 
 
@@ -2110,25 +2617,70 @@ async def user_reply_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     if ticket:
         ticket_id = ticket['id']
-        database.add_message(ticket_id, 'user', message_text)
+        await database.add_message_async(ticket_id, 'user', message_text)
         
-        # Notify All Admins
+        # Notify All Admins (bursts of messages are coalesced into one digest)
         try:
-            admin_message = (
-                f"📩 *New Support Message*\n"
-                f"Ticket: #{ticket_id}\n"
-                f"User: {update.effective_user.full_name} (ID: {user_id})\n\n"
-                f"{message_text}\n\n"
-                f"👉 *Reply to this message to answer.*"
-            )
-            await notify_all_admins(context, admin_message)
+            await queue_support_digest(context, ticket_id, update.effective_user, message_text)
         except Exception as e:
-            logging.error(f"Failed to notify admin: {e}")
+            logging.error("Failed to notify admin: %s", e)
         
         await update.message.reply_text("✅ Message sent to support.")
     else:
         await unknown(update, context)
 
+def support_digest_text(ticket_id, user_name, user_id, messages):
+    """Formats one admin notification for a burst of support messages."""
+    title = "📩 *New Support Message*" if len(messages) == 1 else f"📩 *{len(messages)} New Support Messages*"
+    body = messages[0] if len(messages) == 1 else "\n".join(f"• {m}" for m in messages)
+    if len(body) > SUPPORT_DIGEST_MAX_CHARS:
+        body = body[:SUPPORT_DIGEST_MAX_CHARS] + "\n…(see the ticket for the full conversation)"
+    return (
+        f"{title}\n"
+        f"Ticket: #{ticket_id}\n"
+        f"User: {user_name} (ID: {user_id})\n\n"
+        f"{body}\n\n"
+        f"👉 *Reply to this message to answer.*"
+    )
+
+async def queue_support_digest(context: ContextTypes.DEFAULT_TYPE, ticket_id, user, message_text):
+    """Debounces admin notifications per ticket.
+
+    Every new message restarts the ticket's timer, so a user typing several
+    short lines produces a single digest per admin. The digest is never held
+    back longer than SUPPORT_DIGEST_MAX_SECONDS after the first message.
+    Pending messages are kept in the database, so a digest that was due
+    during a restart is sent once the bot is back (see post_init).
+    """
+    if not SUPPORT_DIGEST_SECONDS or not context.job_queue:
+        await notify_support(context, ticket_id, support_digest_text(ticket_id, user.full_name, user.id, [message_text]))
+        return
+
+    first_at = await database.add_support_digest_message_async(ticket_id, user.full_name, user.id, message_text)
+    remaining = SUPPORT_DIGEST_MAX_SECONDS - (time.time() - first_at)
+    schedule_support_digest(context.job_queue, ticket_id, max(0, min(SUPPORT_DIGEST_SECONDS, remaining)))
+
+def schedule_support_digest(job_queue, ticket_id, delay):
+    name = f"support_digest:{ticket_id}"
+    for job in job_queue.get_jobs_by_name(name):
+        job.schedule_removal()
+    job_queue.run_once(send_support_digest, delay, data=ticket_id, name=name)
+
+async def send_support_digest(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue callback: sends the collected support messages to all admins."""
+    # Taking the digest out of the database makes sure only one job (or process) sends it
+    data = await database.take_support_digest_async(context.job.data)
+    if data is None:
+        return
+    message = support_digest_text(data['ticket_id'], data['user_name'], data['user_id'], data['messages'])
+    await notify_support(context, data['ticket_id'], message)
+
+def rearm_support_digests(job_queue):
+    """Schedules the digests that were still pending when the bot last stopped."""
+    for ticket_id, first_at in database.get_pending_support_digests():
+        remaining = SUPPORT_DIGEST_MAX_SECONDS - (time.time() - first_at)
+        schedule_support_digest(job_queue, ticket_id, max(0, min(SUPPORT_DIGEST_SECONDS, remaining)))
+
 # --- Feedback Conversation Handlers ---
 
 async def start_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -2302,10 +2854,10 @@ async def confirm_feedback_submission(update: Update, context: ContextTypes.DEFA
                 try:
                     await context.bot.send_photo(chat_id=admin_id, photo=open(photo_path, 'rb'), caption=f"Photo for Feedback #{feedback_id}")
                 except Exception as e:
-                    logging.error(f"Failed to send photo to admin {admin_id}: {e}")
+                    logging.error("Failed to send photo to admin %s: %s", admin_id, e)
                     
     except Exception as e:
-        logging.error(f"Failed to send admin notification for feedback: {e}")
+        logging.error("Failed to send admin notification for feedback: %s", e)
             
     return ConversationHandler.END
 
@@ -2481,15 +3033,15 @@ async def toggle_notification_callback(update: Update, context: ContextTypes.DEF
     if type_key == 'orders':
         current = customer['notify_orders'] if customer['notify_orders'] is not None else 1
         new_val = 0 if current else 1
-        database.update_notification_preferences(user_id, notify_orders=new_val)
+        await database.update_notification_preferences_async(user_id, notify_orders=new_val)
     elif type_key == 'products':
         current = customer['notify_products'] if customer['notify_products'] is not None else 1
         new_val = 0 if current else 1
-        database.update_notification_preferences(user_id, notify_products=new_val)
+        await database.update_notification_preferences_async(user_id, notify_products=new_val)
     elif type_key == 'alerts':
         current = customer['notify_alerts'] if customer['notify_alerts'] is not None else 1
         new_val = 0 if current else 1
-        database.update_notification_preferences(user_id, notify_alerts=new_val)
+        await database.update_notification_preferences_async(user_id, notify_alerts=new_val)
         
     # Refresh view
     await my_notifications_callback(update, context)
@@ -2500,6 +3052,8 @@ async def start_order(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     if not await check_registration_status(update, context):
         return ConversationHandler.END
     """Starts the order process."""
+    # One order per conversation, however often "Confirm Order" is tapped
+    context.user_data['order_token'] = uuid.uuid4().hex
     if update.callback_query:
         query = update.callback_query
         await query.answer()
@@ -2555,7 +3109,7 @@ async def start_order(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
                         parse_mode='Markdown'
                     )
                 except Exception as e:
-                    logging.error(f"Failed to send image for product {p['id']}: {e}")
+                    logging.error("Failed to send image for product %s: %s", p['id'], e)
                     await context.bot.send_message(
                         chat_id=update.effective_chat.id, 
                         text=caption, 
@@ -2713,7 +3267,11 @@ async def confirm_order_submission(update: Update, context: ContextTypes.DEFAULT
     payment = context.user_data['order_payment']
     price = context.user_data.get('order_product_price', 0)
     
-    order_id = database.create_order(user_id, product, quantity, address, payment, price)
+    token = context.user_data.setdefault('order_token', uuid.uuid4().hex)
+    order_id, created = await database.create_order_once_async(token, user_id, product, quantity, address, payment, price)
+    if not created:
+        await query.message.reply_text(f"ℹ️ Order #{order_id} was already submitted.")
+        return ConversationHandler.END
     
     await query.message.reply_text(f"✅ Order #{order_id} submitted successfully! We will process it shortly.")
     
@@ -2967,7 +3525,7 @@ async def view_product_details(update: Update, context: ContextTypes.DEFAULT_TYP
             )
             return
         except Exception as e:
-            logging.error(f"Failed to send product image: {e}")
+            logging.error("Failed to send product image: %s", e)
     
     await query.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
@@ -3052,6 +3610,16 @@ def setup_handlers(application):
         MessageHandler(filters.Regex(ADMIN_VIEW_CLOSED_TICKETS_PATTERN), admin_user_messages_closed),
     ]
 
+    # Conversation states survive restarts when the application has a persistence
+    persistent = application.persistence is not None
+
+    # Support group traffic is handled before anything else so it never enters user flows
+    if SUPPORT_GROUP_ID:
+        application.add_handler(MessageHandler(
+            filters.Chat(chat_id=int(SUPPORT_GROUP_ID)) & ~filters.COMMAND & ~filters.StatusUpdate.ALL,
+            support_topic_message_handler
+        ))
+
     # Registration Conversation Handler
     registration_handler = ConversationHandler(
         entry_points=[
@@ -3071,6 +3639,8 @@ def setup_handlers(application):
             ],
         },
         fallbacks=navigation_handlers,
+        name='registration',
+        persistent=persistent,
     )
 
     # Support Conversation Handler
@@ -3092,6 +3662,8 @@ def setup_handlers(application):
             CONFIRM_TICKET: [CallbackQueryHandler(confirm_ticket_submission, pattern='^(confirm_ticket|cancel)$')]
         },
         fallbacks=navigation_handlers,
+        name='support',
+        persistent=persistent,
     )
 
     # Feedback Conversation Handler
@@ -3112,6 +3684,8 @@ def setup_handlers(application):
             CONFIRM_FEEDBACK: [CallbackQueryHandler(confirm_feedback_submission, pattern='^(confirm_feedback|cancel)$')],
         },
         fallbacks=navigation_handlers,
+        name='feedback',
+        persistent=persistent,
     )
 
     # Order Conversation Handler
@@ -3136,6 +3710,8 @@ def setup_handlers(application):
             CONFIRM_ORDER: [CallbackQueryHandler(confirm_order_submission, pattern='^(confirm_order|cancel)$')],
         },
         fallbacks=navigation_handlers,
+        name='order',
+        persistent=persistent,
     )
 
     # Add Product Conversation Handler
@@ -3157,6 +3733,8 @@ def setup_handlers(application):
             ],
         },
         fallbacks=navigation_handlers,
+        name='add_product',
+        persistent=persistent,
     )
 
     # Add Handlers
@@ -3185,6 +3763,8 @@ def setup_handlers(application):
             EDIT_PRODUCT_IMAGE: [MessageHandler(filters.PHOTO, receive_edit_image)],
         },
         fallbacks=navigation_handlers,
+        name='edit_product',
+        persistent=persistent,
     )
     application.add_handler(edit_product_handler)
     
@@ -3212,10 +3792,21 @@ def setup_handlers(application):
             MessageHandler(filters.Regex(ADMIN_BROADCAST_PATTERN), admin_broadcast_start)
         ],
         states={
-            BROADCAST_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_broadcast_receive_message)],
-            BROADCAST_CONFIRM: [CallbackQueryHandler(admin_broadcast_confirm, pattern='^broadcast_(send|cancel)$')]
+            BROADCAST_MESSAGE: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, admin_broadcast_receive_message),
+                MessageHandler(filters.PHOTO | filters.Document.ALL, admin_broadcast_receive_media)
+            ],
+            BROADCAST_CONFIRM: [
+                MessageHandler(filters.PHOTO | filters.Document.ALL, admin_broadcast_receive_media),
+                CallbackQueryHandler(admin_broadcast_confirm, pattern='^broadcast_(send|schedule|cancel)$'),
+                CallbackQueryHandler(admin_broadcast_variant_start, pattern='^broadcast_variant:\\w+$')
+            ],
+            BROADCAST_VARIANT: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_broadcast_receive_variant)],
+            BROADCAST_SCHEDULE: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_broadcast_receive_schedule)]
         },
         fallbacks=navigation_handlers,
+        name='broadcast',
+        persistent=persistent,
     )
     application.add_handler(broadcast_handler)
 
@@ -3226,6 +3817,8 @@ def setup_handlers(application):
             ADMIN_REPLY: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_receive_reply)]
         },
         fallbacks=navigation_handlers,
+        name='admin_reply_conv',
+        persistent=persistent,
     )
     application.add_handler(admin_reply_conv_handler)
     
@@ -3242,8 +3835,12 @@ def setup_handlers(application):
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler('menu', start))
     application.add_handler(CommandHandler('admin', admin_menu))
+    application.add_handler(CommandHandler('perf', perf_command))
+    application.add_handler(CommandHandler('querystats', query_stats_command))
     application.add_handler(CommandHandler("feedback", start_feedback))
     application.add_handler(CommandHandler("setadmin", setadmin))
+    application.add_handler(CommandHandler("broadcasts", admin_list_broadcasts))
+    application.add_handler(CallbackQueryHandler(cancel_broadcast_callback, pattern='^cancel_broadcast:\\d+$'))
 
     application.add_handler(CommandHandler("setuser", set_user))
     application.add_handler(CommandHandler('help', help_command))
@@ -3298,6 +3895,8 @@ def setup_handlers(application):
             CONFIRM_DELETE: [CallbackQueryHandler(confirm_delete_account, pattern='^(confirm_delete|cancel_delete)$')]
         },
         fallbacks=[CommandHandler('cancel', cancel), CallbackQueryHandler(cancel, pattern='^cancel$')],
+        name='delete_account',
+        persistent=persistent,
     )
     application.add_handler(delete_account_handler)
     
@@ -3307,47 +3906,138 @@ def setup_handlers(application):
     application.add_handler(MessageHandler(filters.REPLY, admin_reply_handler))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, user_reply_handler))
 
+    # Per-handler latency for /metrics
+    metrics.instrument_application(application)
+
+def build_application(token):
+    """Builds the bot Application with persistence, Bot API connection pools, update processing and all handlers."""
+    persistence = SQLitePersistence(
+        update_interval=float(os.getenv("PERSISTENCE_UPDATE_SECONDS", 5)),
+        flush_interval=float(os.getenv("PERSISTENCE_FLUSH_SECONDS", 1)),
+        shared=WORKER_COUNT > 1,
+    )
+    global bulk_bot
+    bulk_bot = Bot(token, base_url=BOT_API_BASE_URL, base_file_url=BOT_API_BASE_FILE_URL, request=build_request('bulk'))
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .base_url(BOT_API_BASE_URL)
+        .base_file_url(BOT_API_BASE_FILE_URL)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .persistence(persistence)
+        .request(build_request('interactive'))
+        .get_updates_request(build_request('get_updates'))
+    )
+    if FAST_JSON:
+        logging.info("Using orjson for webhook and Bot API payloads")
+    concurrency = int(os.getenv("UPDATE_CONCURRENCY", 1))
+    if concurrency > 1:
+        # Different chats run in parallel, updates within one chat stay in order
+        builder = builder.concurrent_updates(PerChatUpdateProcessor(concurrency))
+        logging.info(f"Processing up to {concurrency} updates concurrently")
+    application = builder.build()
+    setup_handlers(application)
+    return application
+
+def build_update_pool(application):
+    """Creates the worker pool that processes queued updates, with replay protection and optional profiling and tracing."""
+    recent_updates = RecentUpdateIds(capacity=int(os.getenv("UPDATE_DEDUP_SIZE", 10000)))
+    recent_updates.load()
+    concurrency = int(os.getenv("UPDATE_CONCURRENCY", 1))
+    return UpdateWorkerPool(
+        application,
+        workers=int(os.getenv("UPDATE_WORKERS", max(4, concurrency))),
+        maxsize=int(os.getenv("UPDATE_QUEUE_SIZE", 1000)),
+        recent_updates=recent_updates,
+        profiler=UpdateProfiler.from_env(),
+        tracer=UpdateTracer.from_env(),
+    )
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global application
+    global application, update_pool
     token = os.getenv("BOT_TOKEN")
     webhook_url = os.getenv("WEBHOOK_URL")
+    webhook_secret = os.getenv("WEBHOOK_SECRET")
     
     if not token:
         logging.error("BOT_TOKEN is not set in environment variables")
         yield
         return
 
-    application = ApplicationBuilder().token(token).post_init(post_init).build()
-    setup_handlers(application)
+    application = build_application(token)
     
     if webhook_url:
-        await application.bot.set_webhook(url=f"{webhook_url}/webhook")
-        logging.info(f"Webhook set to {webhook_url}/webhook")
+        webhook = {'url': f"{webhook_url}/webhook", 'secret_token': webhook_secret}
+        if await apply_bot_setting(application.bot, 'webhook', webhook, lambda: application.bot.set_webhook(**webhook)):
+            logging.info(f"Webhook set to {webhook_url}/webhook")
     else:
         logging.warning("WEBHOOK_URL not set in environment variables. Webhook not configured.")
     
     async with application:
+        # run_polling()/run_webhook() would call post_init and post_shutdown; we drive the application ourselves
+        await application.post_init(application)
         await application.start()
+        update_pool = build_update_pool(application)
+        update_pool.start()
         yield
+        # Finish the updates Telegram has already been told we received
+        await update_pool.stop(timeout=int(os.getenv("UPDATE_DRAIN_SECONDS", 30)))
         await application.stop()
+        database.writer.stop()
+    await application.post_shutdown(application)
 
 app = FastAPI(lifespan=lifespan)
 
 @app.post("/webhook")
 async def webhook(request: Request):
-    """Entry point for Telegram webhooks."""
-    if application is None:
+    """Entry point for Telegram webhooks. Validates and enqueues the update, then acknowledges at once."""
+    if application is None or update_pool is None:
         return Response(content="Application not initialized", status_code=503)
-    update = Update.de_json(await request.json(), application.bot)
-    await application.process_update(update)
+
+    webhook_secret = os.getenv("WEBHOOK_SECRET")
+    if webhook_secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != webhook_secret:
+        return Response(status_code=403)
+
+    try:
+        update = Update.de_json(loads(await request.body()), application.bot)
+    except Exception as e:
+        logging.error("Invalid webhook payload: %s", e)
+        return Response(status_code=400)
+
+    if not update_pool.put(update):
+        # Queue is full (or shutting down): Telegram will redeliver the update later
+        return Response(content="Update queue full", status_code=503)
     return Response(status_code=200)
 
 @app.get("/")
 async def index():
     """Health check endpoint."""
-    return {"status": "ok", "bot": "ET HONEY Trading Bot"}
+    health = {"status": "ok", "bot": "ET HONEY Trading Bot"}
+    if update_pool is not None:
+        health["update_queue"] = update_pool.metrics()
+    health["cache"] = database.invalidation_bus.stats()
+    health["db_writer"] = database.writer.stats
+    return health
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics: handler, database and Bot API latency, broadcast progress, queue depth."""
+    if not metrics.ENABLED:
+        return Response(content="prometheus_client is not installed", status_code=503)
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+# Queue, cache and writer figures are read when /metrics is scraped
+metrics.register_gauges("bot_update_queue", lambda: update_pool.metrics() if update_pool is not None else {})
+metrics.register_gauges("bot_cache", lambda: {
+    f"{table}_{name}": value for table, stats in database.invalidation_bus.stats().items() for name, value in stats.items()
+})
+metrics.register_gauges("bot_db_writer", lambda: database.writer.stats)
 
 if __name__ == '__main__':
     port = int(os.getenv("PORT", 10000))
-    uvicorn.run("bot:app", host="0.0.0.0", port=port, reload=False)
+    # "auto" picks uvloop when it is installed; UVLOOP=0 forces the stdlib loop
+    loop = "asyncio" if os.getenv("UVLOOP", "1") == "0" else "auto"
+    uvicorn.run("bot:app", host="0.0.0.0", port=port, reload=False, loop=loop)
@@ -0,0 +1,38 @@
+import hashlib
+import json
+import logging
+import os
+
+from . import database
+
+# "changed" skips Bot API setup calls whose settings match what was last sent;
+# "always" repeats them on every start (e.g. after changing the bot by hand in BotFather)
+BOT_SETUP_MODE = os.getenv("BOT_SETUP_MODE", "changed")
+
+
+def setting_hash(bot, value):
+    """Hash of a setting, tied to the bot token and Bot API server so switching either applies everything again."""
+    payload = json.dumps([bot.token, bot.base_url, value], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def apply_bot_setting(bot, name, value, call):
+    """Awaits call() unless `value` is what was last applied under `name`.
+
+    The hash is stored only after the call succeeded, so a failed call is retried on the next start.
+    Returns True if the call was made.
+    """
+    value_hash = setting_hash(bot, value)
+    if BOT_SETUP_MODE != "always":
+        try:
+            if database.get_bot_setting_hash(name) == value_hash:
+                logging.info(f"Bot setting '{name}' unchanged, skipping")
+                return False
+        except Exception as e:
+            logging.error(f"Could not read stored bot setting '{name}': {e}")
+    await call()
+    try:
+        database.save_bot_setting_hash(name, value_hash)
+    except Exception as e:
+        logging.error(f"Could not store bot setting '{name}': {e}")
+    return True
@@ -0,0 +1,142 @@
+import logging
+import os
+
+from .query_log import connect
+
+
+class TableCache:
+    """In-process cache of query results for one table.
+
+    Single-row lookups are remembered per key together with the row id they
+    returned, so a change to one row only evicts that row's entries. Lookups
+    that found nothing are dropped when rows are inserted or updated (the
+    missing row may exist now), and multi-row results are dropped on any
+    change to the table.
+    """
+
+    def __init__(self, table, bus, max_entries=10000):
+        self.table = table
+        self.bus = bus
+        self.max_entries = max_entries
+        self._rows = {}
+        self._keys_by_id = {}
+        self._missing = set()
+        self._lists = {}
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        bus.register(self)
+
+    def get(self, key, loader):
+        """Returns the cached row for key, calling loader() (which returns a row or None) on a miss."""
+        self.bus.poll()
+        if key in self._rows:
+            self.stats['hits'] += 1
+            return self._rows[key]
+        self.stats['misses'] += 1
+        row = loader()
+        if len(self._rows) >= self.max_entries:
+            self.clear()
+        self._rows[key] = row
+        if row is None:
+            self._missing.add(key)
+        else:
+            self._keys_by_id.setdefault(row['id'], set()).add(key)
+        return row
+
+    def get_list(self, key, loader):
+        """Returns a cached multi-row result (as a new list, so callers may modify it)."""
+        self.bus.poll()
+        if key in self._lists:
+            self.stats['hits'] += 1
+        else:
+            self.stats['misses'] += 1
+            self._lists[key] = list(loader())
+        return list(self._lists[key])
+
+    def evict(self, row_id, op):
+        for key in self._keys_by_id.pop(row_id, ()):
+            self._rows.pop(key, None)
+            self.stats['evictions'] += 1
+        if op != 'DELETE':
+            for key in self._missing:
+                self._rows.pop(key, None)
+            self._missing.clear()
+        self._lists.clear()
+
+    def clear(self):
+        self._rows.clear()
+        self._keys_by_id.clear()
+        self._missing.clear()
+        self._lists.clear()
+
+    def __len__(self):
+        return len(self._rows) + len(self._lists)
+
+
+class InvalidationBus:
+    """Evicts cache entries for rows changed by any connection or process.
+
+    Triggers append (table, row id, operation) to change_log on every write to
+    a cached table. PRAGMA data_version on a connection of our own changes
+    whenever another connection commits, so each poll costs one pragma
+    unless something was written; only then is change_log read.
+
+    `reader` names this bus in change_log_readers, where its cursor is recorded
+    so change_log rows are only pruned once every process has read them.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.caches = {}
+        self.reader = f"{os.getpid()}-{id(self):x}"
+        self._conn = None
+        self._data_version = None
+        self._last_seq = 0
+
+    def register(self, cache):
+        self.caches.setdefault(cache.table, []).append(cache)
+
+    def _connect(self):
+        self._conn = connect(self.db_path, check_same_thread=False)
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        self._last_seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+
+    def poll(self):
+        try:
+            if self._conn is None:
+                self._connect()
+                return
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return
+            self._data_version = version
+            changes = self._conn.execute(
+                "SELECT seq, table_name, row_id, op FROM change_log WHERE seq > ? ORDER BY seq", (self._last_seq,)
+            ).fetchall()
+        except Exception as e:
+            logging.error(f"Cache invalidation poll failed, clearing caches: {e}")
+            self.clear()
+            self._conn = None
+            return
+
+        if changes and changes[0][0] != self._last_seq + 1:
+            # Entries we had not read yet were pruned; we can't tell what changed
+            self.clear()
+        for seq, table, row_id, op in changes:
+            for cache in self.caches.get(table, ()):
+                cache.evict(row_id, op)
+        if changes:
+            self._last_seq = changes[-1][0]
+
+    @property
+    def last_seq(self):
+        """The last change_log row this bus has read."""
+        return self._last_seq
+
+    def clear(self):
+        for caches in self.caches.values():
+            for cache in caches:
+                cache.clear()
+
+    def stats(self):
+        return {cache.table: dict(cache.stats, entries=len(cache))
+                for caches in self.caches.values() for cache in caches}
@@ -1,15 +1,40 @@
 import sqlite3
+import json
+import time
 from datetime import datetime
-import pandas as pd
 import os
 import logging
+from .cache import TableCache, InvalidationBus
+from .db_writer import DatabaseWriter
+from .metrics import instrument_functions
+from .query_log import connect
 
 DB_NAME = "honey_trading.db"
 # Use environment variable for database path if provided (useful for persistent disks on Render)
 DB_PATH = os.getenv("DATABASE_PATH", os.path.join(os.path.dirname(__file__), DB_NAME))
 
+# Hot lookups are cached in-process; writes from any process evict the affected rows via change_log
+CACHED_TABLES = ('customers', 'products')
+CHANGE_LOG_KEEP = 10000
+invalidation_bus = InvalidationBus(DB_PATH)
+customer_cache = TableCache('customers', invalidation_bus)
+product_cache = TableCache('products', invalidation_bus)
+
+# Writes from async handlers go through one writer thread (see the *_async functions)
+writer = DatabaseWriter(DB_PATH)
+
+def _write(operation, *args):
+    """Runs a write operation on its own connection and commits it right away."""
+    conn = connect(DB_PATH)
+    try:
+        result = operation(conn.cursor(), *args)
+        conn.commit()
+    finally:
+        conn.close()
+    return result
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     # Customers Table
     c.execute('''
@@ -53,6 +78,14 @@ def init_db():
         c.execute("ALTER TABLE tickets ADD COLUMN attachment_path TEXT")
     except sqlite3.OperationalError:
         pass
+    try:
+        c.execute("ALTER TABLE tickets ADD COLUMN topic_id INTEGER")
+    except sqlite3.OperationalError:
+        pass
+    try:
+        c.execute("ALTER TABLE tickets ADD COLUMN idempotency_key TEXT")
+    except sqlite3.OperationalError:
+        pass
     try:
         c.execute("ALTER TABLE customers ADD COLUMN is_admin INTEGER DEFAULT 0")
     except sqlite3.OperationalError:
@@ -143,12 +176,126 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+
+    # Broadcasts Table (scheduled/paced announcements, survives restarts)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_by INTEGER,
+            variants TEXT, -- JSON {language: text}
+            default_lang TEXT DEFAULT 'en',
+            media TEXT, -- JSON [{type, file_id}]
+            notification_type TEXT DEFAULT 'notify_alerts',
+            scheduled_at TIMESTAMP, -- server local time
+            status TEXT DEFAULT 'Scheduled', -- Scheduled, Sending, Sent, Cancelled
+            total_recipients INTEGER DEFAULT 0,
+            sent_count INTEGER DEFAULT 0,
+            failed_count INTEGER DEFAULT 0,
+            cursor_lang TEXT,
+            cursor_telegram_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Bot persistence (conversation states, user_data, chat_data, bot_data) as JSON
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS bot_persistence (
+            kind TEXT, -- user_data, chat_data, bot_data or conversation:<name>
+            key TEXT,
+            data TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kind, key)
+        )
+    ''')
+    # Migration for multi-process mode: change sequence and writing process
+    try:
+        c.execute("ALTER TABLE bot_persistence ADD COLUMN seq INTEGER DEFAULT 0")
+    except sqlite3.OperationalError:
+        pass
+    try:
+        c.execute("ALTER TABLE bot_persistence ADD COLUMN origin TEXT")
+    except sqlite3.OperationalError:
+        pass
+    # One row per persistence write batch; AUTOINCREMENT keeps sequence numbers from being reused
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS bot_persistence_batches (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            origin TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bot_persistence_seq ON bot_persistence(seq)')
+
+    # Recently seen webhook update_ids, stored as a ring (slot = update_id % capacity)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS seen_updates (
+            slot INTEGER PRIMARY KEY,
+            update_id INTEGER NOT NULL
+        )
+    ''')
+
+    # Support messages waiting for their admin digest, kept here so a restart doesn't drop them
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS support_digests (
+            ticket_id INTEGER PRIMARY KEY,
+            user_name TEXT,
+            user_id INTEGER,
+            messages TEXT NOT NULL, -- JSON list
+            first_at REAL NOT NULL -- unix time of the first message
+        )
+    ''')
+
+    # Hash of the bot settings last sent to Telegram (description, commands, webhook)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS bot_settings (
+            name TEXT PRIMARY KEY,
+            value_hash TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Migration for orders idempotency key (one order per conversation draft)
+    try:
+        c.execute("ALTER TABLE orders ADD COLUMN idempotency_key TEXT")
+    except sqlite3.OperationalError:
+        pass
+
+    # Change log for cache invalidation, filled by triggers on the cached tables
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT,
+            row_id INTEGER,
+            op TEXT -- INSERT, UPDATE, DELETE
+        )
+    ''')
+    for table in CACHED_TABLES:
+        for op, ref in (('INSERT', 'NEW'), ('UPDATE', 'OLD'), ('DELETE', 'OLD')):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_{op.lower()}_change_log AFTER {op} ON {table}
+                BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', {ref}.id, '{op}');
+                END
+            ''')
+    c.execute("DELETE FROM change_log WHERE seq <= (SELECT MAX(seq) FROM change_log) - ?", (CHANGE_LOG_KEEP,))
+    # How far each process's InvalidationBus has read change_log (see prune_change_log_async)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS change_log_readers (
+            reader TEXT PRIMARY KEY,
+            last_seq INTEGER,
+            seen_at REAL
+        )
+    ''')
+
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tickets_topic_id ON tickets(topic_id)')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency_key ON orders(idempotency_key)')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_tickets_idempotency_key ON tickets(idempotency_key)')
     
     conn.commit()
     conn.close()
 
 def add_product(name, description, price, stock, image_path=None, available_quantities=None, category='General'):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('''
         INSERT INTO products (name, description, price, stock, image_path, available_quantities, category)
@@ -160,14 +307,17 @@ def add_product(name, description, price, stock, image_path=None, available_quan
     return product_id
 
 def update_customer_language(telegram_id, language):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE customers SET language = ? WHERE telegram_id = ?', (language, telegram_id))
     conn.commit()
     conn.close()
 
 def get_all_products():
-    conn = sqlite3.connect(DB_PATH)
+    return product_cache.get_list('all', _get_all_products)
+
+def _get_all_products():
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM products ORDER BY name')
@@ -176,7 +326,10 @@ def get_all_products():
     return products
 
 def get_product(product_id):
-    conn = sqlite3.connect(DB_PATH)
+    return product_cache.get(('id', product_id), lambda: _get_product(product_id))
+
+def _get_product(product_id):
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM products WHERE id = ?', (product_id,))
@@ -185,7 +338,7 @@ def get_product(product_id):
     return product
 
 def delete_product(product_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('DELETE FROM products WHERE id = ?', (product_id,))
     conn.commit()
@@ -193,7 +346,7 @@ def delete_product(product_id):
 
 def update_product(product_id, name=None, description=None, price=None, stock=None, image_path=None, category=None):
     """Update product details. Only updates provided fields."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     
     updates = []
@@ -225,11 +378,14 @@ def update_product(product_id, name=None, description=None, price=None, stock=No
         conn.commit()
     
     conn.close()
-    logging.info(f"Updated product ID {product_id}")
+    logging.info("Updated product ID %s", product_id)
 
 def get_products_available():
     """Get only products with stock > 0."""
-    conn = sqlite3.connect(DB_PATH)
+    return product_cache.get_list('available', _get_products_available)
+
+def _get_products_available():
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM products WHERE stock > 0 ORDER BY name')
@@ -239,7 +395,7 @@ def get_products_available():
 
 def search_products(query):
     """Search products by name or description."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     search_term = f"%{query}%"
@@ -251,7 +407,7 @@ def search_products(query):
 
 def get_products_by_category(category):
     """Get products filtered by category."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM products WHERE category = ? AND stock > 0 ORDER BY name', (category,))
@@ -261,7 +417,7 @@ def get_products_by_category(category):
 
 def get_all_categories():
     """Get list of distinct product categories."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('SELECT DISTINCT category FROM products WHERE category IS NOT NULL ORDER BY category')
     categories = [row[0] for row in c.fetchall()]
@@ -270,7 +426,7 @@ def get_all_categories():
 
 def search_products_advanced(query=None, category=None, min_price=None, max_price=None, sort_by='name', sort_order='asc'):
     """Advanced product search with filters and sorting."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
@@ -307,14 +463,14 @@ def search_products_advanced(query=None, category=None, min_price=None, max_pric
     return products
 
 def update_product_stock(product_id, new_stock):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE products SET stock = ? WHERE id = ?', (new_stock, product_id))
     conn.commit()
     conn.close()
 
 def create_feedback(user_id, rating, comment, photo_path=None):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('''
         INSERT INTO feedback (user_id, rating, comment, photo_path)
@@ -326,7 +482,7 @@ def create_feedback(user_id, rating, comment, photo_path=None):
     return feedback_id
 
 def get_feedback(feedback_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM feedback WHERE id = ?', (feedback_id,))
@@ -335,14 +491,14 @@ def get_feedback(feedback_id):
     return feedback
 
 def update_feedback_status(feedback_id, status):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE feedback SET status = ? WHERE id = ?', (status, feedback_id))
     conn.commit()
     conn.close()
 
 def create_order(user_id, product_name, quantity, delivery_address, payment_type, price=0):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('''
         INSERT INTO orders (user_id, product_name, quantity, delivery_address, payment_type, price)
@@ -353,8 +509,31 @@ def create_order(user_id, product_name, quantity, delivery_address, payment_type
     conn.close()
     return order_id
 
+def create_order_once(idempotency_key, user_id, product_name, quantity, delivery_address, payment_type, price=0):
+    """Creates the order for a conversation draft at most once.
+
+    Returns (order_id, created); a repeated key returns the existing order and created=False.
+    """
+    return _write(_create_order_once, idempotency_key, user_id, product_name, quantity, delivery_address, payment_type, price)
+
+async def create_order_once_async(idempotency_key, user_id, product_name, quantity, delivery_address, payment_type, price=0):
+    return await writer.run(_create_order_once, idempotency_key, user_id, product_name, quantity, delivery_address, payment_type, price)
+
+def _create_order_once(c, idempotency_key, user_id, product_name, quantity, delivery_address, payment_type, price):
+    c.execute('''
+        INSERT OR IGNORE INTO orders (user_id, product_name, quantity, delivery_address, payment_type, price, idempotency_key)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, product_name, quantity, delivery_address, payment_type, price, idempotency_key))
+    created = c.rowcount > 0
+    if created:
+        order_id = c.lastrowid
+    else:
+        c.execute('SELECT id FROM orders WHERE idempotency_key = ?', (idempotency_key,))
+        order_id = c.fetchone()[0]
+    return order_id, created
+
 def get_order(order_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM orders WHERE id = ?', (order_id,))
@@ -363,7 +542,7 @@ def get_order(order_id):
     return order
 
 def update_order_status(order_id, status):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE orders SET status = ? WHERE id = ?', (status, order_id))
     conn.commit()
@@ -371,7 +550,7 @@ def update_order_status(order_id, status):
 
 # --- Customer Functions ---
 def add_customer(data):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('''
         INSERT INTO customers (telegram_id, username, full_name, phone, email, region, customer_type, status)
@@ -383,7 +562,7 @@ def add_customer(data):
     return customer_id
 
 def get_customer(customer_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM customers WHERE id = ?', (customer_id,))
@@ -392,27 +571,33 @@ def get_customer(customer_id):
     return customer
 
 def get_customer_by_telegram_id(telegram_id):
-    conn = sqlite3.connect(DB_PATH)
+    return customer_cache.get(('telegram_id', telegram_id), lambda: _get_customer_by_telegram_id(telegram_id))
+
+def _get_customer_by_telegram_id(telegram_id):
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM customers WHERE telegram_id = ?', (telegram_id,))
     customer = c.fetchone()
-    logging.info(f"get_customer_by_telegram_id for {telegram_id} returned: {customer}")
+    logging.info("get_customer_by_telegram_id for %s returned: %s", telegram_id, customer)
     conn.close()
     return customer
 
 def get_customer_by_username(username):
-    conn = sqlite3.connect(DB_PATH)
+    return customer_cache.get(('username', (username or '').lower()), lambda: _get_customer_by_username(username))
+
+def _get_customer_by_username(username):
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM customers WHERE LOWER(username) = LOWER(?)', (username,))
     customer = c.fetchone()
-    logging.info(f"get_customer_by_username for {username} returned: {customer}")
+    logging.info("get_customer_by_username for %s returned: %s", username, customer)
     conn.close()
     return customer
 
 def get_all_customers():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM customers ORDER BY full_name')
@@ -421,30 +606,33 @@ def get_all_customers():
     return customers
 
 def set_admin_status(telegram_id, is_admin):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE customers SET is_admin = ? WHERE telegram_id = ?', (is_admin, telegram_id))
     conn.commit()
     conn.close()
 
 def update_customer_status(customer_id, status):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE customers SET status = ? WHERE id = ?', (status, customer_id))
     conn.commit()
     conn.close()
 
 def set_admin_by_username(username):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE customers SET is_admin = 1, status = "Approved" WHERE LOWER(username) = LOWER(?)', (username,))
     conn.commit()
     conn.close()
-    logging.info(f"Set admin status for username {username} to 1 and status to Approved.")
+    logging.info("Set admin status for username %s to 1 and status to Approved.", username)
 
 def get_all_admin_telegram_ids():
     """Returns a list of telegram IDs for all admins."""
-    conn = sqlite3.connect(DB_PATH)
+    return customer_cache.get_list('admin_ids', _get_all_admin_telegram_ids)
+
+def _get_all_admin_telegram_ids():
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('SELECT telegram_id FROM customers WHERE is_admin = 1')
     admins = c.fetchall()
@@ -452,7 +640,7 @@ def get_all_admin_telegram_ids():
     return [admin[0] for admin in admins if admin[0]]  # Filter out None values
 
 def update_customer_status_by_telegram_id(telegram_id, status):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE customers SET status = ? WHERE telegram_id = ?', (status, telegram_id))
     conn.commit()
@@ -461,7 +649,7 @@ def update_customer_status_by_telegram_id(telegram_id, status):
 # --- Ticket & Support Functions ---
 
 def create_ticket(user_id, category, subject, message, attachment_path=None):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     
     # Create Ticket
@@ -481,27 +669,112 @@ def create_ticket(user_id, category, subject, message, attachment_path=None):
     conn.close()
     return ticket_id
 
+def create_ticket_once(idempotency_key, user_id, category, subject, message, attachment_path=None):
+    """Creates the ticket (and its first message) for a conversation draft at most once.
+
+    Returns (ticket_id, created); a repeated key returns the existing ticket and created=False.
+    """
+    return _write(_create_ticket_once, idempotency_key, user_id, category, subject, message, attachment_path)
+
+async def create_ticket_once_async(idempotency_key, user_id, category, subject, message, attachment_path=None):
+    return await writer.run(_create_ticket_once, idempotency_key, user_id, category, subject, message, attachment_path)
+
+def _create_ticket_once(c, idempotency_key, user_id, category, subject, message, attachment_path):
+    c.execute('''
+        INSERT OR IGNORE INTO tickets (user_id, category, subject, status, attachment_path, idempotency_key)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (user_id, category, subject, 'Pending', attachment_path, idempotency_key))
+    created = c.rowcount > 0
+    if created:
+        ticket_id = c.lastrowid
+        c.execute('''
+            INSERT INTO messages (ticket_id, sender_type, message)
+            VALUES (?, ?, ?)
+        ''', (ticket_id, 'user', message))
+    else:
+        c.execute('SELECT id FROM tickets WHERE idempotency_key = ?', (idempotency_key,))
+        ticket_id = c.fetchone()[0]
+    return ticket_id, created
+
+async def prune_change_log_async(reader_timeout=3600):
+    """Records this process's change_log cursor, then deletes the rows every live reader has read.
+
+    Readers that haven't recorded their cursor for `reader_timeout` seconds are
+    taken to be gone. Returns the number of rows deleted.
+    """
+    invalidation_bus.poll()  # a bus nothing has looked up through yet starts at the newest row
+    return await writer.run(_prune_change_log, invalidation_bus.reader, invalidation_bus.last_seq,
+                            time.time(), reader_timeout)
+
+def _prune_change_log(c, reader, last_seq, now, reader_timeout):
+    c.execute('INSERT OR REPLACE INTO change_log_readers (reader, last_seq, seen_at) VALUES (?, ?, ?)',
+              (reader, last_seq, now))
+    c.execute('DELETE FROM change_log_readers WHERE seen_at < ?', (now - reader_timeout,))
+    c.execute('DELETE FROM change_log WHERE seq <= (SELECT MIN(last_seq) FROM change_log_readers)')
+    return c.rowcount
+
 def add_message(ticket_id, sender_type, message):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    _write(_add_message, ticket_id, sender_type, message)
+
+async def add_message_async(ticket_id, sender_type, message):
+    await writer.run(_add_message, ticket_id, sender_type, message)
+
+def _add_message(c, ticket_id, sender_type, message):
     c.execute('INSERT INTO messages (ticket_id, sender_type, message) VALUES (?, ?, ?)', 
               (ticket_id, sender_type, message))
     
     # Update ticket updated_at
     c.execute('UPDATE tickets SET updated_at = CURRENT_TIMESTAMP WHERE id = ?', (ticket_id,))
-    conn.commit()
-    conn.close()
 
 def update_ticket_status(ticket_id, status):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    _write(_update_ticket_status, ticket_id, status)
+
+async def update_ticket_status_async(ticket_id, status):
+    await writer.run(_update_ticket_status, ticket_id, status)
+
+def _update_ticket_status(c, ticket_id, status):
     c.execute('UPDATE tickets SET status = ? WHERE id = ?', (status, ticket_id))
-    conn.commit()
+
+async def add_support_digest_message_async(ticket_id, user_name, user_id, message):
+    """Appends a message to the ticket's pending admin digest; returns when its first message arrived (unix time)."""
+    return await writer.run(_add_support_digest_message, ticket_id, user_name, user_id, message)
+
+def _add_support_digest_message(c, ticket_id, user_name, user_id, message):
+    c.execute('SELECT messages, first_at FROM support_digests WHERE ticket_id = ?', (ticket_id,))
+    row = c.fetchone()
+    if row is None:
+        first_at = time.time()
+        c.execute('INSERT INTO support_digests (ticket_id, user_name, user_id, messages, first_at) VALUES (?, ?, ?, ?, ?)',
+                  (ticket_id, user_name, user_id, json.dumps([message]), first_at))
+        return first_at
+    c.execute('UPDATE support_digests SET messages = ? WHERE ticket_id = ?',
+              (json.dumps(json.loads(row[0]) + [message]), ticket_id))
+    return row[1]
+
+async def take_support_digest_async(ticket_id):
+    """Removes and returns the ticket's pending digest as a dict, or None if it was already sent."""
+    return await writer.run(_take_support_digest, ticket_id)
+
+def _take_support_digest(c, ticket_id):
+    c.execute('SELECT user_name, user_id, messages FROM support_digests WHERE ticket_id = ?', (ticket_id,))
+    row = c.fetchone()
+    if row is None:
+        return None
+    c.execute('DELETE FROM support_digests WHERE ticket_id = ?', (ticket_id,))
+    return {'ticket_id': ticket_id, 'user_name': row[0], 'user_id': row[1], 'messages': json.loads(row[2])}
+
+def get_pending_support_digests():
+    """Returns [(ticket_id, first_at)] of the digests not sent yet, e.g. to re-arm them after a restart."""
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute('SELECT ticket_id, first_at FROM support_digests')
+    rows = c.fetchall()
     conn.close()
+    return rows
 
 def get_active_ticket(user_id):
     """Returns the most recent open ticket for a user."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     # Check for 'Open' or 'Pending' (maybe user shouldn't open new if pending?)
@@ -512,7 +785,7 @@ def get_active_ticket(user_id):
     return ticket
 
 def get_ticket(ticket_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM tickets WHERE id = ?', (ticket_id,))
@@ -520,22 +793,39 @@ def get_ticket(ticket_id):
     conn.close()
     return ticket
 
+def get_ticket_by_topic_id(topic_id):
+    """Returns the ticket whose forum topic in the support group has this message_thread_id."""
+    conn = connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute('SELECT * FROM tickets WHERE topic_id = ?', (topic_id,))
+    ticket = c.fetchone()
+    conn.close()
+    return ticket
+
+def set_ticket_topic(ticket_id, topic_id):
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute('UPDATE tickets SET topic_id = ? WHERE id = ?', (topic_id, ticket_id))
+    conn.commit()
+    conn.close()
+
 def update_feedback_photo_path(feedback_id, photo_path):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE feedback SET photo_path = ? WHERE id = ?', (photo_path, feedback_id))
     conn.commit()
     conn.close()
 
 def update_ticket_attachment_path(ticket_id, attachment_path):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE tickets SET attachment_path = ? WHERE id = ?', (attachment_path, ticket_id))
     conn.commit()
     conn.close()
 
 def get_orders_by_user(user_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     # user_id in orders table is the telegram_id
@@ -545,7 +835,7 @@ def get_orders_by_user(user_id):
     return orders
 
 def get_tickets_by_user(user_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     # user_id in tickets table is the telegram_id
@@ -555,7 +845,7 @@ def get_tickets_by_user(user_id):
     return tickets
 
 def get_feedback_by_user(user_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM feedback WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
@@ -564,7 +854,10 @@ def get_feedback_by_user(user_id):
     return feedback
 
 def export_table_to_excel(table_name):
-    conn = sqlite3.connect(DB_PATH)
+    # pandas (and openpyxl, which pandas loads for to_excel) are imported on first export only;
+    # together they take longer to import than the rest of the bot
+    import pandas as pd
+    conn = connect(DB_PATH)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     file_name = f"{table_name}_export_{timestamp}.xlsx"
     output_dir = "exports"
@@ -583,7 +876,7 @@ def export_table_to_excel(table_name):
         conn.close()
 
 def delete_customer(telegram_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     # Update customer status to 'Deleted'
     c.execute('UPDATE customers SET status = ? WHERE telegram_id = ?', ('Deleted', telegram_id))
@@ -591,15 +884,15 @@ def delete_customer(telegram_id):
     conn.close()
 
 def permanently_delete_customer(telegram_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
-    logging.info(f"Attempting to permanently delete customer with telegram_id: {telegram_id}")
+    logging.info("Attempting to permanently delete customer with telegram_id: %s", telegram_id)
     # Get customer_id first
     c.execute('SELECT id FROM customers WHERE telegram_id = ?', (telegram_id,))
     customer_id = c.fetchone()
     if customer_id:
         customer_id = customer_id[0]
-        logging.info(f"Found customer_id {customer_id} for telegram_id {telegram_id}. Proceeding with permanent deletion.")
+        logging.info("Found customer_id %s for telegram_id %s. Proceeding with permanent deletion.", customer_id, telegram_id)
         # Delete related orders
         c.execute('DELETE FROM orders WHERE user_id = ?', (customer_id,))
         # Delete related tickets
@@ -608,14 +901,14 @@ def permanently_delete_customer(telegram_id):
         c.execute('DELETE FROM feedback WHERE user_id = ?', (customer_id,))
         # Finally, delete the customer
         c.execute('DELETE FROM customers WHERE telegram_id = ?', (telegram_id,))
-        logging.info(f"Customer with telegram_id {telegram_id} and customer_id {customer_id} permanently deleted from database.")
+        logging.info("Customer with telegram_id %s and customer_id %s permanently deleted from database.", telegram_id, customer_id)
     else:
-        logging.info(f"No customer found with telegram_id {telegram_id} for permanent deletion.")
+        logging.info("No customer found with telegram_id %s for permanent deletion.", telegram_id)
     conn.commit()
     conn.close()
 
 def get_recent_users(limit=10):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM customers ORDER BY created_at DESC LIMIT ?', (limit,))
@@ -624,7 +917,7 @@ def get_recent_users(limit=10):
     return users
 
 def get_total_users():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute("SELECT COUNT(*) FROM customers")
     count = c.fetchone()[0]
@@ -632,7 +925,7 @@ def get_total_users():
     return count
 
 def get_total_revenue():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     # Assuming orders table has 'total_price' or we calculate from product price * quantity
     # But wait, orders table structure: user_id, product_name, quantity, address, payment, status, created_at.
@@ -643,7 +936,7 @@ def get_total_revenue():
     columns = [col[1] for col in c.fetchall()]
     conn.close()
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     
     if 'price' in columns:
@@ -659,7 +952,7 @@ def get_total_revenue():
     return result if result else 0
 
 def get_total_orders_count():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('SELECT COUNT(*) FROM orders')
     result = c.fetchone()[0]
@@ -667,7 +960,7 @@ def get_total_orders_count():
     return result
 
 def get_total_tickets_count():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('SELECT COUNT(*) FROM tickets')
     result = c.fetchone()[0]
@@ -675,7 +968,7 @@ def get_total_tickets_count():
     return result
 
 def get_total_messages():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute("SELECT COUNT(*) FROM tickets")
     count = c.fetchone()[0]
@@ -683,7 +976,7 @@ def get_total_messages():
     return count
 
 def get_pending_messages():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute("SELECT COUNT(*) FROM tickets WHERE status = 'Pending'")
     count = c.fetchone()[0]
@@ -691,7 +984,7 @@ def get_pending_messages():
     return count
 
 def get_resolved_messages():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute("SELECT COUNT(*) FROM tickets WHERE status = 'closed'")
     count = c.fetchone()[0]
@@ -699,7 +992,7 @@ def get_resolved_messages():
     return count
 
 def get_all_tickets(filter_status=None):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     if filter_status:
@@ -711,7 +1004,7 @@ def get_all_tickets(filter_status=None):
     return tickets
 
 def get_messages_for_ticket(ticket_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute("SELECT * FROM messages WHERE ticket_id = ? ORDER BY created_at ASC", (ticket_id,))
@@ -720,21 +1013,21 @@ def get_messages_for_ticket(ticket_id):
     return messages
 
 def close_ticket(ticket_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE tickets SET status = ? WHERE id = ?', ('closed', ticket_id))
     conn.commit()
     conn.close()
 
 def update_feedback_photo_path(feedback_id, photo_path):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE feedback SET photo_path = ? WHERE id = ?', (photo_path, feedback_id))
     conn.commit()
     conn.close()
 
 def update_ticket_attachment_path(ticket_id, attachment_path):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('UPDATE tickets SET attachment_path = ? WHERE id = ?', (attachment_path, ticket_id))
     conn.commit()
@@ -742,7 +1035,7 @@ def update_ticket_attachment_path(ticket_id, attachment_path):
 
 def get_users_for_notification(notification_type='notify_alerts'):
     """Returns list of telegram_ids for users who have opted in for the specific notification type."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     
     valid_types = ['notify_orders', 'notify_products', 'notify_alerts']
@@ -755,10 +1048,45 @@ def get_users_for_notification(notification_type='notify_alerts'):
     conn.close()
     return [user[0] for user in users if user[0]]
 
-def update_notification_preferences(telegram_id, notify_orders=None, notify_products=None, notify_alerts=None):
-    conn = sqlite3.connect(DB_PATH)
+def get_users_for_notification_by_language(notification_type='notify_alerts', after=None, limit=None):
+    """Returns {language: [telegram_id, ...]} for opted-in users, grouped by language in a single query.
+
+    `after` is a (language, telegram_id) cursor and `limit` a page size, so large
+    audiences can be walked in batches in a stable order.
+    """
+    conn = connect(DB_PATH)
     c = conn.cursor()
-    
+
+    valid_types = ['notify_orders', 'notify_products', 'notify_alerts']
+    if notification_type not in valid_types:
+        notification_type = 'notify_alerts'
+
+    query = (
+        f"SELECT COALESCE(language, 'en') AS lang, telegram_id FROM customers "
+        f"WHERE {notification_type} = 1 AND status != 'Deleted' AND telegram_id IS NOT NULL"
+    )
+    params = []
+    if after:
+        query += " AND (COALESCE(language, 'en') > ? OR (COALESCE(language, 'en') = ? AND telegram_id > ?))"
+        params.extend([after[0], after[0], after[1]])
+    query += " ORDER BY lang, telegram_id"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    c.execute(query, params)
+    groups = {}
+    for lang, telegram_id in c.fetchall():
+        groups.setdefault(lang, []).append(telegram_id)
+    conn.close()
+    return groups
+
+def update_notification_preferences(telegram_id, notify_orders=None, notify_products=None, notify_alerts=None):
+    _write(_update_notification_preferences, telegram_id, notify_orders, notify_products, notify_alerts)
+
+async def update_notification_preferences_async(telegram_id, notify_orders=None, notify_products=None, notify_alerts=None):
+    await writer.run(_update_notification_preferences, telegram_id, notify_orders, notify_products, notify_alerts)
+
+def _update_notification_preferences(c, telegram_id, notify_orders, notify_products, notify_alerts):
     updates = []
     params = []
     
@@ -776,11 +1104,9 @@ def update_notification_preferences(telegram_id, notify_orders=None, notify_prod
         params.append(telegram_id)
         query = f"UPDATE customers SET {', '.join(updates)} WHERE telegram_id = ?"
         c.execute(query, params)
-        conn.commit()
-    conn.close()
 
 def get_top_selling_products(limit=5):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     c.execute('''
         SELECT product_name, SUM(quantity) as total_qty 
@@ -795,7 +1121,7 @@ def get_top_selling_products(limit=5):
     return results
 
 def get_recent_sales_trend(days=7):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     c = conn.cursor()
     # SQLite doesn't have great date interval syntax by default, need to be careful
     c.execute(f"SELECT date(created_at) as day, COUNT(*) as count, SUM(price) as revenue FROM orders WHERE status != 'Rejected' AND status != 'cancel' AND created_at >= date('now', '-{days} days') GROUP BY day ORDER BY day ASC")
@@ -804,7 +1130,7 @@ def get_recent_sales_trend(days=7):
     return results
 
 def get_low_stock_products(threshold=5):
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('SELECT * FROM products WHERE stock <= ? ORDER BY stock ASC', (threshold,))
@@ -813,23 +1139,232 @@ def get_low_stock_products(threshold=5):
     return results
 
 def export_users_csv():
-    conn = sqlite3.connect(DB_PATH)
+    import pandas as pd
+    conn = connect(DB_PATH)
     try:
         df = pd.read_sql_query("SELECT * FROM customers", conn)
         return df.to_csv(index=False)
     except Exception as e:
-        logging.error(f"Error exporting users: {e}")
+        logging.error("Error exporting users: %s", e)
         return ""
     finally:
         conn.close()
 
 def export_orders_csv():
-    conn = sqlite3.connect(DB_PATH)
+    import pandas as pd
+    conn = connect(DB_PATH)
     try:
         df = pd.read_sql_query("SELECT * FROM orders", conn)
         return df.to_csv(index=False)
     except Exception as e:
-        logging.error(f"Error exporting orders: {e}")
+        logging.error("Error exporting orders: %s", e)
         return ""
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+# --- Broadcast Functions ---
+
+def create_broadcast(created_by, variants, default_lang, media, scheduled_at, notification_type='notify_alerts'):
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO broadcasts (created_by, variants, default_lang, media, notification_type, scheduled_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (created_by, json.dumps(variants), default_lang, json.dumps(media or []), notification_type,
+          scheduled_at.strftime("%Y-%m-%d %H:%M:%S")))
+    broadcast_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    return broadcast_id
+
+def get_broadcast(broadcast_id):
+    conn = connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute('SELECT * FROM broadcasts WHERE id = ?', (broadcast_id,))
+    broadcast = c.fetchone()
+    conn.close()
+    return broadcast
+
+def get_due_broadcasts(now=None):
+    """Returns broadcasts that are scheduled for now or earlier and not yet finished."""
+    now = now or datetime.now()
+    conn = connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute("SELECT * FROM broadcasts WHERE status IN ('Scheduled', 'Sending') AND scheduled_at <= ? ORDER BY scheduled_at",
+              (now.strftime("%Y-%m-%d %H:%M:%S"),))
+    broadcasts = c.fetchall()
+    conn.close()
+    return broadcasts
+
+def get_pending_broadcasts():
+    conn = connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute("SELECT * FROM broadcasts WHERE status IN ('Scheduled', 'Sending') ORDER BY scheduled_at")
+    broadcasts = c.fetchall()
+    conn.close()
+    return broadcasts
+
+def count_users_for_notification(notification_type='notify_alerts'):
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+
+    valid_types = ['notify_orders', 'notify_products', 'notify_alerts']
+    if notification_type not in valid_types:
+        notification_type = 'notify_alerts'
+
+    c.execute(f"SELECT COUNT(*) FROM customers WHERE {notification_type} = 1 AND status != 'Deleted' AND telegram_id IS NOT NULL")
+    count = c.fetchone()[0]
+    conn.close()
+    return count
+
+def update_broadcast_progress(broadcast_id, status, sent=0, failed=0, cursor=None, total_recipients=None):
+    """Adds a batch's sent/failed counts and moves the (language, telegram_id) cursor.
+
+    Returns False (and changes nothing) if the broadcast was cancelled in the meantime.
+    """
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    updates = ["status = ?", "sent_count = sent_count + ?", "failed_count = failed_count + ?"]
+    params = [status, sent, failed]
+    if cursor:
+        updates.append("cursor_lang = ?")
+        updates.append("cursor_telegram_id = ?")
+        params.extend(cursor)
+    if total_recipients is not None:
+        updates.append("total_recipients = ?")
+        params.append(total_recipients)
+    params.append(broadcast_id)
+    c.execute(f"UPDATE broadcasts SET {', '.join(updates)} WHERE id = ? AND status != 'Cancelled'", params)
+    updated = c.rowcount > 0
+    conn.commit()
+    conn.close()
+    return updated
+
+def get_broadcast_status(broadcast_id):
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute('SELECT status FROM broadcasts WHERE id = ?', (broadcast_id,))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def cancel_broadcast(broadcast_id):
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("UPDATE broadcasts SET status = 'Cancelled' WHERE id = ? AND status IN ('Scheduled', 'Sending')", (broadcast_id,))
+    cancelled = c.rowcount > 0
+    conn.commit()
+    conn.close()
+    return cancelled
+
+# --- Webhook Deduplication ---
+
+def get_seen_update_ids(capacity):
+    """Returns the persisted update_id ring, oldest first, dropping slots outside the current capacity."""
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("DELETE FROM seen_updates WHERE slot >= ?", (capacity,))
+    c.execute("SELECT update_id FROM seen_updates ORDER BY update_id")
+    update_ids = [row[0] for row in c.fetchall()]
+    conn.commit()
+    conn.close()
+    return update_ids
+
+def save_seen_update_ids(update_ids, capacity):
+    _write(_save_seen_update_ids, update_ids, capacity)
+
+async def save_seen_update_ids_async(update_ids, capacity):
+    await writer.run(_save_seen_update_ids, update_ids, capacity)
+
+def _save_seen_update_ids(c, update_ids, capacity):
+    c.executemany("INSERT OR REPLACE INTO seen_updates (slot, update_id) VALUES (?, ?)",
+                  [(update_id % capacity, update_id) for update_id in update_ids])
+
+# --- Bot Settings ---
+
+def get_bot_setting_hash(name):
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT value_hash FROM bot_settings WHERE name = ?", (name,))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def save_bot_setting_hash(name, value_hash):
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("INSERT OR REPLACE INTO bot_settings (name, value_hash, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+              (name, value_hash))
+    conn.commit()
+    conn.close()
+
+# --- Bot Persistence ---
+
+def load_persistence(kind):
+    """Returns {key: data} for one kind of persisted bot state, data still JSON encoded."""
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT key, data FROM bot_persistence WHERE kind = ?", (kind,))
+    rows = dict(c.fetchall())
+    conn.close()
+    return rows
+
+def load_persistence_row(kind, key):
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT data FROM bot_persistence WHERE kind = ? AND key = ?", (kind, key))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def get_persistence_seq():
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT COALESCE(MAX(seq), 0) FROM bot_persistence")
+    seq = c.fetchone()[0]
+    conn.close()
+    return seq
+
+def get_persistence_changes(after_seq, origin):
+    """Returns (kind, key, data, seq) rows written by other processes since after_seq."""
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT kind, key, data, seq FROM bot_persistence WHERE seq > ? AND origin IS NOT ? ORDER BY seq",
+              (after_seq, origin))
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def save_persistence(rows, origin=None):
+    """Writes a batch of (kind, key, data) rows in one transaction; data=None deletes the row.
+
+    Every batch gets the next change sequence number so other processes can pick up what changed.
+    """
+    conn = connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    _save_persistence(c, rows, origin)
+    conn.commit()
+    conn.close()
+
+async def save_persistence_async(rows, origin=None):
+    await writer.run(_save_persistence, rows, origin)
+
+def _save_persistence(c, rows, origin):
+    c.execute("INSERT INTO bot_persistence_batches (origin) VALUES (?)", (origin,))
+    seq = c.lastrowid
+    c.execute("DELETE FROM bot_persistence_batches WHERE seq < ?", (seq,))
+    c.executemany(
+        "INSERT OR REPLACE INTO bot_persistence (kind, key, data, updated_at, seq, origin) VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?, ?)",
+        [(kind, key, data, seq, origin) for kind, key, data in rows if data is not None]
+    )
+    c.executemany(
+        "DELETE FROM bot_persistence WHERE kind = ? AND key = ?",
+        [(kind, key) for kind, key, data in rows if data is None]
+    )
+
+# Time every public function above for /metrics
+instrument_functions(globals())
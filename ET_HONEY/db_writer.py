@@ -0,0 +1,113 @@
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+
+from .query_log import connect
+
+
+class DatabaseWriter:
+    """Runs database writes on one thread with one connection.
+
+    Operations are queued from any task or thread. The writer takes whatever
+    arrived within `commit_delay` seconds of the first one (up to `max_batch`)
+    and runs it as a single transaction, each operation inside its own
+    savepoint so one failing operation doesn't undo the others. Every caller
+    gets a future that resolves once its operation has been committed.
+    Because only this connection writes, handlers never race each other for
+    the write lock; reads keep using their own connections.
+    """
+
+    def __init__(self, db_path, commit_delay=0.002, max_batch=200):
+        self.db_path = db_path
+        self.commit_delay = commit_delay
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'operations': 0, 'failed': 0, 'transactions': 0, 'largest_batch': 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, operation, *args):
+        """Queues operation(cursor, *args); returns a concurrent.futures.Future with its result."""
+        self.start()
+        future = concurrent.futures.Future()
+        self._queue.put((operation, args, future))
+        return future
+
+    async def run(self, operation, *args):
+        """Queues operation(cursor, *args) and waits for it to be committed."""
+        return await asyncio.wrap_future(self.submit(operation, *args))
+
+    def stop(self, timeout=10):
+        """Commits everything queued so far, then stops the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        conn = connect(self.db_path, timeout=30, isolation_level=None)
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.commit_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(conn, batch)
+        conn.close()
+
+    def _commit(self, conn, batch):
+        c = conn.cursor()
+        outcomes = []
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            for operation, args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                c.execute("SAVEPOINT operation")
+                try:
+                    outcomes.append((future, operation(c, *args), None))
+                    c.execute("RELEASE operation")
+                except Exception as e:
+                    c.execute("ROLLBACK TO operation")
+                    c.execute("RELEASE operation")
+                    outcomes.append((future, None, e))
+            c.execute("COMMIT")
+        except Exception as e:
+            logging.error(f"Database write batch of {len(batch)} failed: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for operation, args, future in batch:
+                if future.running():
+                    future.set_exception(e)
+            self.stats['failed'] += len(batch)
+            return
+
+        self.stats['transactions'] += 1
+        self.stats['operations'] += len(outcomes)
+        self.stats['largest_batch'] = max(self.stats['largest_batch'], len(batch))
+        for future, result, error in outcomes:
+            if error is not None:
+                self.stats['failed'] += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
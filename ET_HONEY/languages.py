@@ -137,7 +137,9 @@ Contact our support team using the 📞 Contact Support button!""",
         'broadcast_msg_btn': "📢 Broadcast Message",
         'btn_export_users': "📥 Export Users",
         'subscribe_button': "📢 Subscribe to Channel",
-        'subscribe_message': "Join our social media channels for the latest updates! 👇"
+        'subscribe_message': "Join our social media channels for the latest updates! 👇",
+        'language_name': "English",
+        'broadcast_header': "📢 *Announcement*"
     },
     'am': {
         'welcome': "እንኳን ወደ ኢትዮ ማር ንግድ በደህና መጡ! እባክዎ አማራጭ ይምረጡ:",
@@ -276,7 +278,9 @@ Contact our support team using the 📞 Contact Support button!""",
         'broadcast_msg_btn': "📢 የብሮድካስት መልእክት",
         'btn_export_users': "📥 ተጠቃሚዎችን ላክ (Export)",
         'subscribe_button': "📢 ቻናላችንን ይቀላቀሉ (Subscribe)",
-        'subscribe_message': "በቅርብ መረጃዎችን ለማግኘት የማህበራዊ ሚዲያ ገጾቻችንን ይቀላቀሉ! 👇"
+        'subscribe_message': "በቅርብ መረጃዎችን ለማግኘት የማህበራዊ ሚዲያ ገጾቻችንን ይቀላቀሉ! 👇",
+        'language_name': "አማርኛ",
+        'broadcast_header': "📢 *ማስታወቂያ*"
     }
 }
 
@@ -0,0 +1,173 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from .tracing import current_span
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_FILE = os.getenv("LOG_FILE")
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", 20))
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", 60))
+# %(update)s is "[<update id>] " while an update is processed, empty otherwise
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(update)s%(message)s'
+
+# Id of the update being processed; set by the update workers and added to every log record
+correlation_id = ContextVar('correlation_id', default=None)
+_listener = None
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() formats the message on the calling thread (the event
+    loop); records here only travel to a thread in the same process, so args
+    and exc_info can be passed along as they are.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class CorrelationFilter(logging.Filter):
+    """Stamps records with the current update id and trace id (when the update is traced)."""
+
+    def filter(self, record):
+        update_id = correlation_id.get()
+        record.update_id = update_id if update_id is not None else '-'
+        span = current_span.get()
+        record.trace_id = span.trace.trace_id if span is not None else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through at most `burst` DEBUG/INFO records per message template and `window` seconds.
+
+    Templates are the unformatted messages (record.msg), so this only groups
+    calls that pass their values as arguments. The first record after a
+    window that dropped some carries the count in record.suppressed.
+    Warnings and errors are never dropped.
+    """
+
+    def __init__(self, burst, window):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.levelno, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None or now - counts[0] >= self.window:
+                if len(self._counts) > 10000:
+                    self._counts.clear()
+                suppressed = counts[2] if counts is not None else 0
+                self._counts[key] = [now, 1, 0]
+            elif counts[1] < self.burst:
+                counts[1] += 1
+                suppressed = 0
+            else:
+                counts[2] += 1
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, update/trace ids and exception."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        update_id = getattr(record, 'update_id', '-')
+        if update_id != '-':
+            entry['update_id'] = update_id
+        if getattr(record, 'trace_id', None):
+            entry['trace_id'] = record.trace_id
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record):
+        update_id = getattr(record, 'update_id', '-')
+        record.update = f"[{update_id}] " if update_id != '-' else ""
+        text = super().format(record)
+        if getattr(record, 'suppressed', 0):
+            text += f" ({record.suppressed} similar messages suppressed)"
+        return text
+
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, log_file=LOG_FILE,
+                  sample_burst=LOG_SAMPLE_BURST, sample_window=LOG_SAMPLE_WINDOW, stream=True):
+    """Configures the root logger to hand records to a background thread that formats and writes them.
+
+    Only the first call installs the handlers (until stop_logging()).
+    """
+    global _listener
+    if _listener is not None:
+        return
+    formatter = JsonFormatter() if log_format == "json" else _TextFormatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()] if stream else []
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        handlers.append(RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    if sample_burst > 0:
+        queue_handler.addFilter(SamplingFilter(sample_burst, sample_window))
+    queue_handler.addFilter(CorrelationFilter())
+
+    # Neither format shows the caller, thread or process; skip collecting them for every record
+    # (findCaller() alone walks the stack on each call). See "Optimization" in the logging HOWTO.
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    # httpx logs every Bot API request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Writes out queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        for handler in list(logging.getLogger().handlers):
+            if isinstance(handler, _DeferredQueueHandler):
+                logging.getLogger().removeHandler(handler)
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,241 @@
+import functools
+import inspect
+import os
+import tempfile
+import time
+
+from telegram.ext import ConversationHandler
+
+from . import perf
+from .profiling import handler_names
+from .tracing import end_span, start_span
+
+# prometheus_client is optional: without it only the in-memory /perf buffers are
+# filled and /metrics answers 503.
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+    from prometheus_client import multiprocess
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    REGISTRY = None
+
+ENABLED = REGISTRY is not None
+
+if ENABLED:
+    HANDLER_SECONDS = Histogram(
+        "bot_handler_seconds", "Time spent in update handler callbacks", ["handler"],
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    )
+    HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handler callbacks that raised", ["handler"])
+    DB_SECONDS = Histogram(
+        "bot_db_seconds", "Time spent in database.py functions", ["function"],
+        buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+    )
+    DB_ERRORS = Counter("bot_db_errors_total", "database.py calls that raised", ["function"])
+    BOT_API_SECONDS = Histogram(
+        "bot_api_request_seconds", "Bot API request latency", ["method"],
+        buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    )
+    BOT_API_ERRORS = Counter("bot_api_errors_total", "Failed Bot API requests", ["method", "code"])
+    BROADCAST_MESSAGES = Counter("bot_broadcast_messages_total", "Broadcast deliveries", ["result"])
+    BROADCAST_BATCHES = Counter("bot_broadcast_batches_total", "Broadcast batches sent")
+    BROADCASTS_FINISHED = Counter("bot_broadcasts_finished_total", "Broadcasts that finished sending")
+
+
+def render(registry=None):
+    """Returns (body, content type) for the /metrics endpoint."""
+    return generate_latest(registry or REGISTRY), CONTENT_TYPE_LATEST
+
+
+def prepare_multiprocess_dir():
+    """Points the worker processes at a shared PROMETHEUS_MULTIPROC_DIR, emptied of an earlier run's files.
+
+    Must run before the workers start: prometheus_client picks its value
+    storage when it is imported.
+    """
+    path = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "et_honey_prometheus"))
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+    return path
+
+
+def multiprocess_registry():
+    """Registry that sums the counters and histograms all worker processes wrote to PROMETHEUS_MULTIPROC_DIR."""
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def worker_exited(pid):
+    """Drops the live gauge files of a worker process that exited; its counters and histograms stay counted."""
+    if ENABLED and os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+def instrument_callback(callback, name):
+    """Wraps a handler callback so its duration and failures are recorded under `name`."""
+    histogram = HANDLER_SECONDS.labels(name) if ENABLED else None
+    errors = HANDLER_ERRORS.labels(name) if ENABLED else None
+    ring = perf.handlers
+
+    @functools.wraps(callback)
+    async def timed(update, context):
+        started = time.perf_counter()
+        ring.in_flight += 1
+        names = handler_names.get()
+        if names is not None:
+            names.append(name)  # for the update profiler
+        span = start_span(name)
+        error = None
+        try:
+            return await callback(update, context)
+        except Exception as e:
+            error = e
+            if errors is not None:
+                errors.inc()
+            raise
+        finally:
+            if span is not None:
+                end_span(span, error)
+            ring.in_flight -= 1
+            duration = time.perf_counter() - started
+            ring.record(name, started, duration)
+            if histogram is not None:
+                histogram.observe(duration)
+
+    return timed
+
+
+def _handlers(handlers):
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from _handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                yield from _handlers(state_handlers)
+            yield from _handlers(handler.fallbacks)
+        else:
+            yield handler
+
+
+def instrument_application(application):
+    """Times every handler callback of the application, including those inside ConversationHandlers."""
+    wrapped = {}
+    for group in application.handlers.values():
+        for handler in _handlers(group):
+            callback = handler.callback
+            if callback in wrapped.values() or not inspect.iscoroutinefunction(callback):
+                continue
+            # The same callback is often registered in several handlers; wrap it once
+            if callback not in wrapped:
+                wrapped[callback] = instrument_callback(callback, callback.__name__)
+            handler.callback = wrapped[callback]
+
+
+def instrument_functions(namespace):
+    """Replaces the public functions in a module namespace (globals()) with timed versions.
+
+    Functions are looked up through the module globals at call time, so calls
+    inside the module are timed too.
+    """
+    for name, function in list(namespace.items()):
+        if name.startswith('_') or not inspect.isfunction(function) or function.__module__ != namespace['__name__']:
+            continue
+        namespace[name] = _timed_function(function)
+
+
+def _timed_function(function):
+    name = function.__name__
+    histogram = DB_SECONDS.labels(name) if ENABLED else None
+    errors = DB_ERRORS.labels(name) if ENABLED else None
+    ring = perf.queries
+
+    span_name = f"db.{name}"
+
+    def done(started, span, error):
+        if span is not None:
+            end_span(span, error)
+        duration = time.perf_counter() - started
+        ring.record(name, started, duration)
+        if histogram is not None:
+            histogram.observe(duration)
+            if error is not None:
+                errors.inc()
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def timed(*args, **kwargs):
+            span = start_span(span_name)
+            started = time.perf_counter()
+            error = None
+            try:
+                return await function(*args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                done(started, span, error)
+    else:
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            span = start_span(span_name)
+            started = time.perf_counter()
+            error = None
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                done(started, span, error)
+    return timed
+
+
+def observe_bot_api(method, seconds, code):
+    if ENABLED:
+        BOT_API_SECONDS.labels(method).observe(seconds)
+        if code is not None and not 200 <= code < 300:
+            BOT_API_ERRORS.labels(method, str(code)).inc()
+
+
+def bot_api_failed(method, error):
+    """Records a Bot API request that got no HTTP response at all (timeout, connection error)."""
+    if ENABLED:
+        BOT_API_ERRORS.labels(method, type(error).__name__).inc()
+
+
+def broadcast_progress(sent, failed, finished):
+    if ENABLED:
+        BROADCAST_MESSAGES.labels('sent').inc(sent)
+        BROADCAST_MESSAGES.labels('failed').inc(failed)
+        BROADCAST_BATCHES.inc()
+        if finished:
+            BROADCASTS_FINISHED.inc()
+
+
+class _GaugeCollector:
+    """Reads a dict of current values when /metrics is scraped, so nothing is recorded per update."""
+
+    def __init__(self, prefix, read):
+        self.prefix = prefix
+        self.read = read
+
+    def collect(self):
+        try:
+            values = self.read()
+        except Exception:
+            return
+        for name, value in values.items():
+            if isinstance(value, (int, float)):
+                yield GaugeMetricFamily(f"{self.prefix}_{name}", f"{self.prefix} {name}", value=value)
+
+    def describe(self):
+        return []
+
+
+def register_gauges(prefix, read, registry=None):
+    """Exports read() -> {name: number} as gauges named <prefix>_<name>."""
+    if ENABLED:
+        (registry or REGISTRY).register(_GaugeCollector(prefix, read))
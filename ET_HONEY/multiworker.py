@@ -0,0 +1,254 @@
+"""Multi-process mode.
+
+One front process receives the webhooks and hands every update to one of
+BOT_WORKERS worker processes. The worker is picked from the chat id, so all
+updates of a chat go to the same process: they stay in order and the chat's
+conversation state never has to move between processes. Workers share the
+SQLite persistence (user_data written by one worker is picked up by the
+others) and only worker 0 runs bot setup and the broadcast job.
+
+Workers keep their Prometheus counters and histograms in files under
+PROMETHEUS_MULTIPROC_DIR, and the front process's /metrics sums them. The
+update queue, cache and writer gauges of a single-process bot live in each
+worker's memory and are not exported here; the front exports how many
+workers are alive and how many updates wait in their queues instead.
+
+Run with: python -m ET_HONEY.multiworker
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import uvicorn
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request, Response
+from telegram import Bot, Update
+
+from . import database, metrics
+from .bot_setup import apply_bot_setting
+from .log_config import setup_logging, stop_logging
+from .request import loads, BOT_API_BASE_URL, BOT_API_BASE_FILE_URL
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+load_dotenv(dotenv_path=Path(__file__).parent / '.env')
+
+setup_logging()
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", os.cpu_count() or 2))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", 1000))
+
+workers = []  # [process, queue] per worker index
+_stopping = False
+_registry = None  # the front's /metrics registry: worker metrics from PROMETHEUS_MULTIPROC_DIR
+
+
+def route_key(payload):
+    """Returns the chat id an update belongs to (the user id for updates without a chat)."""
+    for value in payload.values():
+        if not isinstance(value, dict):
+            continue
+        # Messages carry their chat; callback queries carry it in the message they belong to
+        for holder in (value, value.get('message')):
+            if isinstance(holder, dict) and isinstance(holder.get('chat'), dict):
+                return holder['chat']['id']
+        user = value.get('from') or value.get('user')
+        if isinstance(user, dict):
+            return user['id']
+    return payload.get('update_id', 0)
+
+
+def worker_for(payload, count):
+    return route_key(payload) % count
+
+
+async def consume(application, pool, updates):
+    """Moves raw updates from the process queue into the worker pool until a None arrives."""
+    loop = asyncio.get_running_loop()
+    while True:
+        # Leave updates in the shared queue while we are busy, so the front sees the backpressure
+        while pool.full():
+            await asyncio.sleep(0.01)
+        payload = await loop.run_in_executor(None, updates.get)
+        if payload is None:
+            return
+        try:
+            update = Update.de_json(loads(payload), application.bot)
+        except Exception as e:
+            logging.error(f"Invalid update payload: {e}")
+            continue
+        pool.put(update)
+
+
+async def _serve(bot_module, updates):
+    application = bot_module.build_application(os.getenv("BOT_TOKEN"))
+    async with application:
+        await application.post_init(application)
+        await application.start()
+        pool = bot_module.build_update_pool(application)
+        pool.start()
+        await consume(application, pool, updates)
+        await pool.stop(timeout=int(os.getenv("UPDATE_DRAIN_SECONDS", 30)))
+        await application.stop()
+        database.writer.stop()
+    await application.post_shutdown(application)
+
+
+def run_worker(index, count, updates):
+    """Entry point of a worker process."""
+    # Ctrl+C reaches the whole process group; the front process shuts workers down in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ["BOT_WORKER_INDEX"] = str(index)
+    os.environ["BOT_WORKER_COUNT"] = str(count)
+    from . import bot
+    logging.info(f"Bot worker {index}/{count} started (pid {os.getpid()})")
+    run = uvloop.run if uvloop is not None and os.getenv("UVLOOP", "1") != "0" else asyncio.run
+    try:
+        run(_serve(bot, updates))
+    finally:
+        # Worker processes exit without running atexit hooks
+        stop_logging()
+
+
+def _queue_depth(updates):
+    try:
+        return updates.qsize()
+    except NotImplementedError:  # macOS
+        return None
+
+
+def _worker_gauges():
+    depths = [_queue_depth(updates) for process, updates in workers]
+    return {
+        'alive': sum(process.is_alive() for process, updates in workers),
+        'queued': sum(depth for depth in depths if depth is not None),
+    }
+
+
+def _start_worker(context, index, updates):
+    process = context.Process(target=run_worker, args=(index, BOT_WORKERS, updates), name=f"bot-worker-{index}")
+    process.start()
+    return process
+
+
+async def _supervise(context):
+    """Restarts workers that died; their queued updates are still waiting for them."""
+    while not _stopping:
+        await asyncio.sleep(5)
+        for index, (process, updates) in enumerate(workers):
+            if not process.is_alive() and not _stopping:
+                logging.error(f"Bot worker {index} exited with code {process.exitcode}, restarting")
+                metrics.worker_exited(process.pid)
+                workers[index][0] = _start_worker(context, index, updates)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _stopping, _registry
+    token = os.getenv("BOT_TOKEN")
+    if not token:
+        logging.error("BOT_TOKEN is not set in environment variables")
+        yield
+        return
+
+    # Create/migrate the schema once, before the workers open the database
+    database.init_db()
+    if metrics.ENABLED:
+        # The spawned workers inherit the directory through the environment
+        metrics_dir = metrics.prepare_multiprocess_dir()
+        _registry = metrics.multiprocess_registry()
+        metrics.register_gauges("bot_workers", _worker_gauges, _registry)
+        logging.info(f"Worker metrics are collected in {metrics_dir}")
+    context = multiprocessing.get_context("spawn")
+    for index in range(BOT_WORKERS):
+        updates = context.Queue(maxsize=WORKER_QUEUE_SIZE)
+        workers.append([_start_worker(context, index, updates), updates])
+    supervisor = asyncio.create_task(_supervise(context))
+
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if webhook_url:
+        bot = Bot(token, base_url=BOT_API_BASE_URL, base_file_url=BOT_API_BASE_FILE_URL)
+        webhook = {'url': f"{webhook_url}/webhook", 'secret_token': os.getenv("WEBHOOK_SECRET")}
+
+        async def set_webhook():
+            async with bot:
+                await bot.set_webhook(**webhook)
+
+        if await apply_bot_setting(bot, 'webhook', webhook, set_webhook):
+            logging.info(f"Webhook set to {webhook_url}/webhook ({BOT_WORKERS} workers)")
+    else:
+        logging.warning("WEBHOOK_URL not set in environment variables. Webhook not configured.")
+
+    yield
+
+    _stopping = True
+    supervisor.cancel()
+    for process, updates in workers:
+        updates.put(None)
+    timeout = int(os.getenv("UPDATE_DRAIN_SECONDS", 30)) + 10
+    for process, updates in workers:
+        await asyncio.get_running_loop().run_in_executor(None, process.join, timeout)
+        if process.is_alive():
+            logging.warning(f"{process.name} did not stop in time, terminating")
+            process.terminate()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.post("/webhook")
+async def webhook(request: Request):
+    """Validates the update and hands it to the worker that owns its chat."""
+    if not workers:
+        return Response(content="Application not initialized", status_code=503)
+
+    webhook_secret = os.getenv("WEBHOOK_SECRET")
+    if webhook_secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != webhook_secret:
+        return Response(status_code=403)
+
+    body = await request.body()
+    try:
+        index = worker_for(loads(body), len(workers))
+    except Exception as e:
+        logging.error(f"Invalid webhook payload: {e}")
+        return Response(status_code=400)
+
+    try:
+        workers[index][1].put_nowait(body)
+    except queue.Full:
+        # That worker is behind: Telegram will redeliver the update later
+        return Response(content="Update queue full", status_code=503)
+    return Response(status_code=200)
+
+
+@app.get("/")
+async def index():
+    """Health check endpoint."""
+    status = [{"pid": process.pid, "alive": process.is_alive(), "queued": _queue_depth(updates)}
+              for process, updates in workers]
+    return {"status": "ok", "bot": "ET HONEY Trading Bot", "workers": status}
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics summed over the worker processes, plus worker liveness and queue depth."""
+    if not metrics.ENABLED:
+        return Response(content="prometheus_client is not installed", status_code=503)
+    if _registry is None:
+        return Response(content="Application not initialized", status_code=503)
+    # Collecting reads every worker's metric files; keep that off the event loop
+    body, content_type = await asyncio.get_running_loop().run_in_executor(None, metrics.render, _registry)
+    return Response(content=body, media_type=content_type)
+
+
+if __name__ == '__main__':
+    loop = "asyncio" if os.getenv("UVLOOP", "1") == "0" else "auto"
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 10000)), reload=False, loop=loop)
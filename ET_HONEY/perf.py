@@ -0,0 +1,96 @@
+import os
+import time
+from collections import deque
+
+PERF_SAMPLES = int(os.getenv("PERF_SAMPLES", 10000))
+WINDOWS = (60, 300, 900)
+
+
+class LatencyRing:
+    """Recent timings of one kind of operation, kept in memory for /perf.
+
+    The last `size` samples (start, duration, name) are kept for percentiles
+    and the slowest names; completions are also counted per second over the
+    longest window, so throughput stays exact even when more operations ran
+    than the sample buffer holds. Recording is an append and a counter bump.
+    """
+
+    def __init__(self, size=PERF_SAMPLES, window=max(WINDOWS)):
+        self.samples = deque(maxlen=size)
+        self.window = window
+        self._seconds = [0] * window
+        self._counts = [0] * window
+        self.in_flight = 0
+
+    def record(self, name, started, duration):
+        """Records one operation; `started` is a time.perf_counter() value."""
+        self.samples.append((started, duration, name))
+        second = int(started + duration)
+        slot = second % self.window
+        if self._seconds[slot] != second:
+            self._seconds[slot] = second
+            self._counts[slot] = 0
+        self._counts[slot] += 1
+
+    def throughput(self, seconds):
+        """Operations per second over the last `seconds` (at most the window length)."""
+        now = int(time.perf_counter())
+        total = sum(count for second, count in zip(self._seconds, self._counts) if now - seconds < second <= now)
+        return total / seconds
+
+    def percentiles(self, quantiles=(50, 95, 99)):
+        durations = sorted(duration for started, duration, name in list(self.samples))
+        return {q: _percentile(durations, q) for q in quantiles}
+
+    def slowest(self, limit=5):
+        """[(name, calls, p95, max)] for the names with the highest p95 among the kept samples."""
+        by_name = {}
+        for started, duration, name in list(self.samples):
+            by_name.setdefault(name, []).append(duration)
+        rows = []
+        for name, durations in by_name.items():
+            durations.sort()
+            rows.append((name, len(durations), _percentile(durations, 95), durations[-1]))
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows[:limit]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q / 100))]
+
+
+# Filled in by the metrics.py wrappers around handler callbacks and database.py functions
+handlers = LatencyRing()
+queries = LatencyRing()
+
+
+def _ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.1f}ms"
+
+
+def report(extra=None):
+    """Plain-text performance summary for the /perf admin command."""
+    lines = ["📊 Performance (this process)"]
+    for title, ring in (("Handlers", handlers), ("Database", queries)):
+        p = ring.percentiles()
+        rates = " / ".join(f"{ring.throughput(window):.2f}" for window in WINDOWS)
+        lines.append("")
+        lines.append(f"{title}: {len(ring)} samples")
+        lines.append(f"  p50 {_ms(p[50])}  p95 {_ms(p[95])}  p99 {_ms(p[99])}")
+        lines.append(f"  per second (1/5/15 min): {rates}")
+        slowest = ring.slowest()
+        if slowest:
+            lines.append("  slowest (p95, max, calls):")
+            for name, calls, p95, worst in slowest:
+                lines.append(f"  • {name}: {_ms(p95)}, {_ms(worst)}, {calls}")
+
+    lines.append("")
+    lines.append(f"Concurrency: {handlers.in_flight} handlers running")
+    for name, value in (extra or {}).items():
+        lines.append(f"  {name}: {value}")
+    return "\n".join(lines)
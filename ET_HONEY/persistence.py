@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from . import database
+from .query_log import connect
+
+
+class SQLitePersistence(BasePersistence):
+    """Keeps conversation states, user_data, chat_data and bot_data in the bot database.
+
+    PTB hands over changed data every `update_interval` seconds. Those writes
+    are only buffered here (already JSON encoded, so later changes can't leak
+    in) and committed together in one transaction, by the database writer
+    thread, at most `flush_interval` seconds after the first buffered write.
+    flush() writes whatever is left on shutdown.
+
+    With shared=True several processes use the same tables. Before a handler
+    runs, user_data/chat_data written by another process since we last looked
+    is pulled in (PRAGMA data_version tells us cheaply whether anything was
+    committed at all; only then are the changed rows read, on a thread).
+    bot_data is not stored in that mode, since every process would overwrite
+    the others' copy.
+    """
+
+    def __init__(self, update_interval=5, flush_interval=1, shared=False):
+        store_data = PersistenceInput(bot_data=not shared, callback_data=False)
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.flush_interval = flush_interval
+        self.shared = shared
+        self.origin = str(os.getpid())
+        self._pending = {}
+        self._flush_task = None
+        # Shared mode: keys this process holds in memory and newer copies written elsewhere
+        self._known = set()
+        self._remote = {}
+        self._last_seq = 0
+        self._data_version = None
+        self._watch_conn = None
+        self._poll_lock = asyncio.Lock()
+        self.stats = {'buffered': 0, 'written': 0, 'flushes': 0, 'flush_ms': 0.0}
+
+    # --- Loading (called once while the application initializes) ---
+
+    def _load(self, kind):
+        return {key: json.loads(data) for key, data in database.load_persistence(kind).items()}
+
+    async def get_user_data(self):
+        if self.shared:
+            # Changes made after this point are picked up by _poll_changes()
+            self._last_seq = database.get_persistence_seq()
+            self._watch_conn = connect(database.DB_PATH)
+            self._data_version = self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+        user_data = self._load('user_data')
+        self._known.update(('user_data', key) for key in user_data)
+        return {int(key): data for key, data in user_data.items()}
+
+    async def get_chat_data(self):
+        chat_data = self._load('chat_data')
+        self._known.update(('chat_data', key) for key in chat_data)
+        return {int(key): data for key, data in chat_data.items()}
+
+    async def get_bot_data(self):
+        return self._load('bot_data').get('', {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {tuple(json.loads(key)): state for key, state in self._load(f"conversation:{name}").items()}
+
+    # --- Write-behind buffer ---
+
+    def _buffer(self, kind, key, data):
+        self._pending[(kind, str(key))] = None if data is None else json.dumps(data)
+        self._known.add((kind, str(key)))
+        self.stats['buffered'] += 1
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        # Writes that arrive while a batch is being written go out in the next round
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            pending, self._pending = self._pending, {}
+            started = time.perf_counter()
+            write = asyncio.ensure_future(database.save_persistence_async(self._rows(pending), self.origin))
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # flush() on shutdown: let the batch the writer already has land before the rest is written
+                await asyncio.wait([write])
+                if write.exception() is not None:
+                    self._write_failed(pending, write.exception())
+                raise
+            except Exception as e:
+                self._write_failed(pending, e)
+                continue
+            self._written(pending, started)
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        started = time.perf_counter()
+        try:
+            database.save_persistence(self._rows(pending), self.origin)
+        except Exception as e:
+            self._write_failed(pending, e)
+            return
+        self._written(pending, started)
+
+    @staticmethod
+    def _rows(pending):
+        return [(kind, key, data) for (kind, key), data in pending.items()]
+
+    def _write_failed(self, pending, error):
+        logging.error("Error writing bot persistence: %s", error)
+        # Keep the rows for the next flush unless newer data arrived meanwhile
+        for item, data in pending.items():
+            self._pending.setdefault(item, data)
+
+    def _written(self, pending, started):
+        self.stats['written'] += len(pending)
+        self.stats['flushes'] += 1
+        self.stats['flush_ms'] += (time.perf_counter() - started) * 1000
+
+    async def update_user_data(self, user_id, data):
+        self._buffer('user_data', user_id, data)
+
+    async def update_chat_data(self, chat_id, data):
+        self._buffer('chat_data', chat_id, data)
+
+    async def update_bot_data(self, data):
+        self._buffer('bot_data', '', data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name, key, new_state):
+        self._buffer(f"conversation:{name}", json.dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id):
+        self._buffer('user_data', user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        self._buffer('chat_data', chat_id, None)
+
+    # --- Shared mode: pick up data written by other processes ---
+
+    async def _poll_changes(self):
+        # The lock keeps a second update from taking the new data_version as read while the rows are still loading
+        async with self._poll_lock:
+            version = self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return
+            changes = await asyncio.to_thread(database.get_persistence_changes, self._last_seq, self.origin)
+            self._data_version = version
+            for kind, key, data, seq in changes:
+                self._last_seq = max(self._last_seq, seq)
+                if kind in ('user_data', 'chat_data') and (kind, key) in self._known:
+                    self._remote[(kind, key)] = data
+
+    async def _refresh(self, kind, key, data):
+        if not self.shared or self._watch_conn is None:
+            return
+        item = (kind, str(key))
+        try:
+            await self._poll_changes()
+            if item in self._known:
+                stored = self._remote.pop(item, None)
+            else:
+                # First time this process sees the key: another process may already have data for it
+                self._known.add(item)
+                stored = await asyncio.to_thread(database.load_persistence_row, kind, str(key))
+        except Exception as e:
+            logging.error("Error refreshing bot persistence: %s", e)
+            return
+        if stored is not None:
+            data.clear()
+            data.update(json.loads(stored))
+
+    async def refresh_user_data(self, user_id, user_data):
+        await self._refresh('user_data', user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        await self._refresh('chat_data', chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        # Shutdown: the writer thread may already be stopped, so write directly
+        self._write_pending()
+        if self._watch_conn is not None:
+            self._watch_conn.close()
+            self._watch_conn = None
+        logging.info(f"Bot persistence flushed ({self.stats['written']} rows in {self.stats['flushes']} batches)")
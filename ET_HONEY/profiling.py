@@ -0,0 +1,221 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+# Names of the handler callbacks that ran for the current update (appended by the metrics.py wrapper)
+handler_names = ContextVar('handler_names', default=None)
+
+
+class UpdateProfiler:
+    """Opt-in profiling of update dispatch.
+
+    A random `sample_rate` share of updates runs under cProfile. Every update
+    still running after `slow_ms` gets stack samples from then until it
+    finishes: the event loop thread's stack (what blocks the loop) and the
+    update task's await chain (what it is waiting for). Reports go to
+    `directory`, which is trimmed to the newest `max_files` files.
+
+    cProfile sees the whole thread, so a sampled profile also contains other
+    updates that ran in between; only one runs at a time. Slow updates are
+    found by a watchdog thread that checks the running updates a few times
+    per threshold (a thread, so it also notices while the loop is blocked),
+    so updates that are neither sampled nor slow only cost a random() call
+    and a dict entry.
+    """
+
+    def __init__(self, directory="profiles", sample_rate=0.0, slow_ms=0, max_files=50, interval=0.005):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow = slow_ms / 1000 if slow_ms else None
+        self.max_files = max_files
+        self.interval = interval
+        self._profiling = False
+        self._running = {}
+        self._watchdog = None
+        self._stopping = threading.Event()
+        self._loop = None
+        self._loop_thread = None
+        self.stats = {'profiled': 0, 'slow': 0, 'written': 0}
+
+    @classmethod
+    def from_env(cls):
+        """Returns a profiler configured from PROFILE_* settings, or None when profiling is off."""
+        sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+        slow_ms = float(os.getenv("PROFILE_SLOW_MS", 0))
+        if sample_rate <= 0 and slow_ms <= 0:
+            return None
+        logging.info(f"Profiling {sample_rate:.1%} of updates and updates slower than {slow_ms:g}ms")
+        return cls(
+            directory=os.getenv("PROFILE_DIR", "profiles"),
+            sample_rate=sample_rate,
+            slow_ms=slow_ms,
+            max_files=int(os.getenv("PROFILE_MAX_FILES", 50)),
+        )
+
+    async def run(self, update, coroutine):
+        """Awaits the dispatch coroutine of one update, profiling it if it is sampled or slow."""
+        names = []
+        handler_names.set(names)
+        profile = None
+        if self.sample_rate and not self._profiling and random.random() < self.sample_rate:
+            self._profiling = True
+            profile = cProfile.Profile()
+        started = time.perf_counter()
+        samplers = []
+        if self.slow is not None:
+            if self._watchdog is None:
+                self._loop = asyncio.get_running_loop()
+                self._loop_thread = threading.get_ident()
+                self._stopping.clear()
+                self._watchdog = threading.Thread(target=self._watch, name="update-profiler-watchdog", daemon=True)
+                self._watchdog.start()
+            self._running[update.update_id] = (started, asyncio.current_task(), samplers)
+        try:
+            if profile is not None:
+                profile.enable()
+            return await coroutine
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+            elapsed = time.perf_counter() - started
+            self._running.pop(update.update_id, None)
+            for sampler in samplers:
+                sampler.stop()
+            if profile is not None:
+                self.stats['profiled'] += 1
+                await self._write(update, names, elapsed, 'sampled', _profile_text(profile))
+            if samplers:
+                self.stats['slow'] += 1
+                await self._write(update, names, elapsed, 'slow', samplers[0].report())
+
+    def _watch(self):
+        """Starts stack sampling for updates that have been running longer than the threshold."""
+        while not self._stopping.wait(self.slow / 4):
+            deadline = time.perf_counter() - self.slow
+            for started, task, samplers in list(self._running.values()):
+                if started <= deadline and not samplers:
+                    sampler = _StackSampler(task, self.interval, self._loop, self._loop_thread)
+                    samplers.append(sampler)
+                    sampler.start()
+
+    async def stop(self):
+        if self._watchdog is not None:
+            self._stopping.set()
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _write(self, update, names, elapsed, kind, body):
+        try:
+            await asyncio.to_thread(self._write_file, update, names, elapsed, kind, body)
+        except Exception as e:
+            logging.error(f"Could not write update profile: {e}")
+
+    def _write_file(self, update, names, elapsed, kind, body):
+        update_type = next((key for key in update.to_dict() if key != 'update_id'), 'unknown')
+        handler = "+".join(dict.fromkeys(names)) or "no_handler"
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = f"{time.strftime('%Y%m%d_%H%M%S')}_{update.update_id}_{kind}_{handler[:60]}_{elapsed * 1000:.0f}ms.txt"
+        header = (
+            f"update {update.update_id} ({update_type}), handlers: {handler}\n"
+            f"{kind}, {elapsed * 1000:.1f}ms\n\n"
+        )
+        with open(os.path.join(self.directory, file_name), "w", encoding="utf-8") as f:
+            f.write(header + body)
+        self.stats['written'] += 1
+        self._trim()
+
+    def _trim(self):
+        files = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file() and entry.name.endswith(".txt")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in files[:max(0, len(files) - self.max_files)]:
+            os.remove(entry.path)
+
+
+def _profile_text(profile, limit=40):
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
+
+
+class _StackSampler:
+    """Samples the event loop thread's stack and one task's await chain until stopped."""
+
+    def __init__(self, task, interval, loop, loop_thread):
+        self.task = task
+        self.interval = interval
+        self.loop = loop
+        self.loop_thread = loop_thread
+        self._stop = threading.Event()
+        self._thread = None
+        self._handle = None
+        self.loop_stacks = Counter()
+        self.await_stacks = Counter()
+
+    def start(self):
+        """Starts sampling; may be called from any thread."""
+        self._thread = threading.Thread(target=self._sample_loop_thread, name="update-profiler", daemon=True)
+        self._thread.start()
+        self.loop.call_soon_threadsafe(self._sample_task)
+
+    def stop(self):
+        self._stop.set()
+        if self._handle is not None:
+            self._handle.cancel()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _sample_loop_thread(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.loop_thread)
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            if frames:
+                self.loop_stacks[_fold(reversed(frames))] += 1
+
+    def _sample_task(self):
+        # Runs on the loop, so it only gets a turn while the loop isn't blocked
+        if self._stop.is_set() or self.task.done():
+            return
+        # Task.get_stack() stops at the outer coroutine; follow the await chain down instead
+        frames = []
+        awaitable = self.task.get_coro()
+        while awaitable is not None:
+            frame = getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'gi_frame', None)
+            if frame is None:
+                break
+            frames.append(frame)
+            awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None)
+        if frames:
+            self.await_stacks[_fold(frames)] += 1
+        self._handle = self.loop.call_later(self.interval, self._sample_task)
+
+    def report(self, limit=15):
+        lines = []
+        for title, stacks in (("Event loop thread (blocking work)", self.loop_stacks),
+                              ("Update task awaiting", self.await_stacks)):
+            total = sum(stacks.values())
+            lines.append(f"{title}: {total} samples")
+            for stack, count in stacks.most_common(limit):
+                lines.append(f"{count:5} {count / total:6.1%}  {stack}")
+            lines.append("")
+        return "\n".join(lines)
+
+
+def _fold(frames, depth=12):
+    """Collapses frames (outermost first) to "func (file:line) <- caller ...", innermost first, `depth` deep."""
+    return " <- ".join(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+                       for frame in list(frames)[::-1][:depth])
@@ -0,0 +1,277 @@
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", os.path.join("logs", "slow_queries.log"))
+MAX_STATEMENTS = 1000  # distinct statements tracked; the rest are counted under "(other)"
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+_lock = threading.Lock()
+_stats = {}
+_normalized = {}
+_logger = None
+_listener = None
+
+
+def connect(path, **kwargs):
+    """sqlite3.connect() returning a connection whose statements are all timed."""
+    connection = sqlite3.connect(path, factory=InstrumentedConnection, **kwargs)
+    connection.path = os.fspath(path)
+    return connection
+
+
+class _Query:
+    """The statement a cursor last ran, and the time spent on it so far."""
+    __slots__ = ('sql', 'statement', 'key', 'parameters', 'batch', 'duration', 'slow')
+
+    def __init__(self, sql, statement, key, parameters, batch, duration):
+        self.sql = sql
+        self.statement = statement
+        self.key = key
+        self.parameters = parameters
+        self.batch = batch
+        self.duration = duration
+        self.slow = False
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times execute()/executemany() and fetching their rows, and reports slow statements.
+
+    SQLite steps a SELECT lazily, so most of its work happens in the fetch
+    calls; their time is added to the statement the cursor last executed.
+    """
+
+    _query = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._query = _finished(self.connection, sql, parameters, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._query = _finished(self.connection, sql, seq_of_parameters[0] if seq_of_parameters else (),
+                                    started, batch=len(seq_of_parameters))
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _fetched(self, started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            _fetched(self, started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _fetched(self, started)
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            _fetched(self, started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including the ones conn.execute() creates) are InstrumentedCursors."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _normalize(sql):
+    statement = _normalized.get(sql)
+    if statement is None:
+        statement = " ".join(sql.split())
+        if len(_normalized) < MAX_STATEMENTS * 2:
+            _normalized[sql] = statement
+    return statement
+
+
+def _finished(connection, sql, parameters, started, batch=None):
+    duration = time.perf_counter() - started
+    statement = key = _normalize(sql)
+    with _lock:
+        stats = _stats.get(key)
+        if stats is None:
+            if len(_stats) >= MAX_STATEMENTS:
+                key = "(other)"
+                stats = _stats.setdefault(key, [0, 0.0, 0.0, 0])
+            else:
+                stats = _stats[key] = [0, 0.0, 0.0, 0]
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] = max(stats[2], duration)
+    query = _Query(sql, statement, key, parameters, batch, duration)
+    _check_slow(connection, query)
+    return query
+
+
+def _fetched(cursor, started):
+    query = cursor._query
+    if query is None:
+        return
+    duration = time.perf_counter() - started
+    query.duration += duration
+    with _lock:
+        stats = _stats.get(query.key)
+        if stats is not None:
+            stats[1] += duration
+            stats[2] = max(stats[2], query.duration)
+    _check_slow(cursor.connection, query)
+
+
+def _check_slow(connection, query):
+    # A statement counts as slow once, when its execute and fetch time first reaches the threshold
+    if query.slow or query.duration * 1000 < SLOW_QUERY_MS:
+        return
+    query.slow = True
+    with _lock:
+        stats = _stats.get(query.key)
+        if stats is not None:
+            stats[3] += 1
+    _log_slow(connection, query)
+
+
+def param_shape(parameters):
+    """Describes parameters by type and size only, e.g. "(int, str[12], None)", so no user data is logged."""
+    def describe(value):
+        if value is None:
+            return "None"
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {describe(value)}" for key, value in parameters.items()) + "}"
+    return "(" + ", ".join(describe(value) for value in parameters) + ")"
+
+
+class _SlowQueryQueueHandler(QueueHandler):
+    """QueueHandler that passes the slow statement as it is to the listener thread."""
+
+    def prepare(self, record):
+        return record
+
+
+class _SlowQueryFormatter(logging.Formatter):
+    """Adds the parameter shapes and query plan of a slow statement, on the listener thread.
+
+    The plan comes from a connection of its own to the same database file, so
+    the EXPLAIN never runs on (or shares a connection with) the caller's thread.
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(details)s")
+        self._connections = {}
+
+    def format(self, record):
+        # RotatingFileHandler formats each record twice (once to check for rollover); explain it only once
+        if not hasattr(record, 'details'):
+            path, sql, parameters, duration, batch = record.slow_query
+            lines = [f"{duration * 1000:.1f}ms {record.msg}", f"  params: {param_shape(parameters)}"
+                     + (f" x {batch} rows" if batch is not None else "")]
+            for step in self._explain(path, sql, parameters) or ():
+                lines.append(f"  plan: {step}")
+            record.details = "\n".join(lines)
+        return super().format(record)
+
+    def _explain(self, path, sql, parameters):
+        if path is None or path == ":memory:" or not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        try:
+            connection = self._connections.get(path)
+            if connection is None:
+                connection = self._connections[path] = sqlite3.connect(path, check_same_thread=False)
+            rows = connection.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+            return [row[-1] for row in rows]
+        except Exception as e:
+            return [f"(EXPLAIN failed: {e})"]
+
+    def close(self):
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+
+
+def _slow_logger():
+    global _logger, _listener
+    if _logger is None:
+        logger = logging.getLogger("ET_HONEY.slow_queries")
+        logger.propagate = False
+        try:
+            os.makedirs(os.path.dirname(SLOW_QUERY_LOG) or ".", exist_ok=True)
+            handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
+            handler.setFormatter(_SlowQueryFormatter())
+            slow_queue = queue.SimpleQueue()
+            _listener = QueueListener(slow_queue, handler)
+            _listener.start()
+            atexit.register(stop_slow_query_log)
+            logger.addHandler(_SlowQueryQueueHandler(slow_queue))
+        except Exception as e:
+            logging.error(f"Could not open slow query log {SLOW_QUERY_LOG}: {e}")
+            logger.addHandler(logging.NullHandler())
+        logger.setLevel(logging.INFO)
+        _logger = logger
+    return _logger
+
+
+def stop_slow_query_log():
+    """Writes out queued slow statements and stops the slow query listener thread."""
+    global _logger, _listener
+    if _logger is not None:
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+        _logger = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.formatter.close()
+            handler.close()
+        _listener = None
+
+
+def _log_slow(connection, query):
+    # Only enqueues the statement; the EXPLAIN and the file write happen on the listener thread
+    try:
+        _slow_logger().info(query.statement, extra={'slow_query': (
+            getattr(connection, 'path', None), query.sql, query.parameters, query.duration, query.batch)})
+    except Exception as e:
+        logging.error(f"Could not log slow query: {e}")
+
+
+def statement_stats(limit=None):
+    """[(statement, calls, total seconds, max seconds, slow calls)], most total time first."""
+    with _lock:
+        rows = [(statement, *stats) for statement, stats in _stats.items()]
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows[:limit] if limit else rows
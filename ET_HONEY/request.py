@@ -0,0 +1,125 @@
+import json
+import os
+import time
+
+import httpx
+from telegram.request import HTTPXRequest
+
+from . import metrics
+from .tracing import end_span, start_span
+
+# orjson is optional: when it is installed (and FAST_JSON isn't "0") webhook payloads
+# and Bot API calls are encoded/decoded with it, otherwise the stdlib json is used.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FAST_JSON = orjson is not None and os.getenv("FAST_JSON", "1") != "0"
+
+# Bot API endpoint; point these at a self-hosted Bot API server or at benchmarks/fake_bot_api.py
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL", "https://api.telegram.org/bot")
+BOT_API_BASE_FILE_URL = os.getenv("BOT_API_BASE_FILE_URL", "https://api.telegram.org/file/bot")
+
+# Connection pool defaults per kind of traffic. Interactive replies fail fast when the
+# pool is exhausted; bulk sends (broadcasts) would rather wait for a free connection.
+REQUEST_DEFAULTS = {
+    'interactive': {'POOL_SIZE': 64, 'POOL_TIMEOUT': 1, 'READ_TIMEOUT': 5},
+    'bulk': {'POOL_SIZE': 16, 'POOL_TIMEOUT': 30, 'READ_TIMEOUT': 15},
+    'get_updates': {'POOL_SIZE': 1, 'POOL_TIMEOUT': 1, 'READ_TIMEOUT': 5},
+}
+
+
+def loads(payload):
+    """Decodes a JSON payload (bytes or str)."""
+    if FAST_JSON:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+class _FastJSONRequestData:
+    """Wraps RequestData so the per-parameter JSON encoding uses orjson."""
+
+    def __init__(self, request_data):
+        self._request_data = request_data
+
+    @property
+    def multipart_data(self):
+        return self._request_data.multipart_data
+
+    @property
+    def json_parameters(self):
+        return {
+            name: value if isinstance(value, str) else orjson.dumps(value).decode()
+            for name, value in self._request_data.parameters.items()
+        }
+
+
+class BotRequest(HTTPXRequest):
+    """HTTPXRequest that uses orjson for Bot API calls when it is available, and records call metrics and trace spans."""
+
+    @staticmethod
+    def parse_json_payload(payload):
+        if FAST_JSON:
+            try:
+                return orjson.loads(payload)
+            except orjson.JSONDecodeError:
+                pass  # The stdlib path below replaces invalid UTF-8, logs and raises TelegramError
+        return HTTPXRequest.parse_json_payload(payload)
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        if FAST_JSON and request_data is not None:
+            request_data = _FastJSONRequestData(request_data)
+        api_method = url.rsplit('/', 1)[-1]
+        span = start_span(f"bot_api.{api_method}", 'client')
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+        except Exception as e:
+            metrics.bot_api_failed(api_method, e)
+            if span is not None:
+                end_span(span, e)
+            raise
+        metrics.observe_bot_api(api_method, time.perf_counter() - started, code)
+        if span is not None:
+            span.attributes['status'] = code
+            end_span(span, None if 200 <= code < 300 else RuntimeError(f"HTTP {code}"))
+        return code, payload
+
+
+def request_settings(kind):
+    """Pool and timeout settings for one kind of traffic.
+
+    Each value is read from BOT_API_<KIND>_<NAME> (e.g. BOT_API_BULK_POOL_SIZE),
+    then BOT_API_<NAME>, then the defaults above.
+    """
+    defaults = dict(REQUEST_DEFAULTS[kind])
+    defaults.setdefault('KEEPALIVE', defaults['POOL_SIZE'])
+    defaults.update({'KEEPALIVE_SECONDS': 30, 'CONNECT_TIMEOUT': 5, 'WRITE_TIMEOUT': 5, 'HTTP_VERSION': "1.1"})
+    settings = {}
+    for name, default in defaults.items():
+        value = os.getenv(f"BOT_API_{kind.upper()}_{name}", os.getenv(f"BOT_API_{name}", default))
+        settings[name] = value if name == 'HTTP_VERSION' else float(value)
+    return settings
+
+
+def build_request(kind='interactive'):
+    """Builds a BotRequest for 'interactive', 'bulk' or 'get_updates' traffic."""
+    settings = request_settings(kind)
+    pool_size = int(settings['POOL_SIZE'])
+    # httpx keeps only 20 idle connections for 5s by default, so bursts above that
+    # reconnect (and redo TLS) on every request; keep the whole pool alive instead
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=min(int(settings['KEEPALIVE']), pool_size),
+        keepalive_expiry=settings['KEEPALIVE_SECONDS'],
+    )
+    return BotRequest(
+        connection_pool_size=pool_size,
+        connect_timeout=settings['CONNECT_TIMEOUT'],
+        read_timeout=settings['READ_TIMEOUT'],
+        write_timeout=settings['WRITE_TIMEOUT'],
+        pool_timeout=settings['POOL_TIMEOUT'],
+        http_version=settings['HTTP_VERSION'],
+        httpx_kwargs={'limits': limits},
+    )
@@ -0,0 +1,329 @@
+import argparse
+import atexit
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0))
+TRACE_MIN_MS = float(os.getenv("TRACE_MIN_MS", 0))
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join("logs", "traces.jsonl"))
+TRACE_FORMAT = os.getenv("TRACE_FORMAT", "jsonl")
+
+# Innermost open span of the update being processed; None when it isn't traced
+current_span = ContextVar('current_span', default=None)
+_logger = None
+_listener = None
+
+
+class Span:
+    __slots__ = ('trace', 'name', 'kind', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'error', '_token')
+
+    def __init__(self, trace, name, kind, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+        self._token = None
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.spans = []
+
+
+def start_span(name, kind='internal', **attributes):
+    """Opens a child of the current span; returns None (and does nothing) when the update isn't traced."""
+    parent = current_span.get()
+    if parent is None:
+        return None
+    span = Span(parent.trace, name, kind, parent.span_id, attributes)
+    span._token = current_span.set(span)
+    return span
+
+
+def end_span(span, error=None):
+    span.end = time.time_ns()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    span.trace.spans.append(span)
+    try:
+        current_span.reset(span._token)
+    except ValueError:
+        pass  # Ended in another context (e.g. a copied one); nothing to restore
+
+
+def traced(function):
+    """Decorator that gives an async function its own span in traced updates."""
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        span = start_span(function.__name__)
+        if span is None:
+            return await function(*args, **kwargs)
+        error = None
+        try:
+            return await function(*args, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            end_span(span, error)
+    return wrapper
+
+
+class UpdateTracer:
+    """Opt-in tracing of update dispatch.
+
+    A random `sample_rate` share of updates gets a trace id and a root span;
+    handler callbacks, database.py functions, Bot API requests and functions
+    marked @traced add child spans while it is processed. Traces that took at
+    least `min_ms` are appended to `path`, one span per line ("jsonl") or one
+    OTLP JSON ExportTraceServiceRequest per trace ("otlp", the OpenTelemetry
+    file exporter format). Updates that aren't sampled cost a random() call,
+    and every span point a ContextVar lookup.
+
+    Print the slowest traces as waterfalls with:
+        python -m ET_HONEY.tracing logs/traces.jsonl --slowest 5
+    """
+
+    def __init__(self, sample_rate=1.0, min_ms=0, path=TRACE_FILE, export_format=TRACE_FORMAT):
+        self.sample_rate = sample_rate
+        self.min_ms = min_ms
+        self.path = path
+        self.export_format = export_format
+        self.stats = {'traced': 0, 'exported': 0}
+
+    @classmethod
+    def from_env(cls):
+        """Returns a tracer configured from TRACE_* settings, or None when tracing is off."""
+        if TRACE_SAMPLE_RATE <= 0:
+            return None
+        logging.info(f"Tracing {TRACE_SAMPLE_RATE:.1%} of updates to {TRACE_FILE} ({TRACE_FORMAT})")
+        return cls(TRACE_SAMPLE_RATE, TRACE_MIN_MS)
+
+    async def run(self, update, coroutine):
+        """Awaits the dispatch coroutine of one update, inside a root span if the update is sampled."""
+        if random.random() >= self.sample_rate:
+            return await coroutine
+        trace = Trace()
+        root = Span(trace, "update", 'server', None, _update_attributes(update))
+        token = current_span.set(root)
+        error = None
+        try:
+            return await coroutine
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            current_span.reset(token)
+            root._token = None
+            root.end = time.time_ns()
+            if error is not None:
+                root.error = f"{type(error).__name__}: {error}"
+            trace.spans.append(root)
+            self.stats['traced'] += 1
+            if (root.end - root.start) / 1e6 >= self.min_ms:
+                self._export(trace)
+
+    def _export(self, trace):
+        # Only enqueues the finished trace; encoding and the file write happen on the listener thread
+        try:
+            _trace_logger(self.path).info(trace, extra={'export_format': self.export_format})
+            self.stats['exported'] += 1
+        except Exception as e:
+            logging.error(f"Could not export trace: {e}")
+
+
+def _update_attributes(update):
+    attributes = {'update_id': update.update_id}
+    if update.effective_chat is not None:
+        attributes['chat_id'] = update.effective_chat.id
+    if update.callback_query is not None:
+        attributes['update_type'] = 'callback_query'
+        attributes['callback_data'] = (update.callback_query.data or '')[:64]
+    elif update.message is not None:
+        attributes['update_type'] = 'command' if (update.message.text or '').startswith('/') else 'message'
+    else:
+        attributes['update_type'] = 'other'
+    return attributes
+
+
+def _span_record(trace, span):
+    record = {
+        'trace_id': trace.trace_id,
+        'span_id': span.span_id,
+        'parent_id': span.parent_id,
+        'name': span.name,
+        'kind': span.kind,
+        'start_unix_nano': span.start,
+        'duration_ms': round((span.end - span.start) / 1e6, 3),
+        'attributes': span.attributes,
+    }
+    if span.error:
+        record['error'] = span.error
+    return record
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp(trace):
+    kinds = {'internal': 1, 'server': 2, 'client': 3}
+    spans = []
+    for span in trace.spans:
+        otlp_span = {
+            'traceId': trace.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': kinds.get(span.kind, 1),
+            'startTimeUnixNano': str(span.start),
+            'endTimeUnixNano': str(span.end),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in span.attributes.items()],
+            'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+        }
+        if span.parent_id:
+            otlp_span['parentSpanId'] = span.parent_id
+        spans.append(otlp_span)
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'et-honey-bot'}}]},
+        'scopeSpans': [{'scope': {'name': 'ET_HONEY.tracing'}, 'spans': spans}],
+    }]}
+
+
+class _TraceQueueHandler(QueueHandler):
+    """QueueHandler that passes the Trace object itself to the listener thread."""
+
+    def prepare(self, record):
+        return record
+
+
+class _TraceFormatter(logging.Formatter):
+    """Encodes a trace record as one OTLP JSON line or one JSON line per span."""
+
+    def format(self, record):
+        # RotatingFileHandler formats each record twice (once to check for rollover); encode it only once
+        if not hasattr(record, 'encoded'):
+            trace = record.msg
+            if record.export_format == "otlp":
+                record.encoded = json.dumps(_otlp(trace))
+            else:
+                record.encoded = "\n".join(json.dumps(_span_record(trace, span)) for span in trace.spans)
+        return record.encoded
+
+
+def _trace_logger(path):
+    global _logger, _listener
+    if _logger is None:
+        logger = logging.getLogger("ET_HONEY.traces")
+        logger.propagate = False
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=20 * 1024 * 1024, backupCount=3, encoding="utf-8")
+            handler.setFormatter(_TraceFormatter())
+            trace_queue = queue.SimpleQueue()
+            _listener = QueueListener(trace_queue, handler)
+            _listener.start()
+            atexit.register(stop_trace_export)
+            logger.addHandler(_TraceQueueHandler(trace_queue))
+        except Exception as e:
+            logging.error(f"Could not open trace file {path}: {e}")
+            logger.addHandler(logging.NullHandler())
+        logger.setLevel(logging.INFO)
+        _logger = logger
+    return _logger
+
+
+def stop_trace_export():
+    """Writes out queued traces and stops the trace listener thread."""
+    global _logger, _listener
+    if _logger is not None:
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+        _logger = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def load_traces(path):
+    """Reads a JSONL trace file (either format) into {trace_id: [span records]}."""
+    traces = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if 'resourceSpans' in record:
+                for otlp_span in record['resourceSpans'][0]['scopeSpans'][0]['spans']:
+                    start, end = int(otlp_span['startTimeUnixNano']), int(otlp_span['endTimeUnixNano'])
+                    traces.setdefault(otlp_span['traceId'], []).append({
+                        'trace_id': otlp_span['traceId'], 'span_id': otlp_span['spanId'],
+                        'parent_id': otlp_span.get('parentSpanId'), 'name': otlp_span['name'],
+                        'start_unix_nano': start, 'duration_ms': (end - start) / 1e6,
+                        'attributes': {a['key']: next(iter(a['value'].values())) for a in otlp_span['attributes']},
+                        'error': otlp_span['status'].get('message') if otlp_span['status'].get('code') == 2 else None,
+                    })
+            else:
+                traces.setdefault(record['trace_id'], []).append(record)
+    return traces
+
+
+def waterfall(spans, width=40):
+    """Renders one trace as indented lines with a bar showing when each span ran."""
+    root = next(span for span in spans if not span.get('parent_id'))
+    start, total = root['start_unix_nano'], max(root['duration_ms'], 1e-6)
+    children = {}
+    for span in spans:
+        children.setdefault(span.get('parent_id'), []).append(span)
+    lines = [f"trace {root.get('trace_id', '')} {root['attributes']}"]
+
+    def render(span, depth):
+        offset = int((span['start_unix_nano'] - start) / 1e6 / total * width)
+        length = max(1, int(span['duration_ms'] / total * width))
+        bar = " " * min(offset, width - 1) + "█" * min(length, width - min(offset, width - 1))
+        error = " !" if span.get('error') else ""
+        lines.append(f"{bar:<{width}} {span['duration_ms']:9.2f}ms {'  ' * depth}{span['name']}{error}")
+        for child in sorted(children.get(span['span_id'], []), key=lambda child: child['start_unix_nano']):
+            render(child, depth + 1)
+
+    render(root, 0)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the slowest traces as waterfalls")
+    parser.add_argument("path", nargs="?", default=TRACE_FILE)
+    parser.add_argument("--slowest", type=int, default=5)
+    args = parser.parse_args()
+
+    traces = load_traces(args.path)
+    roots = sorted(
+        ((next(span for span in spans if not span.get('parent_id'))['duration_ms'], spans) for spans in traces.values()),
+        key=lambda item: item[0], reverse=True,
+    )
+    print(f"{len(traces)} traces in {args.path}")
+    for duration, spans in roots[:args.slowest]:
+        print()
+        print(waterfall(spans))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from telegram.ext import BaseUpdateProcessor
+
+from .database import get_seen_update_ids, save_seen_update_ids, save_seen_update_ids_async
+from .log_config import correlation_id
+
+
+class RecentUpdateIds:
+    """Bounded set of recently seen update_ids, used to drop webhook redeliveries.
+
+    Lookups are served from memory; new ids are written to SQLite in batches
+    so the window survives a restart. The table is a ring keyed on
+    update_id % capacity, so it never grows past `capacity` rows. Batches
+    recorded on the event loop are written by the database writer thread.
+    """
+
+    def __init__(self, capacity=10000, flush_every=50, flush_seconds=5):
+        self.capacity = capacity
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self._order = deque()
+        self._ids = set()
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._flushes = set()
+
+    def load(self):
+        try:
+            for update_id in get_seen_update_ids(self.capacity)[-self.capacity:]:
+                self._remember(update_id)
+        except Exception as e:
+            logging.error(f"Could not load seen update ids: {e}")
+        logging.info(f"Loaded {len(self._ids)} recently seen update ids")
+
+    def _remember(self, update_id):
+        if len(self._order) >= self.capacity:
+            self._ids.discard(self._order.popleft())
+        self._order.append(update_id)
+        self._ids.add(update_id)
+
+    def check_and_add(self, update_id):
+        """Returns True if update_id was already seen, otherwise records it."""
+        if update_id in self._ids:
+            return True
+        self._remember(update_id)
+        self._pending.append(update_id)
+        if len(self._pending) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+        return False
+
+    def forget(self, update_id):
+        """Un-records an update that was not accepted, so Telegram's redelivery gets through."""
+        if update_id not in self._ids:
+            return
+        self._ids.discard(update_id)
+        # A copy left in _order would later evict the id again if it is re-added; it is almost always the newest
+        if self._order[-1] == update_id:
+            self._order.pop()
+        else:
+            self._order.remove(update_id)
+        if update_id in self._pending:
+            self._pending.remove(update_id)
+
+    def flush(self):
+        """Writes the ids recorded since the last flush; on the event loop the write only gets queued."""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            try:
+                save_seen_update_ids(pending, self.capacity)
+            except Exception as e:
+                logging.error("Could not persist seen update ids: %s", e)
+            return
+        task = loop.create_task(self._save(pending))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _save(self, pending):
+        try:
+            await save_seen_update_ids_async(pending, self.capacity)
+        except Exception as e:
+            logging.error("Could not persist seen update ids: %s", e)
+
+    async def close(self):
+        """Flushes the remaining ids and waits until every queued write is done."""
+        self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes)
+
+    def __len__(self):
+        return len(self._ids)
+
+
+def chat_key(update):
+    """The chat whose updates must be processed in order (None if the update has no chat or user)."""
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return chat.id
+    # Inline queries, poll answers, ... have no chat; keep them ordered per user
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return f"user:{user.id}"
+    return None
+
+
+class UpdateWorkerPool:
+    """Bounded queue of incoming updates drained by a pool of async workers.
+
+    The webhook only validates and enqueues updates so Telegram gets its 200
+    right away; slow handlers (broadcasts, exports) run on the workers instead
+    of holding the HTTP request open. When the queue is full the update is
+    rejected and Telegram redelivers it later, which is our backpressure.
+
+    Updates are serialized per chat before they reach the update processor:
+    a worker that dequeues an update for a chat another worker is busy with
+    hands it to that worker (which processes the chat's updates in order)
+    and moves on. A backlog in one chat therefore occupies one worker and
+    one processor slot, and never holds up other chats. Updates handed over
+    this way still count against `maxsize` until they are processed.
+    """
+
+    def __init__(self, application, workers=4, maxsize=1000, recent_updates=None, profiler=None, tracer=None):
+        self.application = application
+        self.workers = workers
+        self.recent_updates = recent_updates
+        self.profiler = profiler
+        self.tracer = tracer
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        # chat key -> updates waiting for the worker that is processing that chat
+        self._chats = {}
+        self._parked = 0
+        self._tasks = []
+        self._closing = False
+        self.stats = {
+            'enqueued': 0,
+            'rejected': 0,
+            'duplicates': 0,
+            'processed': 0,
+            'failed': 0,
+            'in_flight': 0,
+            'max_depth': 0,
+        }
+
+    def start(self):
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"update-worker-{i}"))
+        logging.info(f"Started {self.workers} update workers (queue size {self.queue.maxsize})")
+
+    def put(self, update):
+        """Enqueues an update without waiting. Returns False when it has to be rejected.
+
+        Redelivered updates are dropped here (and acknowledged) so handlers never see them twice.
+        """
+        if self._closing:
+            self.stats['rejected'] += 1
+            return False
+        recent = self.recent_updates
+        if recent is not None and recent.check_and_add(update.update_id):
+            self.stats['duplicates'] += 1
+            logging.info("Dropping duplicate update %s", update.update_id)
+            return True
+        if self.full():
+            self.stats['rejected'] += 1
+            if recent is not None:
+                recent.forget(update.update_id)
+            return False
+        self.queue.put_nowait(update)
+        self.stats['enqueued'] += 1
+        self.stats['max_depth'] = max(self.stats['max_depth'], self.depth)
+        return True
+
+    @property
+    def depth(self):
+        """Updates accepted but not yet started: queued, or handed to the worker busy with their chat."""
+        return self.queue.qsize() + self._parked
+
+    def full(self):
+        return 0 < self.queue.maxsize <= self.depth
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            key = chat_key(update)
+            if key is not None:
+                waiting = self._chats.get(key)
+                if waiting is not None:
+                    # Another worker is on this chat; it takes this update once the earlier ones are done
+                    waiting.append(update)
+                    self._parked += 1
+                    continue
+                waiting = self._chats[key] = deque()
+            try:
+                await self._process(update)
+                while key is not None and waiting:
+                    update = waiting.popleft()
+                    self._parked -= 1
+                    await self._process(update)
+            finally:
+                if key is not None:
+                    # Cancelled while the chat still had updates waiting (stop() timed out)
+                    self._parked -= len(waiting)
+                    del self._chats[key]
+
+    async def _process(self, update):
+        self.stats['in_flight'] += 1
+        token = correlation_id.set(update.update_id)
+        try:
+            # Go through the application's update processor so its concurrency limit still applies
+            coroutine = self.application.process_update(update)
+            if self.tracer is not None:
+                coroutine = self.tracer.run(update, coroutine)
+            if self.profiler is not None:
+                coroutine = self.profiler.run(update, coroutine)
+            await self.application.update_processor.process_update(update, coroutine)
+            self.stats['processed'] += 1
+        except Exception as e:
+            self.stats['failed'] += 1
+            logging.error("Error processing update %s: %s", update.update_id, e)
+        finally:
+            correlation_id.reset(token)
+            self.stats['in_flight'] -= 1
+            self.queue.task_done()
+
+    async def stop(self, timeout=30):
+        """Stops accepting updates, waits for queued ones to finish, then stops the workers."""
+        self._closing = True
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Update queue not drained after {timeout}s, dropping {self.depth} updates")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.recent_updates is not None:
+            await self.recent_updates.close()
+        if self.profiler is not None:
+            await self.profiler.stop()
+
+    def metrics(self):
+        metrics = dict(self.stats, depth=self.depth, capacity=self.queue.maxsize, workers=self.workers,
+                       active_chats=len(self._chats), parked=self._parked)
+        if self.recent_updates is not None:
+            metrics['recent_update_ids'] = len(self.recent_updates)
+        if self.profiler is not None:
+            metrics['profiler'] = self.profiler.stats
+        if self.tracer is not None:
+            metrics['tracer'] = self.tracer.stats
+        return metrics
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates from different chats in parallel, but one at a time per chat.
+
+    ConversationHandler keeps its state per chat/user, so two updates from the
+    same chat must never overlap or overtake each other. Each chat gets its own
+    lock; the lock is dropped again once nothing is waiting on it.
+
+    The lock is taken inside the processor's concurrency slot, so an update
+    waiting here holds a slot. UpdateWorkerPool already serializes per chat
+    before updates get here; the lock covers updates that don't come through
+    the pool.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks = {}
+
+    async def do_process_update(self, update, coroutine):
+        key = chat_key(update)
+        if key is None:
+            await coroutine
+            return
+
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[key]
+
+    @property
+    def active_chats(self):
+        return len(self._chat_locks)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
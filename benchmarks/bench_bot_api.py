@@ -0,0 +1,130 @@
+"""Send throughput and rate-limit behaviour against the local fake Bot API server.
+
+Starts benchmarks/fake_bot_api.py in its own process, then has many tasks
+send messages at once through different request configurations: PTB's
+default HTTPXRequest and the tuned pools from request.build_request(), plus
+a round of photo uploads. Reports messages per second, p99 latency, errors
+(e.g. pool timeouts) and how many TCP connections the server saw, which
+shows whether keep-alive connections were reused.
+
+Then sends under Telegram's rate limits, to many chats (broadcast) and
+repeatedly to a few (admin fan-out), once treating 429 RetryAfter as a
+failure the way the bot does today and once waiting retry_after and
+retrying.
+
+Usage:
+    python benchmarks/bench_bot_api.py [--senders 200] [--messages 2000] [--latency 0.05] [--limited-messages 300]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telegram import Bot
+from telegram.error import RetryAfter
+from telegram.request import HTTPXRequest
+
+from ET_HONEY.request import build_request
+from fake_bot_api import TELEGRAM_LIMITS, server_stats, start_server
+
+PHOTO = b"\xff\xd8\xff\xe0" + bytes(50 * 1024)
+
+
+async def run(request, base_url, senders, messages, photo=False, chats=None, retry=False):
+    """Sends `messages` from `senders` concurrent tasks; returns (elapsed, sorted latencies, errors, 429s seen)."""
+    bot = Bot("123:abc", base_url=base_url, request=request)
+    latencies = []
+    errors = {}
+    throttled = 0
+    pending = iter(range(messages))
+
+    async def send(i):
+        chat_id = 1000 + (i % chats if chats else i)
+        if photo:
+            await bot.send_photo(chat_id=chat_id, photo=PHOTO, caption=f"🍯 Photo {i}")
+        else:
+            await bot.send_message(chat_id=chat_id, text=f"🍯 Broadcast message {i}")
+
+    async def sender():
+        nonlocal throttled
+        for i in pending:
+            started = time.perf_counter()
+            for _ in range(10):
+                try:
+                    await send(i)
+                    latencies.append(time.perf_counter() - started)
+                    break
+                except RetryAfter as e:
+                    throttled += 1
+                    if not retry:
+                        errors['RetryAfter'] = errors.get('RetryAfter', 0) + 1
+                        break
+                    wait = e.retry_after
+                    await asyncio.sleep(wait.total_seconds() if hasattr(wait, 'total_seconds') else wait)
+                except Exception as e:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                    break
+
+    async with bot:
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(senders)))
+        elapsed = time.perf_counter() - started
+    return elapsed, sorted(latencies), errors, throttled
+
+
+def report(name, elapsed, latencies, errors, stats):
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float('nan')
+    print(f"{name:>20}: {len(latencies) / elapsed:8.1f} msg/s  p99={p99:7.1f}ms  "
+          f"connections={stats['connections']:4}  errors={errors or 0}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--senders", type=int, default=200, help="concurrent sending tasks")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake server response delay in seconds")
+    parser.add_argument("--limited-messages", type=int, default=300, help="messages sent under Telegram's limits")
+    args = parser.parse_args()
+
+    process, base_url, root = start_server(latency=args.latency)
+    print(f"{args.messages} sends from {args.senders} concurrent senders, {args.latency * 1000:.0f} ms server delay")
+
+    configs = (
+        ("PTB default", lambda: HTTPXRequest()),
+        ("interactive", lambda: build_request('interactive')),
+        ("bulk", lambda: build_request('bulk')),
+    )
+    for name, make_request in configs:
+        server_stats(root)
+        elapsed, latencies, errors, _ = asyncio.run(run(make_request(), base_url, args.senders, args.messages))
+        report(name, elapsed, latencies, errors, server_stats(root))
+    server_stats(root)
+    photos = args.messages // 4
+    elapsed, latencies, errors, _ = asyncio.run(run(build_request('bulk'), base_url, args.senders, photos, photo=True))
+    report(f"bulk, {photos} photos", elapsed, latencies, errors, server_stats(root))
+    process.terminate()
+    process.join()
+
+    # Under Telegram's limits: a broadcast to distinct chats runs into the global limit,
+    # a fan-out of several messages to the same few chats into the per-chat limit
+    process, base_url, root = start_server(latency=args.latency, **TELEGRAM_LIMITS)
+    print(f"\n{args.limited_messages} sends under Telegram's limits {TELEGRAM_LIMITS}")
+    for name, chats, messages in (("broadcast", None, args.limited_messages),
+                                  ("fan-out to 5 chats", 5, args.limited_messages // 5)):
+        for retry in (False, True):
+            server_stats(root)
+            elapsed, latencies, errors, throttled = asyncio.run(
+                run(build_request('bulk'), base_url, 16, messages, chats=chats, retry=retry))
+            stats = server_stats(root)
+            label = "retry_after honored" if retry else "no retry"
+            print(f"{name:>20}, {label:<19}: delivered {len(latencies):4}/{messages} "
+                  f"in {elapsed:5.1f}s ({len(latencies) / elapsed:5.1f}/s), 429s {throttled:4} {stats['rate_limited']}")
+    process.terminate()
+    process.join()
+
+
+if __name__ == "__main__":
+    main()
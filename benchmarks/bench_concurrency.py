@@ -0,0 +1,131 @@
+"""Load test for concurrent update processing.
+
+Simulates many users sending messages at once and pushes them through the
+same UpdateWorkerPool + update processor the webhook uses. Handlers only sleep
+(standing in for Bot API round trips), so the numbers show how much waiting
+overlaps, not CPU speed. Also checks that updates from one chat never overlap
+and are handled in the order they arrived.
+
+Usage:
+    python benchmarks/bench_concurrency.py [--users 500] [--messages 4] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telegram import Chat, Message, Update, User
+from telegram.ext import ApplicationBuilder, SimpleUpdateProcessor, TypeHandler
+from telegram.request import BaseRequest
+
+from ET_HONEY.update_queue import UpdateWorkerPool, PerChatUpdateProcessor
+
+
+class OfflineRequest(BaseRequest):
+    """Answers getMe locally so the Application can initialize without network access."""
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        me = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        return 200, json.dumps({"ok": True, "result": me}).encode()
+
+
+def make_updates(users, messages):
+    now = datetime.now(timezone.utc)
+    updates = []
+    update_id = 1
+    # Interleave users the way a busy webhook sees them
+    for seq in range(messages):
+        for uid in range(1, users + 1):
+            user = User(id=uid, first_name=f"user{uid}", is_bot=False)
+            chat = Chat(id=uid, type=Chat.PRIVATE)
+            message = Message(message_id=seq + 1, date=now, chat=chat, from_user=user, text=str(seq))
+            updates.append(Update(update_id=update_id, message=message))
+            update_id += 1
+    return updates
+
+
+async def run(processor, updates, latency, workers):
+    application = (
+        ApplicationBuilder()
+        .token("123:abc")
+        .request(OfflineRequest())
+        .get_updates_request(OfflineRequest())
+        .concurrent_updates(processor)
+        .build()
+    )
+    active = {}
+    last_seq = {}
+    errors = []
+
+    async def handler(update, context):
+        chat_id = update.effective_chat.id
+        seq = int(update.message.text)
+        if active.get(chat_id):
+            errors.append(f"chat {chat_id}: overlapping updates")
+        if last_seq.get(chat_id, -1) != seq - 1:
+            errors.append(f"chat {chat_id}: got {seq} after {last_seq.get(chat_id)}")
+        active[chat_id] = True
+        await asyncio.sleep(latency)
+        last_seq[chat_id] = seq
+        active[chat_id] = False
+
+    application.add_handler(TypeHandler(Update, handler))
+
+    async with application:
+        pool = UpdateWorkerPool(application, workers=workers, maxsize=len(updates))
+        pool.start()
+        started = time.perf_counter()
+        for update in updates:
+            pool.put(update)
+        await pool.queue.join()
+        elapsed = time.perf_counter() - started
+        await pool.stop()
+    if pool.stats['failed']:
+        errors.append(f"{pool.stats['failed']} updates failed")
+    return elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=4, help="messages per user")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated handler latency in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    args = parser.parse_args()
+
+    updates = make_updates(args.users, args.messages)
+    print(f"{len(updates)} updates from {args.users} users, {args.latency * 1000:.0f} ms per handler")
+
+    elapsed, errors = asyncio.run(run(SimpleUpdateProcessor(1), updates, args.latency, workers=1))
+    baseline = len(updates) / elapsed
+    print(f"{'sequential':>16}: {elapsed:7.2f}s {baseline:9.1f} updates/s  errors={len(errors)}")
+
+    for concurrency in args.concurrency:
+        elapsed, errors = asyncio.run(
+            run(PerChatUpdateProcessor(concurrency), updates, args.latency, workers=concurrency)
+        )
+        rate = len(updates) / elapsed
+        print(f"{'per-chat x' + str(concurrency):>16}: {elapsed:7.2f}s {rate:9.1f} updates/s  "
+              f"speedup={rate / baseline:5.1f}x  errors={len(errors)}")
+        for error in errors[:5]:
+            print(f"    {error}")
+
+
+if __name__ == "__main__":
+    main()
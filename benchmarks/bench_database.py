@@ -0,0 +1,381 @@
+"""Times every public database.py function against synthetic datasets of 10k, 100k and 1M rows.
+
+For each size, benchmarks/dataset.py generates a dataset (kept in --data-dir
+and reused by later runs), and a fresh process times each function on a
+copy of it, the way pytest-benchmark does: a warm-up call, then as many
+rounds as fit in --max-time (at least --min-rounds), with new arguments
+drawn for every round. Reads come first, then writes; rows a write deletes
+were created for it outside the timed call. For functions behind the
+in-process cache the uncached query is timed as well ("(uncached)").
+Slow-statement logging is turned off so EXPLAIN doesn't add to the numbers.
+
+Prints the median per function and size, and how much it grew from the
+smallest to the largest size: an indexed lookup barely moves, a full table
+scan grows with the data. --json saves the results; --compare checks them
+against a saved run and exits with status 1 if a function got slower than
+--threshold.
+
+Usage:
+    python benchmarks/bench_database.py [--sizes 10000,100000,1000000] [--only REGEX] [--skip REGEX]
+        [--max-time 1.0] [--json results.json] [--compare baseline.json] [--threshold 1.25]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "bench_database.db"))
+
+import dataset
+
+SEARCH_TERMS = ("Honey", "ማር", "Sheka", "White", "comb", "no such product")
+HEAVY = {'export_table_to_excel', 'export_users_csv', 'export_orders_csv', 'load_persistence', 'get_all_customers'}
+
+
+class Fixture:
+    """Ids sampled from the dataset, and fresh ids for rows the writes create."""
+
+    def __init__(self, path, seed=0):
+        self.rng = random.Random(seed)
+        conn = sqlite3.connect(path)
+        self.telegram_ids = [row[0] for row in conn.execute("SELECT telegram_id FROM customers ORDER BY id")]
+        self.admin_count = conn.execute("SELECT COUNT(*) FROM customers WHERE is_admin = 1").fetchone()[0]
+        self.usernames = [row[0] for row in conn.execute(
+            "SELECT username FROM customers WHERE username IS NOT NULL ORDER BY RANDOM() LIMIT 10000")]
+        self.topic_ids = [row[0] for row in conn.execute(
+            "SELECT topic_id FROM tickets WHERE topic_id IS NOT NULL ORDER BY RANDOM() LIMIT 10000")]
+        self.categories = [row[0] for row in conn.execute("SELECT DISTINCT category FROM products")]
+        self.persistence_keys = [row[0] for row in conn.execute(
+            "SELECT key FROM bot_persistence WHERE kind = 'user_data' ORDER BY RANDOM() LIMIT 10000")]
+        self.max_id = {table: conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 1
+                       for table in ('customers', 'products', 'orders', 'tickets', 'feedback', 'broadcasts')}
+        conn.close()
+        self.next_telegram_id = 9_000_000_000
+        self.next_update_id = 900_000_000
+        self.added_customers = []
+
+    def id(self, table):
+        return self.rng.randint(1, self.max_id[table])
+
+    def telegram_id(self):
+        """A random customer, never one of the admins."""
+        return self.telegram_ids[self.rng.randint(self.admin_count, len(self.telegram_ids) - 1)]
+
+    def key(self):
+        return f"{self.rng.getrandbits(128):032x}"
+
+    def customer_data(self):
+        self.next_telegram_id += 1
+        return {'telegram_id': self.next_telegram_id, 'username': f"bench_{self.next_telegram_id}",
+                'full_name': "ሙከራ ተጠቃሚ", 'phone': "0911000000", 'email': None, 'region': "Addis Ababa",
+                'customer_type': "New"}
+
+    def new_customer(self, database):
+        """telegram_id of a customer created for a deleting call (outside the timed call)."""
+        if not self.added_customers:
+            data = self.customer_data()
+            database.add_customer(data)
+            self.added_customers.append(data['telegram_id'])
+        return self.added_customers.pop()
+
+    def update_ids(self, count):
+        self.next_update_id += count
+        return list(range(self.next_update_id - count, self.next_update_id))
+
+
+def cases(database, f):
+    """(label, function, arguments factory) for every public function, reads before writes."""
+    rng = f.rng
+    order = lambda: (f.telegram_id(), "Sheka Forest Honey", rng.choice((1, 2, "1kg")), "Bole, Addis Ababa", "Cash", 650)
+    ticket = lambda: (f.telegram_id(), "Inquiry", "New Inquiry", "ትዕዛዜ መቼ ይደርሳል?")
+    cached = {
+        'get_all_products': database._get_all_products,
+        'get_product': database._get_product,
+        'get_products_available': database._get_products_available,
+        'get_customer_by_telegram_id': database._get_customer_by_telegram_id,
+        'get_customer_by_username': database._get_customer_by_username,
+        'get_all_admin_telegram_ids': database._get_all_admin_telegram_ids,
+    }
+    reads = (
+        ('get_all_products', lambda: ()),
+        ('get_product', lambda: (f.id('products'),)),
+        ('get_products_available', lambda: ()),
+        ('search_products', lambda: (rng.choice(SEARCH_TERMS),)),
+        ('get_products_by_category', lambda: (rng.choice(f.categories),)),
+        ('get_all_categories', lambda: ()),
+        ('search_products_advanced', lambda: (rng.choice((None,) + SEARCH_TERMS), rng.choice([None] + f.categories),
+                                              rng.choice((None, 300)), rng.choice((None, 1500)),
+                                              rng.choice(('name', 'price', 'stock')), rng.choice(('asc', 'desc')))),
+        ('get_low_stock_products', lambda: (5,)),
+        ('get_customer', lambda: (f.id('customers'),)),
+        ('get_customer_by_telegram_id', lambda: (f.telegram_id(),)),
+        ('get_customer_by_username', lambda: (rng.choice(f.usernames),)),
+        ('get_all_customers', lambda: ()),
+        ('get_all_admin_telegram_ids', lambda: ()),
+        ('get_recent_users', lambda: (10,)),
+        ('get_total_users', lambda: ()),
+        ('get_users_for_notification', lambda: (rng.choice(('notify_orders', 'notify_products', 'notify_alerts')),)),
+        ('get_users_for_notification_by_language',
+         lambda: ('notify_alerts', rng.choice((None, ('am', f.telegram_id()), ('en', f.telegram_id()))), 500)),
+        ('count_users_for_notification', lambda: ('notify_alerts',)),
+        ('get_order', lambda: (f.id('orders'),)),
+        ('get_orders_by_user', lambda: (f.telegram_id(),)),
+        ('get_total_orders_count', lambda: ()),
+        ('get_total_revenue', lambda: ()),
+        ('get_top_selling_products', lambda: (5,)),
+        ('get_recent_sales_trend', lambda: (7,)),
+        ('get_ticket', lambda: (f.id('tickets'),)),
+        ('get_ticket_by_topic_id', lambda: (rng.choice(f.topic_ids) if f.topic_ids else 0,)),
+        ('get_active_ticket', lambda: (f.telegram_id(),)),
+        ('get_tickets_by_user', lambda: (f.telegram_id(),)),
+        ('get_all_tickets', lambda: (rng.choice((None, 'Pending', 'Open', 'closed')),)),
+        ('get_total_tickets_count', lambda: ()),
+        ('get_total_messages', lambda: ()),
+        ('get_pending_messages', lambda: ()),
+        ('get_resolved_messages', lambda: ()),
+        ('get_messages_for_ticket', lambda: (f.id('tickets'),)),
+        ('get_feedback', lambda: (f.id('feedback'),)),
+        ('get_feedback_by_user', lambda: (f.telegram_id(),)),
+        ('get_broadcast', lambda: (f.id('broadcasts'),)),
+        ('get_due_broadcasts', lambda: ()),
+        ('get_pending_broadcasts', lambda: ()),
+        ('get_seen_update_ids', lambda: (10000,)),
+        ('get_bot_setting_hash', lambda: ('webhook',)),
+        ('load_persistence', lambda: ('user_data',)),
+        ('load_persistence_row', lambda: ('user_data', rng.choice(f.persistence_keys) if f.persistence_keys else '0')),
+        ('get_persistence_seq', lambda: ()),
+        ('get_persistence_changes', lambda: (database.get_persistence_seq(), 'bench')),
+        ('export_users_csv', lambda: ()),
+        ('export_orders_csv', lambda: ()),
+        ('export_table_to_excel', lambda: ('customers',)),
+    )
+    writes = (
+        ('init_db', lambda: ()),
+        ('add_product', lambda: ("ቦሌ ማር", "Benchmark product", 700, 10, None, "500g, 1kg", "Raw")),
+        ('update_product', lambda: (f.id('products'), None, None, rng.randint(300, 1500), None, None, None)),
+        ('update_product_stock', lambda: (f.id('products'), rng.randint(0, 100))),
+        ('delete_product', lambda: (database.add_product("Temporary", "", 1, 0),)),
+        ('add_customer', lambda: (f.customer_data(),)),
+        ('update_customer_language', lambda: (f.telegram_id(), rng.choice(('am', 'en')))),
+        ('update_customer_status', lambda: (f.id('customers'), 'Approved')),
+        ('update_customer_status_by_telegram_id', lambda: (f.telegram_id(), 'Approved')),
+        ('set_admin_status', lambda: (f.telegram_id(), 0)),
+        ('set_admin_by_username', lambda: ("no_such_username",)),
+        ('update_notification_preferences', lambda: (f.telegram_id(), 1, None, None)),
+        ('update_notification_preferences_async', lambda: (f.telegram_id(), None, 1, None)),
+        ('create_order', order),
+        ('create_order_once', lambda: (f.key(),) + order()),
+        ('create_order_once_async', lambda: (f.key(),) + order()),
+        ('update_order_status', lambda: (f.id('orders'), 'Approved')),
+        ('create_ticket', ticket),
+        ('create_ticket_once', lambda: (f.key(),) + ticket()),
+        ('create_ticket_once_async', lambda: (f.key(),) + ticket()),
+        ('add_message', lambda: (f.id('tickets'), 'admin', "Payment confirmed, thank you.")),
+        ('add_message_async', lambda: (f.id('tickets'), 'user', "አመሰግናለሁ፣ ደርሶኛል።")),
+        ('update_ticket_status', lambda: (f.id('tickets'), 'Open')),
+        ('update_ticket_status_async', lambda: (f.id('tickets'), 'Open')),
+        ('set_ticket_topic', lambda: (f.id('tickets'), rng.randint(10_000_000, 20_000_000))),
+        ('update_ticket_attachment_path', lambda: (f.id('tickets'), "uploads/tickets/bench.jpg")),
+        ('close_ticket', lambda: (f.id('tickets'),)),
+        ('create_feedback', lambda: (f.telegram_id(), 5, "Great honey, will order again!")),
+        ('update_feedback_status', lambda: (f.id('feedback'), 'Approved')),
+        ('update_feedback_photo_path', lambda: (f.id('feedback'), "uploads/feedback/bench.jpg")),
+        ('create_broadcast', lambda: (f.telegram_ids[0], {'en': "New harvest!", 'am': "አዲስ ምርት!"}, 'en', [],
+                                      datetime.now() + timedelta(days=30))),
+        ('update_broadcast_progress', lambda: (f.id('broadcasts'), 'Sending', 25, 1, ('am', f.telegram_id()))),
+        ('cancel_broadcast', lambda: (database.create_broadcast(f.telegram_ids[0], {'en': "x"}, 'en', [],
+                                                                datetime.now() + timedelta(days=30)),)),
+        ('save_seen_update_ids', lambda: (f.update_ids(50), 10000)),
+        ('save_bot_setting_hash', lambda: ('webhook', f.key())),
+        ('save_persistence', lambda: ([('user_data', str(f.telegram_id()), json.dumps({'lang': 'am'}))
+                                       for _ in range(20)], 'bench')),
+        ('delete_customer', lambda: (f.new_customer(database),)),
+        ('permanently_delete_customer', lambda: (f.new_customer(database),)),
+    )
+    for name, arguments in reads:
+        yield name, getattr(database, name), arguments
+        if name in cached:
+            yield f"{name} (uncached)", cached[name], arguments
+    for name, arguments in writes:
+        yield name, getattr(database, name), arguments
+
+
+def measure(function, arguments, min_rounds, max_rounds, max_time, heavy=False):
+    """Per-call times in seconds; arguments() is called outside the timing for every round."""
+    if asyncio.iscoroutinefunction(function):
+        loop = asyncio.get_event_loop()
+        call = lambda *args: loop.run_until_complete(function(*args))
+    else:
+        call = function
+    if heavy:
+        min_rounds = max_rounds = 1
+    else:
+        call(*arguments())  # warm-up: imports, statement cache, page cache
+    times = []
+    deadline = time.perf_counter() + max_time
+    while len(times) < max_rounds and (len(times) < min_rounds or time.perf_counter() < deadline):
+        args = arguments()
+        started = time.perf_counter()
+        call(*args)
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def summary(times):
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'stddev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'max': max(times),
+        'rounds': len(times),
+    }
+
+
+def run_size(args):
+    """Child process: DATABASE_PATH points at a copy of the dataset."""
+    from ET_HONEY import database
+
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    fixture = Fixture(database.DB_PATH, seed=args.seed)
+    only = re.compile(args.only) if args.only else None
+    skip = re.compile(args.skip) if args.skip else None
+    os.chdir(os.path.dirname(database.DB_PATH))  # export_table_to_excel writes to ./exports
+    results = {}
+    for name, function, arguments in cases(database, fixture):
+        if (only and not only.search(name)) or (skip and skip.search(name)):
+            continue
+        try:
+            times = measure(function, arguments, args.min_rounds, args.max_rounds, args.max_time,
+                            heavy=name in HEAVY)
+        except Exception as e:
+            print(f"  {name}: failed: {e}", file=sys.stderr)
+            continue
+        results[name] = summary(times)
+        stats = results[name]
+        print(f"  {name:<48} median {stats['median'] * 1000:10.3f} ms  "
+              f"(min {stats['min'] * 1000:.3f}, max {stats['max'] * 1000:.3f}, {stats['rounds']} rounds)",
+              file=sys.stderr)
+    database.writer.stop()
+    with open(args.output, "w") as f:
+        json.dump(results, f)
+
+
+def dataset_path(data_dir, rows, seed):
+    """The dataset for `rows`, generated on first use."""
+    path = os.path.join(data_dir, f"rows_{rows}_seed{seed}.db")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        started = time.perf_counter()
+        partial = path + ".partial"
+        if os.path.exists(partial):
+            os.remove(partial)
+        counts = dataset.generate(partial, seed=seed, **dataset.rows_for(rows))
+        os.replace(partial, path)
+        print(f"generated {path} in {time.perf_counter() - started:.1f}s: {counts}", file=sys.stderr)
+    return path
+
+
+def benchmark(args, rows):
+    source = dataset_path(args.data_dir, rows, args.seed)
+    work = tempfile.mkdtemp(prefix=f"bench_database_{rows}_")
+    try:
+        shutil.copy(source, os.path.join(work, "honey_trading.db"))
+        output = os.path.join(work, "results.json")
+        env = dict(os.environ, DATABASE_PATH=os.path.join(work, "honey_trading.db"), SLOW_QUERY_MS="1e12",
+                   SLOW_QUERY_LOG=os.path.join(work, "slow_queries.log"))
+        command = [sys.executable, os.path.abspath(__file__), "--child", "--output", output, "--seed", str(args.seed),
+                   "--min-rounds", str(args.min_rounds), "--max-rounds", str(args.max_rounds),
+                   "--max-time", str(args.max_time)]
+        command += ["--only", args.only] if args.only else []
+        command += ["--skip", args.skip] if args.skip else []
+        print(f"{rows} rows:", file=sys.stderr)
+        subprocess.run(command, env=env, check=True, stdout=sys.stderr)  # export_table_to_excel prints
+        with open(output) as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def report(results):
+    sizes = sorted(results, key=int)
+    names = list(dict.fromkeys(name for size in sizes for name in results[size]))
+    header = "".join(f"{int(size):>12,}" for size in sizes)
+    print(f"\nmedian ms per call{'':<32}{header}      growth")
+    for name in names:
+        medians = [results[size].get(name, {}).get('median') for size in sizes]
+        cells = "".join(f"{median * 1000:12.3f}" if median is not None else f"{'-':>12}" for median in medians)
+        known = [median for median in medians if median is not None]
+        growth = f"{known[-1] / known[0]:9.1f}x" if len(known) > 1 and known[0] > 0 else ""
+        print(f"{name:<50}{cells}  {growth}")
+
+
+def compare(results, baseline, threshold):
+    """Prints functions whose median moved by more than threshold; returns the number that got slower."""
+    slower = 0
+    print(f"\ncompared with the baseline (threshold {threshold:.2f}x):")
+    for size in sorted(results, key=int):
+        for name, stats in results[size].items():
+            before = baseline.get(size, {}).get(name)
+            if not before or not before['median']:
+                continue
+            ratio = stats['median'] / before['median']
+            if ratio >= threshold:
+                slower += 1
+                print(f"  SLOWER  {int(size):>9,} rows  {name:<48} {before['median'] * 1000:10.3f} -> "
+                      f"{stats['median'] * 1000:10.3f} ms ({ratio:.2f}x)")
+            elif ratio <= 1 / threshold:
+                print(f"  faster  {int(size):>9,} rows  {name:<48} {before['median'] * 1000:10.3f} -> "
+                      f"{stats['median'] * 1000:10.3f} ms ({ratio:.2f}x)")
+    if not slower:
+        print("  no regressions")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma separated dataset sizes (rows)")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "et_honey_datasets"),
+                        help="where generated datasets are kept between runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="only functions matching this regular expression")
+    parser.add_argument("--skip", help="skip functions matching this regular expression, e.g. export")
+    parser.add_argument("--min-rounds", type=int, default=5)
+    parser.add_argument("--max-rounds", type=int, default=1000)
+    parser.add_argument("--max-time", type=float, default=1.0, help="seconds of rounds per function")
+    parser.add_argument("--json", help="save the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown that counts as a regression")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_size(args)
+        return
+
+    results = {}
+    for rows in (int(size) for size in args.sizes.split(",")):
+        results[str(rows)] = benchmark(args, rows)
+    report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Write throughput: per-call commits vs. the single writer with group commit.
+
+Many concurrent tasks append support messages. In per-call mode each write
+opens a connection and commits on a worker thread (what add_message does when
+called through asyncio.to_thread); in writer mode the same writes go through
+add_message_async and are committed in batches by the writer thread.
+
+Usage:
+    python benchmarks/bench_db_writer.py [--tasks 200] [--writes 20]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "bench_db_writer.db"))
+
+from ET_HONEY import database
+
+
+async def per_call(ticket_id, writes, errors):
+    for i in range(writes):
+        try:
+            await asyncio.to_thread(database.add_message, ticket_id, 'user', f"message {i}")
+        except Exception as e:
+            errors.append(str(e))
+
+
+async def via_writer(ticket_id, writes, errors):
+    for i in range(writes):
+        try:
+            await database.add_message_async(ticket_id, 'user', f"message {i}")
+        except Exception as e:
+            errors.append(str(e))
+
+
+async def run(mode, ticket_ids, writes):
+    errors = []
+    started = time.perf_counter()
+    await asyncio.gather(*(mode(ticket_id, writes, errors) for ticket_id in ticket_ids))
+    return time.perf_counter() - started, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=200, help="concurrent writers")
+    parser.add_argument("--writes", type=int, default=20, help="writes per task")
+    args = parser.parse_args()
+
+    database.init_db()
+    ticket_ids = [
+        database.create_ticket_once(f"bench-{i}", i, 'Inquiry', 'Benchmark', 'hello')[0] for i in range(args.tasks)
+    ]
+    total = args.tasks * args.writes
+    print(f"{total} writes from {args.tasks} concurrent tasks, database {database.DB_PATH}")
+
+    for name, mode in (("per-call commit", per_call), ("group commit", via_writer)):
+        elapsed, errors = asyncio.run(run(mode, ticket_ids, args.writes))
+        print(f"{name:>16}: {elapsed:6.2f}s {(total - len(errors)) / elapsed:9.1f} writes/s  errors={len(errors)}")
+        for error in sorted(set(errors))[:3]:
+            print(f"                  {error}")
+
+    database.writer.stop()
+    stats = database.writer.stats
+    print(f"writer: {stats['operations']} operations in {stats['transactions']} transactions "
+          f"(largest batch {stats['largest_batch']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Cost of a log call on the event loop thread: direct handlers vs. the queued setup.
+
+Logs the same handler-style messages through the old basicConfig setup (the
+stream and file handlers format and write on the calling thread) and through
+log_config.setup_logging() in text and JSON format, where the caller only
+filters and enqueues. Output goes to a temporary file and to /dev/null
+instead of stderr. Also shows the cost of a message below the log level with
+an f-string vs. lazy arguments, and of a noisy message once sampling drops it.
+
+Usage:
+    python benchmarks/bench_logging.py [--calls 50000]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ET_HONEY import log_config
+
+CUSTOMER = {'id': 42, 'telegram_id': 123456789, 'full_name': 'Abebe Kebede', 'region': 'Addis Ababa', 'is_admin': 0}
+
+
+def log_lazy(calls):
+    for i in range(calls):
+        logging.info("start_registration: Customer for user_id %s: %s", i, CUSTOMER)
+
+
+def log_fstring(calls):
+    for i in range(calls):
+        logging.info(f"start_registration: Customer for user_id {i}: {CUSTOMER}")
+
+
+def log_debug_fstring(calls):
+    for i in range(calls):
+        logging.debug(f"start_registration: Customer for user_id {i}: {CUSTOMER}")
+
+
+def log_debug_lazy(calls):
+    for i in range(calls):
+        logging.debug("start_registration: Customer for user_id %s: %s", i, CUSTOMER)
+
+
+def timed(function, calls):
+    started = time.perf_counter()
+    function(calls)
+    return (time.perf_counter() - started) / calls
+
+
+def direct(log_file):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO,
+        handlers=[logging.StreamHandler(), logging.FileHandler(log_file)],
+        force=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=50000)
+    args = parser.parse_args()
+    sys.stderr = open(os.devnull, "w")  # StreamHandler() picks up sys.stderr when it is created
+    directory = tempfile.mkdtemp(prefix="logs_")
+
+    results = []
+    direct(os.path.join(directory, "direct.log"))
+    results.append(("direct, f-string", timed(log_fstring, args.calls), None))
+    logging.getLogger().handlers.clear()
+
+    for log_format in ("text", "json"):
+        log_file = os.path.join(directory, f"queued_{log_format}.log")
+        log_config.setup_logging(log_format=log_format, log_file=log_file, sample_burst=0)
+        results.append((f"queued {log_format}, lazy", timed(log_lazy, args.calls), None))
+        drained = time.perf_counter()
+        log_config.stop_logging()
+        results[-1] = results[-1][:2] + (time.perf_counter() - drained,)
+
+    log_config.setup_logging(log_file=os.path.join(directory, "debug.log"), sample_burst=0)
+    results.append(("below level, f-string", timed(log_debug_fstring, args.calls), None))
+    results.append(("below level, lazy", timed(log_debug_lazy, args.calls), None))
+    log_config.stop_logging()
+
+    log_config.setup_logging(log_file=os.path.join(directory, "sampled.log"), sample_burst=20)
+    results.append(("sampled (burst 20/60s)", timed(log_lazy, args.calls), None))
+    log_config.stop_logging()
+    with open(os.path.join(directory, "sampled.log"), encoding="utf-8") as f:
+        sampled_lines = sum(1 for _ in f)
+
+    sys.stderr = sys.__stderr__
+    print(f"{args.calls} log calls, files in {directory}")
+    for name, per_call, drain in results:
+        extra = f"  (listener needed {drain * 1000:.0f} ms more to drain)" if drain else ""
+        print(f"{name:>24}: {per_call * 1e6:6.2f} us/call on the calling thread{extra}")
+    print(f"sampled run wrote {sampled_lines} lines")
+    with open(os.path.join(directory, "queued_json.log"), encoding="utf-8") as f:
+        print(f"json line: {f.readline().strip()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Per-update cost of the /metrics instrumentation.
+
+Pushes the same updates through Application.process_update twice: once with
+plain handler callbacks and once after metrics.instrument_application()
+wrapped them, and reports the extra time per update. Handlers return
+immediately, so the difference is the instrumentation alone.
+
+Usage:
+    python benchmarks/bench_metrics.py [--updates 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telegram.ext import ApplicationBuilder, ConversationHandler, MessageHandler, filters
+
+from bench_concurrency import OfflineRequest, make_updates
+from ET_HONEY import metrics
+
+STEP = 0
+
+
+async def start(update, context):
+    return STEP
+
+
+async def step(update, context):
+    return STEP
+
+
+async def run(updates, instrument, rounds):
+    application = ApplicationBuilder().token("123:abc").request(OfflineRequest()).get_updates_request(OfflineRequest()).build()
+    application.add_handler(ConversationHandler(
+        entry_points=[MessageHandler(filters.Regex('^0$'), start)],
+        states={STEP: [MessageHandler(filters.TEXT, step)]},
+        fallbacks=[],
+    ))
+    if instrument:
+        metrics.instrument_application(application)
+    best = None
+    async with application:
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for update in updates:
+                await application.process_update(update)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+    return best / len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5, help="best of N rounds")
+    args = parser.parse_args()
+
+    if not metrics.ENABLED:
+        print("prometheus_client is not installed")
+        return
+    updates = make_updates(args.updates // 4, 4)
+    plain = asyncio.run(run(updates, False, args.rounds))
+    instrumented = asyncio.run(run(updates, True, args.rounds))
+    print(f"{len(updates)} updates through a ConversationHandler, best of {args.rounds}")
+    print(f"       plain: {plain * 1e6:7.1f} us/update")
+    print(f"instrumented: {instrumented * 1e6:7.1f} us/update  (+{(instrumented - plain) * 1e6:.1f} us)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Throughput of multi-process mode against the number of worker processes.
+
+Raw update payloads are routed with multiworker.worker_for() into one queue
+per worker process, exactly like the front process does, and each worker runs
+them through multiworker.consume() and an UpdateWorkerPool. Handlers burn a
+little CPU (parsing/rendering stand-in) and then wait (Bot API stand-in), so
+extra processes only help while there are cores to run them on. Also checks
+that every chat's updates were handled in order.
+
+Usage:
+    python benchmarks/bench_multiworker.py [--workers 1 2 4] [--users 500] [--cpu-ms 1]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+from bench_concurrency import OfflineRequest, make_updates
+from ET_HONEY.multiworker import consume, worker_for
+from ET_HONEY.update_queue import UpdateWorkerPool, PerChatUpdateProcessor
+
+
+def bench_worker(index, updates, results, cpu_ms, latency, concurrency):
+    asyncio.run(_bench_worker(index, updates, results, cpu_ms, latency, concurrency))
+
+
+async def _bench_worker(index, updates, results, cpu_ms, latency, concurrency):
+    builder = ApplicationBuilder().token("123:abc").request(OfflineRequest()).get_updates_request(OfflineRequest())
+    if concurrency > 1:
+        builder = builder.concurrent_updates(PerChatUpdateProcessor(concurrency))
+    application = builder.build()
+    last_seq = {}
+    errors = []
+
+    async def handler(update, context):
+        chat_id = update.effective_chat.id
+        seq = int(update.message.text)
+        if last_seq.get(chat_id, -1) != seq - 1:
+            errors.append(f"chat {chat_id}: got {seq} after {last_seq.get(chat_id)}")
+        last_seq[chat_id] = seq
+        deadline = time.perf_counter() + cpu_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+        await asyncio.sleep(latency)
+
+    application.add_handler(TypeHandler(Update, handler))
+    async with application:
+        pool = UpdateWorkerPool(application, workers=max(4, concurrency), maxsize=1000)
+        pool.start()
+        results.put(('ready', index))
+        await consume(application, pool, updates)
+        await pool.stop()
+    results.put(('done', index, pool.stats['processed'], errors))
+
+
+def run(count, payloads, args):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    queues = [context.Queue(maxsize=1000) for _ in range(count)]
+    processes = [
+        context.Process(target=bench_worker, args=(i, queues[i], results, args.cpu_ms, args.latency, args.concurrency))
+        for i in range(count)
+    ]
+    for process in processes:
+        process.start()
+    for _ in range(count):
+        results.get()  # ready
+
+    started = time.perf_counter()
+    for payload, chat_id in payloads:
+        queues[worker_for({'message': {'chat': {'id': chat_id}}}, count)].put(payload)
+    for updates in queues:
+        updates.put(None)
+    processed = 0
+    errors = []
+    for _ in range(count):
+        _, index, done, worker_errors = results.get()
+        processed += done
+        errors.extend(worker_errors)
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    return elapsed, processed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=4, help="messages per user")
+    parser.add_argument("--cpu-ms", type=float, default=1.0, help="CPU time per update in milliseconds")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated Bot API wait in seconds")
+    parser.add_argument("--concurrency", type=int, default=1, help="UPDATE_CONCURRENCY per process")
+    args = parser.parse_args()
+
+    payloads = [(update.to_json().encode(), update.effective_chat.id) for update in make_updates(args.users, args.messages)]
+    print(f"{len(payloads)} updates from {args.users} users, {args.cpu_ms} ms CPU + "
+          f"{args.latency * 1000:.0f} ms wait per update, {os.cpu_count()} CPUs")
+
+    baseline = None
+    for count in args.workers:
+        elapsed, processed, errors = run(count, payloads, args)
+        rate = processed / elapsed
+        baseline = baseline or rate
+        print(f"{count:>3} workers: {elapsed:6.2f}s {rate:9.1f} updates/s  speedup={rate / baseline:4.1f}x  "
+              f"processed={processed} errors={len(errors)}")
+        for error in errors[:5]:
+            print(f"    {error}")
+
+
+if __name__ == "__main__":
+    main()
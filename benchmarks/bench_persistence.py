@@ -0,0 +1,105 @@
+"""Overhead of SQLitePersistence per update.
+
+Runs simulated users through a three-step ConversationHandler that writes to
+user_data (like the order flow), once without persistence and once with the
+SQLite write-behind persistence, and reports the extra time per update plus
+how the writes were batched.
+
+Usage:
+    python benchmarks/bench_persistence.py [--users 500] [--update-interval 0.5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "bench_persistence.db"))
+
+from telegram.ext import ApplicationBuilder, ConversationHandler, MessageHandler, filters
+
+from bench_concurrency import OfflineRequest, make_updates
+from ET_HONEY import database
+from ET_HONEY.persistence import SQLitePersistence
+
+PRODUCT, QUANTITY = range(2)
+
+
+async def start(update, context):
+    context.user_data['order_product'] = "Honey"
+    return PRODUCT
+
+
+async def product(update, context):
+    context.user_data['order_quantity'] = int(update.message.text)
+    return QUANTITY
+
+
+async def quantity(update, context):
+    context.user_data['order_address'] = f"Street {update.effective_user.id}"
+    return ConversationHandler.END
+
+
+async def run(updates, persistence):
+    builder = ApplicationBuilder().token("123:abc").request(OfflineRequest()).get_updates_request(OfflineRequest())
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    application = builder.build()
+    application.add_handler(ConversationHandler(
+        entry_points=[MessageHandler(filters.TEXT, start)],
+        states={
+            PRODUCT: [MessageHandler(filters.TEXT, product)],
+            QUANTITY: [MessageHandler(filters.TEXT, quantity)],
+        },
+        fallbacks=[],
+        name='order',
+        persistent=persistence is not None,
+    ))
+
+    async with application:
+        await application.start()
+        started = time.perf_counter()
+        for update in updates:
+            await application.process_update(update)
+        elapsed = time.perf_counter() - started
+        # Let a few persistence intervals run so the cost of the hand-off is included
+        if persistence is not None:
+            await asyncio.sleep(persistence.update_interval * 2 + persistence.flush_interval)
+        stop_started = time.perf_counter()
+        await application.stop()
+        stop_elapsed = time.perf_counter() - stop_started
+    return elapsed, stop_elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--update-interval", type=float, default=0.5)
+    parser.add_argument("--flush-interval", type=float, default=0.2)
+    args = parser.parse_args()
+
+    database.init_db()
+    updates = make_updates(args.users, 3)
+    print(f"{len(updates)} updates from {args.users} users, database {database.DB_PATH}")
+
+    asyncio.run(run(updates, None))  # warm-up
+    baseline, _ = asyncio.run(run(updates, None))
+    print(f"{'in memory':>12}: {baseline * 1e6 / len(updates):8.1f} us/update")
+
+    persistence = SQLitePersistence(update_interval=args.update_interval, flush_interval=args.flush_interval)
+    elapsed, stop_elapsed = asyncio.run(run(updates, persistence))
+    stats = persistence.stats
+    print(f"{'sqlite':>12}: {elapsed * 1e6 / len(updates):8.1f} us/update "
+          f"(+{(elapsed - baseline) * 1e6 / len(updates):.1f} us in the update path)")
+    print(f"{'':>12}  {stats['buffered']} buffered writes -> {stats['written']} rows in {stats['flushes']} "
+          f"transactions, {stats['flush_ms']:.1f} ms writing "
+          f"({stats['flush_ms'] * 1000 / len(updates):.1f} us/update), shutdown {stop_elapsed * 1000:.1f} ms")
+
+    persisted = database.load_persistence('user_data')
+    print(f"{'':>12}  {len(persisted)} users' data persisted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Overhead of the update profiler, and what its reports look like.
+
+Runs fast updates through an UpdateWorkerPool without a profiler, with the
+profiler on but nothing sampled or slow (the normal case), and with a 1%
+cProfile sample. Then sends one slow update (blocking CPU work followed by
+a long await) and prints the report that was written for it.
+
+Usage:
+    python benchmarks/bench_profiling.py [--updates 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+from bench_concurrency import OfflineRequest, make_updates
+from ET_HONEY import metrics
+from ET_HONEY.profiling import UpdateProfiler
+from ET_HONEY.update_queue import UpdateWorkerPool
+
+
+async def fast_handler(update, context):
+    pass
+
+
+async def slow_handler(update, context):
+    deadline = time.perf_counter() + 0.2
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    await asyncio.sleep(0.3)
+
+
+async def run(updates, profiler, handler):
+    application = ApplicationBuilder().token("123:abc").request(OfflineRequest()).get_updates_request(OfflineRequest()).build()
+    application.add_handler(TypeHandler(Update, handler))
+    metrics.instrument_application(application)
+    async with application:
+        pool = UpdateWorkerPool(application, workers=4, maxsize=len(updates), profiler=profiler)
+        pool.start()
+        started = time.perf_counter()
+        for update in updates:
+            pool.put(update)
+        await pool.queue.join()
+        elapsed = time.perf_counter() - started
+        await pool.stop()
+    return elapsed / len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="profiles_")
+    updates = make_updates(args.updates // 4, 4)
+    modes = (
+        ("no profiler", None),
+        ("nothing sampled", UpdateProfiler(directory, sample_rate=0, slow_ms=1000)),
+        ("1% sampled", UpdateProfiler(directory, sample_rate=0.01, slow_ms=1000, max_files=20)),
+    )
+    baseline = None
+    for name, profiler in modes:
+        per_update = asyncio.run(run(updates, profiler, fast_handler))
+        baseline = baseline or per_update
+        written = profiler.stats['written'] if profiler else 0
+        print(f"{name:>16}: {per_update * 1e6:7.1f} us/update (+{(per_update - baseline) * 1e6:5.1f} us)  "
+              f"reports written={written}")
+    print(f"{len(os.listdir(directory))} files kept in {directory} (max_files=20)")
+
+    slow_directory = tempfile.mkdtemp(prefix="profiles_slow_")
+    profiler = UpdateProfiler(slow_directory, slow_ms=50)
+    asyncio.run(run(updates[:1], profiler, slow_handler))
+    for file_name in os.listdir(slow_directory):
+        print(f"\n--- {file_name}")
+        with open(os.path.join(slow_directory, file_name), encoding="utf-8") as f:
+            print("\n".join(line[:160] for line in f.read().splitlines()[:12]))
+
+
+if __name__ == "__main__":
+    main()
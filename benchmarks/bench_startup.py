@@ -0,0 +1,86 @@
+"""Cold-start time of the webhook bot.
+
+Every start runs in a fresh process: import ET_HONEY.bot, then run the
+FastAPI lifespan up to the point where the app serves webhooks. Bot API
+calls go to a recording stand-in that waits --latency seconds per call,
+like a round trip to api.telegram.org. Starts are repeated against the same
+database, so the second one shows the skipped setup calls; a last start
+with BOT_SETUP_MODE=always shows what every restart used to cost.
+
+Usage:
+    python benchmarks/bench_startup.py [--latency 0.15]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+STARTED = time.perf_counter()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+async def child(latency):
+    from ET_HONEY import bot
+    imported = time.perf_counter()
+
+    from bench_concurrency import OfflineRequest
+
+    calls = []
+
+    class RecordingRequest(OfflineRequest):
+        async def do_request(self, url, method, request_data=None, *args, **kwargs):
+            name = url.rsplit('/', 1)[-1]
+            calls.append(name)
+            await asyncio.sleep(latency)
+            if name == "getMe":
+                return await super().do_request(url, method, request_data, *args, **kwargs)
+            return 200, json.dumps({"ok": True, "result": True}).encode()
+
+    bot.build_request = lambda kind='interactive': RecordingRequest()
+    async with bot.lifespan(bot.app):
+        ready = time.perf_counter()
+    return {
+        'import': imported - STARTED,
+        'startup': ready - imported,
+        'total': ready - STARTED,
+        'calls': calls,
+        'pandas': 'pandas' in sys.modules,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.15, help="simulated Bot API round trip in seconds")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(child(args.latency))))
+        return
+
+    env = dict(os.environ, BOT_TOKEN="123:abc", WEBHOOK_URL="https://example.com",
+               DATABASE_PATH=os.path.join(tempfile.mkdtemp(), "bench_startup.db"))
+    env.pop("BOT_SETUP_MODE", None)
+    print(f"Bot API round trip {args.latency * 1000:.0f} ms")
+    for name, extra in (("first start", {}), ("restart", {}), ("restart, always", {"BOT_SETUP_MODE": "always"})):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--latency", str(args.latency)],
+                                env=dict(env, **extra), capture_output=True, text=True)
+        if output.returncode != 0:
+            print(f"{name:>16}: failed\n{output.stderr[-2000:]}")
+            continue
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        print(f"{name:>16}: {result['total']:5.2f}s (import {result['import']:.2f}s, startup {result['startup']:.2f}s)  "
+              f"{len(result['calls'])} Bot API calls: {', '.join(result['calls'])}  "
+              f"pandas imported: {result['pandas']}")
+
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import pandas"], check=True)
+    print(f"(import pandas alone, in a new process: {time.perf_counter() - started:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Overhead of update tracing, and the waterfall of a traced order confirmation.
+
+Each update runs a handler shaped like an order confirmation: a customer
+lookup, create_order, a notify_all_admins-style loop of send_message calls
+and a reply. Bot API calls go through BotRequest against an in-process httpx
+mock transport with a fixed latency, so Bot API spans are real. Runs without
+a tracer, with tracing on but nothing sampled, and with every update traced,
+then prints the slowest traces from the file.
+
+Usage:
+    python benchmarks/bench_tracing.py [--updates 400] [--latency-ms 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "bench_tracing.db"))
+
+import httpx
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+from bench_concurrency import make_updates
+from ET_HONEY import database, metrics, tracing
+from ET_HONEY.request import BotRequest
+from ET_HONEY.tracing import UpdateTracer, traced
+from ET_HONEY.update_queue import UpdateWorkerPool
+
+ADMINS = (9001, 9002, 9003)
+
+
+def mock_transport(latency):
+    me = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+    async def handle(request):
+        await asyncio.sleep(latency)
+        method = request.url.path.rsplit('/', 1)[-1]
+        if method == "getMe":
+            return httpx.Response(200, json={"ok": True, "result": me})
+        chat_id = int(parse_qs(request.content.decode()).get("chat_id", ["1"])[0])
+        message = {"message_id": 1, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}, "text": "ok"}
+        return httpx.Response(200, json={"ok": True, "result": message})
+
+    return httpx.MockTransport(handle)
+
+
+@traced
+async def notify_admins(context, text):
+    for admin_id in ADMINS:
+        await context.bot.send_message(chat_id=admin_id, text=text)
+
+
+async def confirm_order(update, context):
+    database.get_customer_by_telegram_id(update.effective_user.id)
+    order_id = database.create_order(update.effective_user.id, "Honey 1kg", 2, "Addis Ababa", "cash", 900)
+    await notify_admins(context, f"New order #{order_id}")
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Order #{order_id} confirmed")
+
+
+async def run(updates, tracer, latency):
+    request = BotRequest(connection_pool_size=64, httpx_kwargs={'transport': mock_transport(latency)})
+    application = ApplicationBuilder().token("123:abc").request(request).get_updates_request(
+        BotRequest(httpx_kwargs={'transport': mock_transport(0)})).concurrent_updates(16).build()
+    application.add_handler(TypeHandler(Update, confirm_order))
+    metrics.instrument_application(application)
+    async with application:
+        pool = UpdateWorkerPool(application, workers=16, maxsize=len(updates), tracer=tracer)
+        pool.start()
+        started = time.perf_counter()
+        for update in updates:
+            pool.put(update)
+        await pool.queue.join()
+        elapsed = time.perf_counter() - started
+        await pool.stop()
+    return elapsed / len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=400)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    database.init_db()
+    database.init_db()  # the column migrations only apply once the tables exist
+    path = os.path.join(tempfile.mkdtemp(prefix="traces_"), "traces.jsonl")
+    updates = make_updates(args.updates // 4, 4)
+    modes = (
+        ("no tracer", None),
+        ("nothing sampled", UpdateTracer(sample_rate=0, path=path)),
+        ("all traced", UpdateTracer(sample_rate=1.0, path=path)),
+    )
+    baseline = None
+    for name, tracer in modes:
+        per_update = asyncio.run(run(updates, tracer, args.latency_ms / 1000))
+        baseline = baseline or per_update
+        exported = tracer.stats['exported'] if tracer else 0
+        print(f"{name:>16}: {per_update * 1e3:7.3f} ms/update (+{(per_update - baseline) * 1e6:6.1f} us)  "
+              f"traces exported={exported}")
+
+    tracing.stop_trace_export()  # flush the queued traces to the file
+    traces = tracing.load_traces(path)
+    slowest = sorted(traces.values(), key=lambda spans: max(span['duration_ms'] for span in spans), reverse=True)
+    print(f"\n{len(traces)} traces in {path}; slowest:\n")
+    print(tracing.waterfall(slowest[0]))
+
+
+if __name__ == "__main__":
+    main()
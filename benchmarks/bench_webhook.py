@@ -0,0 +1,169 @@
+"""Webhook throughput and latency with and without the fast JSON path.
+
+Posts update payloads to the bot's /webhook endpoint in-process (through the
+ASGI app, no sockets), with the update pool not started so only parsing,
+Update.de_json and queueing are measured. Also times the Bot API side:
+encoding a sendMessage payload with an inline keyboard and decoding a
+response. Each mode runs in its own process because FAST_JSON is read at
+import time.
+
+Usage:
+    python benchmarks/bench_webhook.py [--requests 20000] [--concurrency 10]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+MODES = (
+    ("stdlib json", {"FAST_JSON": "0"}, "asyncio"),
+    ("orjson", {"FAST_JSON": "1"}, "asyncio"),
+    ("orjson + uvloop", {"FAST_JSON": "1"}, "uvloop"),
+)
+
+
+def make_payloads(count):
+    """Mixes text messages and button presses from many users, as serialized by Telegram."""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    from bench_concurrency import make_updates
+
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(f"Product {i}", callback_data=f"order_product:{i}")]
+                                     for i in range(8)]).to_dict()
+    payloads = []
+    for update in make_updates(count // 4 or 1, 4)[:count]:
+        data = update.to_dict()
+        if update.update_id % 2:
+            message = dict(data['message'], reply_markup=keyboard, text="Choose a product")
+            data = {'update_id': data['update_id'],
+                    'callback_query': {'id': str(update.update_id), 'from': message['from'], 'chat_instance': "1",
+                                       'data': "order_product:3", 'message': message}}
+        payloads.append(json.dumps(data).encode())
+    return payloads
+
+
+async def post_all(app, payloads, concurrency):
+    import httpx
+
+    latencies = []
+    statuses = {}
+    pending = iter(payloads)
+
+    async def client_loop(client):
+        for body in pending:
+            started = time.perf_counter()
+            response = await client.post("/webhook", content=body, headers={"Content-Type": "application/json"})
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return elapsed, sorted(latencies), statuses
+
+
+async def child(args):
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    from telegram.ext import ApplicationBuilder
+    from telegram.request import RequestData
+    from telegram.request._requestparameter import RequestParameter
+
+    from bench_concurrency import OfflineRequest
+    from ET_HONEY import bot, request
+    from ET_HONEY.update_queue import UpdateWorkerPool
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    application = ApplicationBuilder().token("123:abc").request(OfflineRequest()).get_updates_request(OfflineRequest()).build()
+    payloads = make_payloads(args.requests)
+    async with application:
+        bot.application = application
+        # Not started: updates are only queued, so handlers don't run
+        bot.update_pool = UpdateWorkerPool(application, maxsize=len(payloads) + 1)
+        await post_all(bot.app, payloads[:500], args.concurrency)  # warm up
+        bot.update_pool = UpdateWorkerPool(application, maxsize=len(payloads) + 1)
+        elapsed, latencies, statuses = await post_all(bot.app, payloads, args.concurrency)
+
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(f"Product {i} - 500 ETB", callback_data=f"order_product:{i}")]
+                                     for i in range(20)])
+    parameters = [RequestParameter.from_input(name, value) for name, value in
+                  {'chat_id': 123456789, 'text': "🍯 Our products:\n" * 20, 'reply_markup': keyboard}.items()]
+    request_data = RequestData(parameters)
+    response = json.dumps({'ok': True, 'result': json.loads(payloads[0])['callback_query']['message']}).encode()
+    encode = request._FastJSONRequestData(request_data) if request.FAST_JSON else request_data
+    rounds = 5000
+    started = time.perf_counter()
+    for _ in range(rounds):
+        encode.json_parameters
+    encode_us = (time.perf_counter() - started) / rounds * 1e6
+    started = time.perf_counter()
+    for _ in range(rounds):
+        request.BotRequest.parse_json_payload(response)
+    decode_us = (time.perf_counter() - started) / rounds * 1e6
+
+    print(json.dumps({
+        'rate': len(latencies) / elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p99': latencies[int(len(latencies) * 0.99)] * 1000,
+        'statuses': statuses,
+        'encode_us': encode_us,
+        'decode_us': decode_us,
+        'fast_json': request.FAST_JSON,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=10, help="requests in flight")
+    parser.add_argument("--child", choices=["asyncio", "uvloop"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        if args.child == "uvloop":
+            import uvloop
+            uvloop.run(child(args))
+        else:
+            asyncio.run(child(args))
+        return
+
+    print(f"{args.requests} webhook requests, {args.concurrency} in flight")
+    baseline = None
+    for name, env, loop in MODES:
+        if loop == "uvloop":
+            try:
+                import uvloop  # noqa: F401
+            except ImportError:
+                print(f"{name:>16}: skipped (uvloop not installed)")
+                continue
+        child_env = dict(os.environ, **env)
+        child_env.pop("WEBHOOK_SECRET", None)
+        child_env.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "bench_webhook.db"))
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", loop,
+             "--requests", str(args.requests), "--concurrency", str(args.concurrency)],
+            env=child_env, capture_output=True, text=True,
+        )
+        if output.returncode != 0:
+            print(f"{name:>16}: failed\n{output.stderr[-2000:]}")
+            continue
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        if env["FAST_JSON"] == "1" and not result['fast_json']:
+            print(f"{name:>16}: skipped (orjson not installed)")
+            continue
+        baseline = baseline or result['rate']
+        print(f"{name:>16}: {result['rate']:8.0f} req/s ({result['rate'] / baseline:4.2f}x)  "
+              f"p50={result['p50']:.2f}ms p99={result['p99']:.2f}ms  "
+              f"Bot API encode={result['encode_us']:.1f}us decode={result['decode_us']:.1f}us  "
+              f"status={result['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
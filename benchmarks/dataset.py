@@ -0,0 +1,384 @@
+"""Synthetic dataset generator: fills a database with realistic customers, products, orders and support traffic.
+
+Tables are created with database.init_db() and then bulk loaded with plain
+executemany, so a million-row dataset takes about a minute rather than the
+hours a million add_customer()/create_order() calls would. Distributions follow what
+the bot sees in production:
+
+- customers: mostly Addis Ababa, a bit over half with Amharic as their
+  language (most of those with their name in Ge'ez script), a few admins,
+  some pending, rejected or deleted accounts, sign-ups growing over two years
+- products: a small catalogue of honey, comb, wax and tej kits named in
+  English or Amharic, log-normal prices, some out of stock
+- orders and tickets: a few customers place most of them (Zipf-like), and
+  popular products sell far more than the rest; recent orders are pending
+- messages: every ticket has the customer's first message, the remaining
+  ones go to a minority of long threads alternating customer and admin
+- feedback: mostly 4 and 5 stars, some with a photo
+- bot persistence rows (user_data for every customer, conversation states
+  for some), a handful of broadcasts and the seen-updates ring
+
+rows_for(N) gives the table sizes used for an N-row dataset: N orders and N
+messages, N/4 tickets, N/5 customers, N/10 feedback.
+
+Usage:
+    python benchmarks/dataset.py OUTPUT.db [--rows 100000] [--seed 0]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+CHUNK = 20000
+HISTORY_DAYS = 730
+
+FIRST_NAMES = (
+    ("Abebe", "አበበ"), ("Kebede", "ከበደ"), ("Almaz", "አልማዝ"), ("Tigist", "ትዕግስት"), ("Hana", "ሐና"),
+    ("Dawit", "ዳዊት"), ("Selam", "ሰላም"), ("Meron", "ሜሮን"), ("Yonas", "ዮናስ"), ("Bethlehem", "ቤተልሔም"),
+    ("Mulugeta", "ሙሉጌታ"), ("Alemu", "አለሙ"), ("Tsion", "ጽዮን"), ("Samuel", "ሳሙኤል"), ("Liya", "ሊያ"),
+    ("Henok", "ሄኖክ"), ("Mekdes", "መቅደስ"), ("Girma", "ግርማ"), ("Genet", "ገነት"), ("Biruk", "ብሩክ"),
+    ("Yared", "ያሬድ"), ("Rahel", "ራሔል"), ("Solomon", "ሰለሞን"), ("Eden", "ኤደን"), ("Haile", "ኃይሌ"),
+    ("Tewodros", "ቴዎድሮስ"), ("Aster", "አስቴር"), ("Mahlet", "ማህሌት"), ("Fikru", "ፍቅሩ"), ("Zewdu", "ዘውዱ"),
+)
+REGIONS = (
+    ("Addis Ababa", 45), ("Oromia", 15), ("Amhara", 12), ("Tigray", 5), ("Sidama", 4), ("SNNPR", 5),
+    ("Dire Dawa", 4), ("Harari", 2), ("Afar", 2), ("Somali", 2), ("Benishangul-Gumuz", 1), ("Gambela", 1),
+    ("South West Ethiopia", 2),
+)
+SUB_CITIES = ("Bole", "Kirkos", "Yeka", "Arada", "Lideta", "Kolfe Keranio", "Nifas Silk-Lafto", "Akaky Kaliti",
+              "Gulele", "Addis Ketema", "Lemi Kura")
+SUB_CITIES_AM = ("ቦሌ", "ቂርቆስ", "የካ", "አራዳ", "ልደታ", "ኮልፌ ቀራንዮ", "ንፋስ ስልክ ላፍቶ", "አቃቂ ቃሊቲ", "ጉለሌ",
+                 "አዲስ ከተማ", "ለሚ ኩራ")
+ORIGINS = (("Sheka", "ሸካ"), ("Gojam", "ጎጃም"), ("Tigray", "ትግራይ"), ("Wollo", "ወሎ"), ("Harar", "ሐረር"),
+           ("Bale", "ባሌ"), ("Kaffa", "ከፋ"), ("Wolayta", "ወላይታ"), ("Gondar", "ጎንደር"), ("Jimma", "ጅማ"))
+PRODUCT_TYPES = (
+    # (English, Amharic, category, price in birr, quantities)
+    ("Forest Honey", "የጫካ ማር", "Forest", 650, "500g, 1kg, 2kg"),
+    ("White Honey", "ነጭ ማር", "Premium", 1100, "250g, 500g, 1kg"),
+    ("Raw Honey", "ጥሬ ማር", "Raw", 500, "1kg, 2kg, 5kg"),
+    ("Honeycomb", "የማር እንጀራ", "Comb", 800, "500g, 1kg"),
+    ("Beeswax", "ሰም", "Wax", 300, "250g, 1kg"),
+    ("Tej Kit", "የጠጅ መጥመቂያ", "Kits", 1500, None),
+)
+DESCRIPTIONS = (
+    "Raw honey harvested from {origin} forests, unfiltered and unheated.",
+    "Single-origin {type} from smallholder beekeepers in {origin}.",
+    "Thick, aromatic {type} — ideal for tej and breakfast.",
+    "ከ{origin_am} የተሰበሰበ ንጹህ {type_am}።",
+    "በባህላዊ ቀፎ የተመረተ {type_am} ከ{origin_am}።",
+)
+MESSAGES_EN = (
+    "Hello, when will my order #{order} be delivered?",
+    "I paid by transfer yesterday, please confirm the payment.",
+    "The {product} I received was crystallized, is that normal?",
+    "Can I change the delivery address for my last order?",
+    "Do you deliver to {region}?",
+    "Is {product} available in 5kg?",
+    "Thank you, I received it.",
+    "Please cancel my order, I ordered twice by mistake.",
+)
+MESSAGES_AM = (
+    "ሰላም፣ ትዕዛዝ ቁጥር #{order} መቼ ይደርሳል?",
+    "ትላንትና በባንክ ከፍያለሁ፣ እባክዎ ያረጋግጡ።",
+    "የገዛሁት {product} ረግቷል፣ ችግር አለው?",
+    "የማድረሻ አድራሻዬን መቀየር እችላለሁ?",
+    "ወደ {region} ታደርሳላችሁ?",
+    "{product} በ5 ኪሎ አለ?",
+    "አመሰግናለሁ፣ ደርሶኛል።",
+    "እባክዎ ትዕዛዜን ይሰርዙ፣ በስህተት ሁለት ጊዜ አዝዣለሁ።",
+)
+REPLIES_EN = (
+    "Thanks for reaching out! Your order is on its way and should arrive within 2 days.",
+    "Payment confirmed, thank you.",
+    "Crystallization is natural for raw honey; warm the jar gently in water.",
+    "Done, we have updated the address.",
+    "Yes, we deliver there every Tuesday and Friday.",
+)
+REPLIES_AM = (
+    "ስላገኙን እናመሰግናለን! ትዕዛዝዎ በመንገድ ላይ ነው፣ በ2 ቀን ውስጥ ይደርሳል።",
+    "ክፍያው ተረጋግጧል፣ እናመሰግናለን።",
+    "ጥሬ ማር መርጋቱ ተፈጥሯዊ ነው፤ በሞቀ ውሃ ውስጥ ያሙቁት።",
+    "አድራሻው ተቀይሯል።",
+    "አዎ፣ ማክሰኞ እና አርብ እናደርሳለን።",
+)
+FEEDBACK_EN = ("Great honey, will order again!", "Delivery was late but the honey is excellent.",
+               "Best white honey in Addis.", "Packaging could be better.", "Too expensive for the size.",
+               "Fast delivery, thank you.")
+FEEDBACK_AM = ("በጣም ጥሩ ማር ነው፣ እንደገና አዛለሁ!", "ትንሽ ዘግይቷል ግን ማሩ ምርጥ ነው።", "ምርጥ ነጭ ማር።",
+               "ማሸጊያው ቢሻሻል ጥሩ ነው።", "ዋጋው ትንሽ ውድ ነው።", "ፈጣን አገልግሎት፣ እናመሰግናለን።")
+BROADCAST_TEXT = {'en': "New harvest of {product} is in! Order now.", 'am': "አዲስ የ{product} ምርት ደርሷል! አሁኑኑ ይዘዙ።"}
+
+
+def rows_for(rows):
+    """Table sizes for an N-row dataset."""
+    return {
+        'customers': max(rows // 5, 10),
+        'products': max(50, min(rows // 1000, 2000)),
+        'orders': rows,
+        'tickets': max(rows // 4, 1),
+        'messages': rows,
+        'feedback': rows // 10,
+    }
+
+
+def zipf_weights(n, s=1.1):
+    """Cumulative Zipf weights for choosing among n items, item 0 being the most popular."""
+    return list(accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+
+class _Clock:
+    """Creation times over the last HISTORY_DAYS, denser towards now (the bot has been growing)."""
+
+    def __init__(self, rng, now):
+        self.rng = rng
+        self.now = now
+
+    def created_at(self, after=None):
+        if after is None:
+            seconds = HISTORY_DAYS * 86400 * (1 - math.sqrt(self.rng.random()))
+            moment = self.now - timedelta(seconds=seconds)
+        else:
+            moment = min(after + timedelta(seconds=self.rng.expovariate(1 / 7200)), self.now)
+        return moment
+
+    @staticmethod
+    def text(moment):
+        return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _insert(conn, table, columns, rows):
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK:
+            conn.executemany(sql, chunk)
+            chunk = []
+    if chunk:
+        conn.executemany(sql, chunk)
+
+
+def _customers(rng, clock, count, admins):
+    telegram_ids = rng.sample(range(100_000_000, 8_000_000_000), count)
+    regions, region_weights = zip(*REGIONS)
+    region_cum = list(accumulate(region_weights))
+    customers = []
+    for i, telegram_id in enumerate(telegram_ids):
+        first, first_am = rng.choice(FIRST_NAMES)
+        father, father_am = rng.choice(FIRST_NAMES)
+        language = 'am' if rng.random() < 0.55 else 'en'
+        full_name = f"{first_am} {father_am}" if language == 'am' and rng.random() < 0.6 else f"{first} {father}"
+        username = f"{first.lower()}_{father.lower()[:3]}{rng.randint(1, 9999)}" if rng.random() < 0.65 else None
+        phone = f"09{rng.randint(10000000, 99999999)}" if rng.random() < 0.9 else None
+        email = f"{first.lower()}.{father.lower()}{rng.randint(1, 999)}@gmail.com" if rng.random() < 0.25 else None
+        region = rng.choices(regions, cum_weights=region_cum)[0]
+        status = 'Approved' if i < admins else rng.choices(('Approved', 'Pending', 'Rejected', 'Deleted'), (85, 8, 2, 5))[0]
+        customers.append((
+            telegram_id, username, full_name, phone, email, region, 'New' if rng.random() < 0.7 else 'Returning',
+            status, 1 if i < admins else 0, int(rng.random() < 0.9), int(rng.random() < 0.75),
+            int(rng.random() < 0.85), language, clock.text(clock.created_at()),
+        ))
+    return customers
+
+
+def _products(rng, clock, count):
+    products = []
+    seen = set()
+    for i in range(count):
+        (origin, origin_am), (kind, kind_am, category, base_price, quantities) = rng.choice(ORIGINS), rng.choice(PRODUCT_TYPES)
+        name = f"{origin_am} {kind_am}" if rng.random() < 0.3 else f"{origin} {kind}"
+        if name in seen:
+            name = f"{name} {i}"
+        seen.add(name)
+        description = rng.choice(DESCRIPTIONS).format(origin=origin, type=kind.lower(), origin_am=origin_am, type_am=kind_am)
+        price = round(rng.lognormvariate(math.log(base_price), 0.3) / 5) * 5
+        stock = 0 if rng.random() < 0.15 else int(rng.expovariate(1 / 40)) + 1
+        image_path = f"uploads/products/{i + 1}.jpg" if rng.random() < 0.7 else None
+        products.append((name, description, price, stock, image_path, quantities, category,
+                         clock.text(clock.created_at())))
+    return products
+
+
+def _quantity(rng, quantities):
+    if quantities and rng.random() < 0.6:
+        return rng.choice(quantities.split(', '))
+    return min(int(rng.expovariate(0.6)) + 1, 20)
+
+
+def _address(rng, customer):
+    region = customer[5]
+    if region == "Addis Ababa":
+        if customer[12] == 'am':
+            return f"አዲስ አበባ፣ {rng.choice(SUB_CITIES_AM)} ወረዳ {rng.randint(1, 14)}፣ የቤት ቁጥር {rng.randint(1, 2000)}"
+        return f"{rng.choice(SUB_CITIES)}, Woreda {rng.randint(1, 14)}, House {rng.randint(1, 2000)}, Addis Ababa"
+    return f"{region}, P.O. Box {rng.randint(100, 9999)}"
+
+
+def _orders(rng, clock, count, customers, products, customer_cum, product_cum):
+    for _ in range(count):
+        customer = rng.choices(customers, cum_weights=customer_cum)[0]
+        product = rng.choices(products, cum_weights=product_cum)[0]
+        created = clock.created_at()
+        if (clock.now - created).days < 3:
+            status = rng.choices(('Pending', 'Approved', 'Rejected'), (60, 35, 5))[0]
+        else:
+            status = rng.choices(('Approved', 'Rejected', 'Pending', 'cancel'), (82, 10, 5, 3))[0]
+        idempotency_key = f"{rng.getrandbits(128):032x}" if (clock.now - created).days < 180 else None
+        yield (customer[0], product[0], _quantity(rng, product[5]), _address(rng, customer),
+               'Cash' if rng.random() < 0.6 else 'Transfer', product[2], status, clock.text(created), idempotency_key)
+
+
+def _text(rng, language, templates_en, templates_am, customers, products):
+    template = rng.choice(templates_am if language == 'am' else templates_en)
+    return template.format(order=rng.randint(1, 100000), product=rng.choice(products)[0],
+                           region=rng.choice(customers)[5])
+
+
+def _tickets(rng, clock, count, customers, customer_cum):
+    tickets = []
+    topic_ids = iter(rng.sample(range(2, 10_000_000), count))
+    for _ in range(count):
+        customer = rng.choices(customers, cum_weights=customer_cum)[0]
+        category = rng.choices(('Inquiry', 'Complaint', 'Support'), (55, 20, 25))[0]
+        created = clock.created_at()
+        recent = (clock.now - created).days < 7
+        status = rng.choices(('Pending', 'Open', 'closed'), (40, 40, 20) if recent else (5, 10, 85))[0]
+        topic_id = next(topic_ids) if rng.random() < 0.6 else None
+        attachment_path = f"uploads/tickets/{rng.getrandbits(40):010x}.jpg" if rng.random() < 0.1 else None
+        idempotency_key = f"{rng.getrandbits(128):032x}" if (clock.now - created).days < 180 else None
+        tickets.append((customer[0], category, f"New {category}", status, created, attachment_path, topic_id,
+                        idempotency_key, customer[12]))
+    return tickets
+
+
+def _messages(rng, clock, count, tickets, customers, products):
+    """The first message of every ticket, then the rest spread over a minority of long threads."""
+    threads = [[ticket_id, ticket[4], ticket[8], 'user'] for ticket_id, ticket in enumerate(tickets, 1)]
+    remaining = max(count - len(tickets), 0)
+    busy = rng.sample(threads, max(len(threads) // 5, 1)) if threads else []
+    busy_cum = zipf_weights(len(busy), 0.8)
+    extra = [rng.choices(busy, cum_weights=busy_cum)[0] for _ in range(remaining)] if busy else []
+    for thread in threads + extra:
+        ticket_id, created, language, sender = thread
+        if sender == 'user':
+            message = _text(rng, language, MESSAGES_EN, MESSAGES_AM, customers, products)
+        else:
+            message = rng.choice(REPLIES_AM if language == 'am' else REPLIES_EN)
+        thread[1] = clock.created_at(after=created)
+        thread[3] = 'admin' if sender == 'user' or rng.random() < 0.2 else 'user'
+        yield ticket_id, sender, message, clock.text(thread[1])
+
+
+def _feedback(rng, clock, count, customers, customer_cum):
+    for i in range(count):
+        customer = rng.choices(customers, cum_weights=customer_cum)[0]
+        rating = rng.choices((1, 2, 3, 4, 5), (3, 4, 10, 30, 53))[0]
+        comment = rng.choice(FEEDBACK_AM if customer[12] == 'am' else FEEDBACK_EN)
+        photo_path = f"uploads/feedback/{i + 1}.jpg" if rng.random() < 0.2 else None
+        status = rng.choices(('Pending', 'Approved', 'Rejected'), (20, 75, 5))[0]
+        yield customer[0], rating, comment, photo_path, status, clock.text(clock.created_at())
+
+
+def _persistence(rng, customers):
+    for customer in customers:
+        user_data = {'lang': customer[12], 'order_token': f"{rng.getrandbits(128):032x}"} if rng.random() < 0.3 \
+            else {'lang': customer[12]}
+        yield 'user_data', str(customer[0]), json.dumps(user_data), 1
+        if rng.random() < 0.1:
+            name = rng.choice(('registration', 'order', 'support', 'feedback'))
+            yield f"conversation:{name}", json.dumps([customer[0], customer[0]]), json.dumps(rng.randint(0, 6)), 1
+
+
+def generate(path, customers, products, orders, tickets, messages, feedback, admins=5, broadcasts=20, seed=0):
+    """Creates the schema at `path` and fills it; returns {table: row count}."""
+    from ET_HONEY import database
+
+    rng = random.Random(seed)
+    clock = _Clock(rng, datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0))  # CURRENT_TIMESTAMP is UTC
+    db_path = database.DB_PATH
+    database.DB_PATH = path
+    try:
+        database.init_db()
+        database.init_db()  # the column migrations only apply once the tables exist
+    finally:
+        database.DB_PATH = db_path
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    customer_rows = _customers(rng, clock, customers, admins)
+    _insert(conn, 'customers', ('telegram_id', 'username', 'full_name', 'phone', 'email', 'region', 'customer_type',
+                                'status', 'is_admin', 'notify_orders', 'notify_products', 'notify_alerts',
+                                'language', 'created_at'), customer_rows)
+    product_rows = _products(rng, clock, products)
+    _insert(conn, 'products', ('name', 'description', 'price', 'stock', 'image_path', 'available_quantities',
+                               'category', 'created_at'), product_rows)
+
+    # The same few customers order and open tickets again and again; popular products dominate sales
+    buyers = rng.sample(customer_rows, len(customer_rows))
+    buyer_cum = zipf_weights(len(buyers), 0.9)
+    product_cum = zipf_weights(len(product_rows), 1.2)
+    _insert(conn, 'orders', ('user_id', 'product_name', 'quantity', 'delivery_address', 'payment_type', 'price',
+                             'status', 'created_at', 'idempotency_key'),
+            _orders(rng, clock, orders, buyers, product_rows, buyer_cum, product_cum))
+    ticket_rows = _tickets(rng, clock, tickets, buyers, buyer_cum)
+    _insert(conn, 'tickets', ('user_id', 'category', 'subject', 'status', 'created_at', 'updated_at',
+                              'attachment_path', 'topic_id', 'idempotency_key'),
+            ((t[0], t[1], t[2], t[3], clock.text(t[4]), clock.text(t[4]), t[5], t[6], t[7]) for t in ticket_rows))
+    _insert(conn, 'messages', ('ticket_id', 'sender_type', 'message', 'created_at'),
+            _messages(rng, clock, messages, ticket_rows, customer_rows, product_rows))
+    _insert(conn, 'feedback', ('user_id', 'rating', 'comment', 'photo_path', 'status', 'created_at'),
+            _feedback(rng, clock, feedback, buyers, buyer_cum))
+
+    _insert(conn, 'bot_persistence', ('kind', 'key', 'data', 'seq'), _persistence(rng, customer_rows))
+    conn.execute("INSERT INTO bot_persistence_batches (seq, origin) VALUES (1, NULL)")
+    admin_id = customer_rows[0][0] if customer_rows else 0
+    _insert(conn, 'broadcasts', ('created_by', 'variants', 'default_lang', 'media', 'notification_type',
+                                 'scheduled_at', 'status', 'total_recipients', 'sent_count'),
+            ((admin_id, json.dumps({lang: text.format(product=rng.choice(product_rows)[0])
+                                    for lang, text in BROADCAST_TEXT.items()}),
+              'en', json.dumps([]), rng.choice(('notify_alerts', 'notify_products')),
+              clock.text(clock.created_at()), rng.choices(('Sent', 'Scheduled', 'Cancelled'), (80, 15, 5))[0],
+              customers, 0) for _ in range(broadcasts)))
+    _insert(conn, 'seen_updates', ('slot', 'update_id'),
+            ((update_id % 10000, update_id) for update_id in range(800_000_000, 800_010_000)))
+    # Caches start empty, so the change_log entries the triggers wrote for the bulk load serve no one
+    conn.execute("DELETE FROM change_log")
+    conn.commit()
+
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ('customers', 'products', 'orders', 'tickets', 'messages', 'feedback',
+                            'bot_persistence', 'broadcasts')}
+    conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="database file to create (must not exist)")
+    parser.add_argument("--rows", type=int, default=100000, help="orders and messages; other tables scale with it")
+    parser.add_argument("--seed", type=int, default=0)
+    for table in ('customers', 'products', 'orders', 'tickets', 'messages', 'feedback'):
+        parser.add_argument(f"--{table}", type=int, help=f"override the number of {table}")
+    args = parser.parse_args()
+    if os.path.exists(args.output):
+        parser.error(f"{args.output} already exists")
+
+    sizes = rows_for(args.rows)
+    sizes.update({table: getattr(args, table) for table in sizes if getattr(args, table) is not None})
+    started = time.perf_counter()
+    counts = generate(args.output, seed=args.seed, **sizes)
+    print(f"{args.output} in {time.perf_counter() - started:.1f}s "
+          f"({os.path.getsize(args.output) / 1e6:.0f} MB): {counts}")
+
+
+if __name__ == "__main__":
+    main()
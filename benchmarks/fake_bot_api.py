@@ -0,0 +1,273 @@
+"""Local stand-in for the Telegram Bot API, for offline end-to-end benchmarks.
+
+Implements the methods the bot calls (sendMessage, sendPhoto, sendDocument,
+editMessageText, setWebhook, getFile and file downloads, plus getMe and
+the methods that only return True) with a configurable response delay.
+It can also reject requests with 429 and retry_after, the way Telegram
+throttles, either at random (--error-rate) or by enforcing limits:
+messages per chat (private chats and groups separately) and messages per
+second overall. --telegram-limits applies Telegram's documented ones: about
+1 message per second per chat, 20 per minute per group and 30 per second
+in total.
+
+GET /stats returns calls per method, 429s sent, messages delivered and
+the TCP connections seen; POST /stats/reset clears them.
+
+Run it and point the bot at it:
+    python benchmarks/fake_bot_api.py --port 8081 --latency-ms 50 --telegram-limits
+    BOT_API_BASE_URL=http://127.0.0.1:8081/bot BOT_API_BASE_FILE_URL=http://127.0.0.1:8081/file/bot \
+        uvicorn ET_HONEY.bot:app --port 10000
+
+Benchmarks start it in a separate process with start_server().
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import random
+import socket
+import time
+from collections import Counter, defaultdict, deque
+from urllib.parse import parse_qs
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake Bot API", "username": "fake_bot"}
+MESSAGE_METHODS = {"sendMessage", "sendPhoto", "sendDocument", "sendMediaGroup", "copyMessage", "forwardMessage"}
+EDIT_METHODS = {"editMessageText", "editMessageCaption", "editMessageReplyMarkup"}
+TRUE_METHODS = {
+    "setWebhook", "deleteWebhook", "answerCallbackQuery", "deleteMessage", "setMyCommands", "setMyDescription",
+    "setMyShortDescription", "sendChatAction", "closeForumTopic", "reopenForumTopic", "logOut", "close",
+}
+TELEGRAM_LIMITS = {'private_limit': (1, 1.0), 'group_limit': (20, 60.0), 'global_limit': (30, 1.0)}
+
+
+class _Window:
+    """Sliding-window limit: at most `count` events per `seconds`."""
+
+    def __init__(self, count, seconds):
+        self.count = count
+        self.seconds = seconds
+        self.events = deque()
+
+    def retry_after(self, now):
+        """Seconds until one more event is allowed (0 if it is allowed now); doesn't record anything."""
+        while self.events and now - self.events[0] >= self.seconds:
+            self.events.popleft()
+        if len(self.events) < self.count:
+            return 0
+        return self.seconds - (now - self.events[0])
+
+    def record(self, now):
+        self.events.append(now)
+
+
+def _parse_multipart(body, content_type):
+    """Form fields of a multipart body (uploaded file contents are skipped)."""
+    boundary = content_type.split("boundary=", 1)[1].strip('"').encode()
+    fields = {}
+    for part in body.split(b"--" + boundary):
+        head, _, value = part.partition(b"\r\n\r\n")
+        if b'name="' not in head or b"filename=" in head:
+            continue
+        name = head.split(b'name="', 1)[1].split(b'"', 1)[0].decode()
+        fields[name] = value.rstrip(b"\r\n").decode(errors="replace")
+    return fields
+
+
+async def _parameters(request):
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    if not body:
+        return {}
+    if content_type.startswith("multipart/form-data"):
+        return _parse_multipart(body, content_type)
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+
+def create_app(latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1,
+               private_limit=None, group_limit=None, global_limit=None):
+    """Fake Bot API app.
+
+    latency/jitter: response delay in seconds (plus up to `jitter` more at random).
+    error_rate: share of message sends answered with 429 and `retry_after` at random.
+    private_limit/group_limit/global_limit: (count, seconds) limits on message
+    sends per private chat, per group chat and overall; sends over a limit get
+    429 with the time until the window has room.
+    """
+    app = FastAPI()
+    stats = {'calls': Counter(), 'rate_limited': Counter(), 'delivered': 0, 'connections': set()}
+    chat_windows = {}
+    global_window = _Window(*global_limit) if global_limit else None
+    message_ids = defaultdict(int)
+
+    def throttled(chat_id, now):
+        if random.random() < error_rate:
+            return retry_after, "random"
+        # Both limits are checked before either counts the send, so a rejected send uses up neither
+        limit = group_limit if chat_id < 0 else private_limit
+        windows = []
+        if limit:
+            window = chat_windows.get(chat_id)
+            if window is None:
+                window = chat_windows[chat_id] = _Window(*limit)
+            wait = window.retry_after(now)
+            if wait:
+                return wait, "chat"
+            windows.append(window)
+        if global_window is not None:
+            wait = global_window.retry_after(now)
+            if wait:
+                return wait, "global"
+            windows.append(global_window)
+        for window in windows:
+            window.record(now)
+        return 0, None
+
+    def message(chat_id, params, method):
+        message_ids[chat_id] += 1
+        result = {"message_id": message_ids[chat_id], "date": int(time.time()), "from": BOT_USER,
+                  "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"}}
+        if method == "sendPhoto":
+            result["photo"] = [{"file_id": "photo", "file_unique_id": "photo", "width": 800, "height": 600}]
+            result["caption"] = params.get("caption", "")
+        elif method == "sendDocument":
+            result["document"] = {"file_id": "document", "file_unique_id": "document", "file_name": "file.csv"}
+        else:
+            result["text"] = params.get("text", "")
+        return result
+
+    @app.post("/bot{token}/{method}")
+    async def call(token: str, method: str, request: Request):
+        stats['connections'].add(f"{request.client.host}:{request.client.port}")
+        stats['calls'][method] += 1
+        params = await _parameters(request)
+        await asyncio.sleep(latency + random.random() * jitter if jitter else latency)
+
+        if method in MESSAGE_METHODS:
+            chat_id = int(params.get("chat_id", 0))
+            wait, reason = throttled(chat_id, time.monotonic())
+            if wait:
+                stats['rate_limited'][reason] += 1
+                seconds = max(1, math.ceil(wait))
+                return _error(429, f"Too Many Requests: retry after {seconds}", {"retry_after": seconds})
+            stats['delivered'] += 1
+            result = message(chat_id, params, method)
+        elif method in EDIT_METHODS:
+            result = message(int(params.get("chat_id", 0)), params, method)
+        elif method == "getMe":
+            result = BOT_USER
+        elif method == "getFile":
+            file_id = params.get("file_id", "file")
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_size": 1024, "file_path": f"files/{file_id}.jpg"}
+        elif method == "createForumTopic":
+            result = {"message_thread_id": random.randint(2, 1 << 30), "name": params.get("name", ""), "icon_color": 7322096}
+        elif method in TRUE_METHODS:
+            result = True
+        else:
+            return _error(404, "Not Found: method not found")
+        return Response(json.dumps({"ok": True, "result": result}), media_type="application/json")
+
+    @app.get("/file/bot{token}/{path:path}")
+    async def download(token: str, path: str):
+        await asyncio.sleep(latency)
+        return Response(b"\xff\xd8\xff\xe0" + b"\0" * 1020, media_type="application/octet-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return {'calls': dict(stats['calls']), 'rate_limited': dict(stats['rate_limited']),
+                'delivered': stats['delivered'], 'connections': len(stats['connections'])}
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        stats['calls'].clear()
+        stats['rate_limited'].clear()
+        stats['delivered'] = 0
+        stats['connections'].clear()
+        chat_windows.clear()
+        if global_window is not None:
+            global_window.events.clear()
+        return {"ok": True}
+
+    return app
+
+
+def _error(code, description, parameters=None):
+    body = {"ok": False, "error_code": code, "description": description}
+    if parameters:
+        body["parameters"] = parameters
+    return Response(json.dumps(body), status_code=code, media_type="application/json")
+
+
+def _serve(sock, options):
+    uvicorn.Server(uvicorn.Config(create_app(**options), log_level="warning", access_log=False)).run(sockets=[sock])
+
+
+def start_server(**options):
+    """Runs the fake server in its own process (so it doesn't compete with the client for the GIL).
+
+    Returns (process, base URL for Bot(base_url=...), base URL for /stats).
+    """
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    process = multiprocessing.get_context("spawn").Process(target=_serve, args=(sock, options), daemon=True)
+    process.start()
+    port = sock.getsockname()[1]
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if not process.is_alive() or time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError(f"fake Bot API server did not start (exit code {process.exitcode})")
+            time.sleep(0.05)
+    root = f"http://127.0.0.1:{port}"
+    return process, f"{root}/bot", root
+
+
+def server_stats(root, reset=True):
+    """The server's /stats, cleared afterwards unless reset=False."""
+    import httpx
+    stats = httpx.get(f"{root}/stats").json()
+    if reset:
+        httpx.post(f"{root}/stats/reset")
+    return stats
+
+
+def limit(value):
+    """Parses "COUNT/SECONDS", e.g. "20/60"."""
+    count, seconds = value.split("/")
+    return int(count), float(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0, help="share of sends rejected with 429 at random")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after of random 429s, in seconds")
+    parser.add_argument("--private-limit", type=limit, help="sends per private chat, COUNT/SECONDS")
+    parser.add_argument("--group-limit", type=limit, help="sends per group chat, COUNT/SECONDS")
+    parser.add_argument("--global-limit", type=limit, help="sends overall, COUNT/SECONDS")
+    parser.add_argument("--telegram-limits", action="store_true", help="1/1 per chat, 20/60 per group, 30/1 overall")
+    args = parser.parse_args()
+
+    options = dict(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, error_rate=args.error_rate,
+                   retry_after=args.retry_after, private_limit=args.private_limit, group_limit=args.group_limit,
+                   global_limit=args.global_limit)
+    if args.telegram_limits:
+        options.update({name: options[name] or value for name, value in TELEGRAM_LIMITS.items()})
+    print(f"Fake Bot API on http://{args.host}:{args.port}/bot<token>/<method> {options}")
+    uvicorn.run(create_app(**options), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
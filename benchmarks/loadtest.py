@@ -0,0 +1,353 @@
+"""Offline load test: Telegram updates through the real /webhook endpoint.
+
+Starts the FastAPI app in-process (its lifespan builds the full Application
+with persistence, the update worker pool and all handlers) and posts Update
+JSON to /webhook through an ASGI client, so nothing listens on a port. The
+Bot API is replaced by a stub that answers every method locally, after an
+optional delay, and counts the calls.
+
+Simulated users walk through the registration, browse, order and support
+flows. Each user sends its next update only after the bot has finished
+processing the previous one, the way a person waits for the reply. The
+report shows updates per second, latency percentiles from POST to handler
+completion (overall and per flow), and SQL statements and Bot API calls per
+update.
+
+Usage:
+    python benchmarks/loadtest.py [--users 50] [--rounds 2] [--flows register,browse,order,support]
+                                  [--api-latency-ms 20] [--record updates.jsonl]
+    python benchmarks/loadtest.py --replay updates.jsonl [--concurrency 20]
+
+A replay seeds the database the same way as a flow run, so pass the --users,
+--rounds and --flows that recorded the file. Set UPDATE_CONCURRENCY and the
+other bot settings through the environment as usual.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="loadtest_"), "loadtest.db"))
+os.environ.setdefault("BOT_TOKEN", "123456:loadtest")
+os.environ.setdefault("WEBHOOK_SECRET", "loadtest")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# Empty values keep settings from ET_HONEY/.env (load_dotenv doesn't override) out of the run
+for name in ("WEBHOOK_URL", "ADMIN_ID", "SUPPORT_GROUP_ID"):
+    os.environ.setdefault(name, "")
+
+import httpx
+from telegram.request import BaseRequest
+
+from ET_HONEY import bot as bot_module
+from ET_HONEY import database, query_log
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "ET HONEY", "username": "et_honey_bot"}
+PRODUCTS = (
+    ("Wild Forest Honey", "Raw honey from the Sheka forest", 12.5, "Forest", "500g, 1kg"),
+    ("White Honey", "Tigray white honey", 18.0, "Premium", "250g, 500g, 1kg"),
+    ("ጥሬ ማር", "ከጎጃም የተሰበሰበ ጥሬ ማር", 9.75, "Raw", "1kg, 2kg"),
+    ("Honey Wine Kit", "Everything for tej at home", 25.0, "Kits", None),
+)
+FLOWS = ("register", "browse", "order", "support")
+
+
+class BotAPIStub:
+    """Answers Bot API methods locally and counts them, optionally after a fixed delay."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    def request(self, kind='interactive'):
+        return _StubRequest(self)
+
+    async def answer(self, method, parameters):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "getMe":
+            return BOT_USER
+        if method.startswith(("send", "edit", "copy", "forward")):
+            self._message_id += 1
+            chat_id = int(parameters.get("chat_id") or 1)
+            return {"message_id": self._message_id, "date": int(time.time()), "from": BOT_USER,
+                    "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}, "text": "ok"}
+        if method == "getFile":
+            return {"file_id": parameters.get("file_id", "file"), "file_unique_id": "file", "file_path": "photos/file.jpg"}
+        if method == "createForumTopic":
+            return {"message_thread_id": self._message_id + 1, "name": parameters.get("name", "topic"), "icon_color": 7322096}
+        return True
+
+
+class _StubRequest(BaseRequest):
+    def __init__(self, stub):
+        self.stub = stub
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        parameters = request_data.parameters if request_data is not None else {}
+        result = await self.stub.answer(url.rsplit('/', 1)[-1], parameters)
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class CompletionTracker:
+    """Stands in for the worker pool's tracer hook to learn when each update has been processed."""
+
+    def __init__(self, inner=None):
+        self.inner = inner
+        self.waiting = {}
+
+    def expect(self, update_id):
+        future = self.waiting[update_id] = asyncio.get_running_loop().create_future()
+        return future
+
+    async def run(self, update, coroutine):
+        try:
+            if self.inner is not None:
+                return await self.inner.run(update, coroutine)
+            return await coroutine
+        finally:
+            future = self.waiting.pop(update.update_id, None)
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    @property
+    def stats(self):
+        return self.inner.stats if self.inner is not None else {}
+
+
+class UpdateFactory:
+    """Builds Telegram Update JSON for text messages, commands and inline button presses."""
+
+    def __init__(self):
+        self.update_id = 1000
+        self.message_id = 1000
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}", "username": f"load_{user_id}",
+                "language_code": "en"}
+
+    def _message(self, user_id, text):
+        self.message_id += 1
+        message = {"message_id": self.message_id, "date": int(time.time()), "from": self._user(user_id),
+                   "chat": {"id": user_id, "type": "private"}, "text": text}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return message
+
+    def make(self, user_id, kind, value):
+        self.update_id += 1
+        if kind == "callback":
+            self.message_id += 1
+            bot_message = {"message_id": self.message_id, "date": int(time.time()), "from": BOT_USER,
+                           "chat": {"id": user_id, "type": "private"}, "text": "menu"}
+            return {"update_id": self.update_id, "callback_query": {
+                "id": str(self.update_id), "from": self._user(user_id), "chat_instance": str(user_id),
+                "data": value, "message": bot_message}}
+        return {"update_id": self.update_id, "message": self._message(user_id, value)}
+
+
+def flow_steps(flow, user_id, product_ids):
+    """[(kind, value)] one simulated user sends for a flow."""
+    product_id = product_ids[user_id % len(product_ids)]
+    if flow == "register":
+        return [
+            ("callback", "lang_en"),
+            ("text", "/register"),
+            ("text", f"Abebe Kebede {user_id}"),
+            ("text", f"0911{user_id % 1000000:06d}"),
+            ("text", f"load{user_id}@example.com"),
+            ("text", "Addis Ababa"),
+            ("callback", "New"),
+            ("callback", "confirm"),
+        ]
+    if flow == "browse":
+        return [
+            ("text", "/start"),
+            ("callback", "browse_catalog"),
+            ("callback", "cat:all"),
+            ("callback", f"view_product:{product_id}"),
+            ("callback", "sort:price:asc"),
+            ("callback", f"cat:{PRODUCTS[0][3]}"),
+        ]
+    if flow == "order":
+        product = PRODUCTS[product_ids.index(product_id)]
+        quantity = ("callback", f"qty:{product[4].split(',')[0].strip()}") if product[4] else ("text", "2")
+        return [
+            ("callback", f"view_product:{product_id}"),
+            ("callback", f"order_product:{product_id}"),
+            quantity,
+            ("text", "Bole, Addis Ababa, house 12"),
+            ("callback", "Cash"),
+            ("callback", "confirm_order"),
+        ]
+    if flow == "support":
+        return [
+            ("text", "/support"),
+            ("text", "When will my order arrive? ትዕዛዜ መቼ ይደርሳል?"),
+            ("callback", "skip_attachment"),
+            ("callback", "confirm_ticket"),
+        ]
+    raise ValueError(f"Unknown flow {flow}")
+
+
+def seed(users, admins):
+    """Products, admins and already registered customers for the browse/order/support flows."""
+    database.init_db()  # importing bot.py created the tables; the column migrations need a second pass
+    product_ids = [
+        database.add_product(name, description, price, 1000, available_quantities=quantities, category=category)
+        for name, description, price, category, quantities in PRODUCTS
+    ]
+    for telegram_id in list(range(1, admins + 1)) + list(users):
+        database.add_customer({
+            'telegram_id': telegram_id, 'username': f"load_{telegram_id}", 'full_name': f"Load {telegram_id}",
+            'phone': "0911000000", 'email': None, 'region': "Addis Ababa", 'customer_type': "New",
+        })
+        if telegram_id <= admins:
+            database.set_admin_status(telegram_id, 1)
+    return product_ids
+
+
+async def post(client, tracker, update, latencies):
+    done = tracker.expect(update["update_id"])
+    started = time.perf_counter()
+    response = await client.post("/webhook", content=json.dumps(update),
+                                 headers={"X-Telegram-Bot-Api-Secret-Token": os.environ["WEBHOOK_SECRET"]})
+    if response.status_code != 200:
+        tracker.waiting.pop(update["update_id"], None)
+        return response.status_code
+    await done
+    latencies.append(time.perf_counter() - started)
+    return 200
+
+
+async def simulated_user(client, tracker, factory, flow, user_id, product_ids, think, results, recorded):
+    for kind, value in flow_steps(flow, user_id, product_ids):
+        update = factory.make(user_id, kind, value)
+        if recorded is not None:
+            recorded.append(update)
+        status = await post(client, tracker, update, results[flow])
+        if status != 200:
+            results['rejected'].append(status)
+        if think:
+            await asyncio.sleep(think)
+
+
+def percentiles(values):
+    if not values:
+        return "-"
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(len(values) * p))] * 1000
+    return f"p50 {pick(0.5):7.1f}  p95 {pick(0.95):7.1f}  p99 {pick(0.99):7.1f}  max {values[-1] * 1000:7.1f} ms"
+
+
+async def run(args):
+    stub = BotAPIStub(args.api_latency_ms / 1000)
+    # The lifespan builds its Bot API clients through this; every one gets the stub instead
+    bot_module.build_request = stub.request
+
+    flows = args.flows.split(",")
+    replay = None
+    if args.replay:
+        with open(args.replay, encoding="utf-8") as f:
+            replay = [json.loads(line) for line in f if line.strip()]
+    # One fresh user per flow run; everyone but the registering users is already a customer
+    sessions = [[(flow, 100000 + (round_ * len(flows) + index) * args.users + i) for index, flow in enumerate(flows)
+                 for i in range(args.users)] for round_ in range(args.rounds)]
+    registered = [user_id for round_ in sessions for flow, user_id in round_ if flow != "register"]
+    product_ids = seed(registered, args.admins)
+
+    results = defaultdict(list)
+    recorded = [] if args.record else None
+    async with bot_module.lifespan(bot_module.app):
+        pool = bot_module.update_pool
+        tracker = pool.tracer = CompletionTracker(pool.tracer)
+        transport = httpx.ASGITransport(app=bot_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            statements_before = sum(row[1] for row in query_log.statement_stats())
+            calls_before = sum(stub.calls.values())
+            started = time.perf_counter()
+            if replay is not None:
+                limit = asyncio.Semaphore(args.concurrency)
+
+                async def replay_one(update):
+                    async with limit:
+                        status = await post(client, tracker, update, results['replay'])
+                        if status != 200:
+                            results['rejected'].append(status)
+
+                await asyncio.gather(*(replay_one(update) for update in replay))
+            else:
+                factory = UpdateFactory()
+                for round_ in sessions:
+                    await asyncio.gather(*(
+                        simulated_user(client, tracker, factory, flow, user_id, product_ids,
+                                       args.think_ms / 1000, results, recorded)
+                        for flow, user_id in round_
+                    ))
+            elapsed = time.perf_counter() - started
+            statements = sum(row[1] for row in query_log.statement_stats()) - statements_before
+            api_calls = sum(stub.calls.values()) - calls_before
+        queue_stats = pool.metrics()
+
+    if recorded is not None:
+        with open(args.record, "w", encoding="utf-8") as f:
+            for update in recorded:
+                f.write(json.dumps(update, ensure_ascii=False) + "\n")
+
+    processed = sum(len(results[name]) for name in results if name != 'rejected')
+    print(f"{processed} updates in {elapsed:.2f}s: {processed / elapsed:.0f} updates/s "
+          f"(Bot API latency {args.api_latency_ms:g} ms, UPDATE_CONCURRENCY={os.getenv('UPDATE_CONCURRENCY', 1)})")
+    print(f"rejected by /webhook: {len(results['rejected'])}, failed in handlers: {queue_stats['failed']}")
+    print(f"{'all':>10}: {percentiles([v for name in results if name != 'rejected' for v in results[name]])}")
+    for name in [name for name in results if name != 'rejected']:
+        print(f"{name:>10}: {percentiles(results[name])}  ({len(results[name])} updates)")
+    if processed:
+        print(f"SQL statements per update: {statements / processed:.1f}")
+        print(f"Bot API calls per update: {api_calls / processed:.2f}  "
+              + ", ".join(f"{method} {count}" for method, count in stub.calls.most_common(8)))
+    conn = sqlite3.connect(database.DB_PATH)
+    created = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("customers", "orders", "tickets")}
+    conn.close()
+    print("rows in the database: " + ", ".join(f"{table} {count}" for table, count in created.items()))
+    print("top statements by total time:")
+    for statement, calls, total, worst, slow in query_log.statement_stats(5):
+        print(f"  {calls:6} calls {total * 1000:8.1f} ms  {statement[:90]}")
+    if args.record:
+        print(f"recorded {len(recorded)} updates to {args.record}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50, help="simulated users per flow and round")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--flows", default=",".join(FLOWS))
+    parser.add_argument("--admins", type=int, default=3, help="admins notified of new orders")
+    parser.add_argument("--api-latency-ms", type=float, default=20, help="delay of every stubbed Bot API call")
+    parser.add_argument("--think-ms", type=float, default=0, help="pause between a user's updates")
+    parser.add_argument("--record", help="write the generated updates to this JSONL file")
+    parser.add_argument("--replay", help="post the updates in this JSONL file instead of running flows")
+    parser.add_argument("--concurrency", type=int, default=20, help="updates in flight when replaying")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()